@@ -0,0 +1,82 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Time queue conversion and bulk removal of an assignment's queue.
+
+Run as ``python benchmarks/queue_convert.py [entries] [assignments]``.
+"""
+import asyncio
+import random
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from edubot.cogs.queue import MultiReviewQueue, ReviewQueue
+
+
+def make_multi(uids, assignments):
+    """Build a MultiReviewQueue where every student is in two queues."""
+    qdata = {aid: [] for aid in assignments}
+    for uid in uids:
+        for aid in random.sample(assignments, 2):
+            qdata[aid].append(uid)
+    multi = MultiReviewQueue((0, 0), "guild", "chan")
+    multi.fromfile(dict(assignments=list(assignments), queue=qdata))
+    return multi
+
+
+def quadratic_merge(multi):
+    """The list-membership merge that convert used before."""
+    queue = []
+    for aid in multi.assignments:
+        queue += [uid for uid in multi.queue[aid] if uid not in queue]
+    return queue
+
+
+def timed(func, *args):
+    """Return the wall clock time in ms of a single call of func."""
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1e3
+
+
+if __name__ == "__main__":
+    nentries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nassignments = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    random.seed(1)
+    uids = random.sample(range(2 ** 60, 2 ** 60 + 10 ** 9), nentries // 2)
+    assignments = [str(i + 1) for i in range(nassignments)]
+    ctx = MagicMock(send=AsyncMock())
+
+    multi = make_multi(uids, assignments)
+    print(f"{nentries} entries over {nassignments} assignments")
+    print(f"quadratic merge:        {timed(quadratic_merge, multi):8.2f} ms")
+
+    review = ReviewQueue((0, 0), "guild", "chan")
+    review.updateIndicator = AsyncMock()
+    convert = review.convert(ctx, multi, None)
+    print(f"MultiReview -> Review:  {timed(asyncio.run, convert):8.2f} ms")
+
+    back = MultiReviewQueue((0, 0), "guild", "chan")
+    back.updateIndicator = AsyncMock()
+    review.assignments = []
+    convert = back.convert(ctx, review, "1")
+    print(f"Review -> MultiReview:  {timed(asyncio.run, convert):8.2f} ms")
+
+    multi.updateIndicator = AsyncMock()
+    stop = multi.stopReviewing(ctx, assignments[0])
+    print(f"stopReviewing:          {timed(asyncio.run, stop):8.2f} ms")
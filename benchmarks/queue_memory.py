@@ -0,0 +1,95 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Compare the memory use of the old and new queue representations.
+
+Run as ``python benchmarks/queue_memory.py [students] [assignments]``.
+"""
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import List
+
+from edubot.cogs.queue import MultiReviewQueue, ReviewQueue
+
+
+@dataclass
+class OldStudent:
+    """Student record as it was stored before the move to __slots__."""
+
+    id: int
+    aid: List[str] = field(default_factory=list)
+
+
+def build_old(uids, membership):
+    """Lists of ints, and a dataclass with an aid list per student."""
+    review = list(uids)
+    queue = {aid: list(q) for aid, q in membership.items()}
+    students = {}
+    for aid, q in membership.items():
+        for uid in q:
+            if uid not in students:
+                students[uid] = OldStudent(uid)
+            students[uid].aid.append(aid)
+    for student in students.values():
+        # Attributes that were added ad hoc in takenext
+        student.oldVC = None
+        student.check = None
+        student.qid = (0, 0)
+    return review, queue, students
+
+
+def build_new(uids, membership):
+    """Arrays of uids, and slotted student records with a bitmask."""
+    review = ReviewQueue((0, 0), "guild", "chan")
+    review.fromfile(uids)
+    multi = MultiReviewQueue((0, 0), "guild", "chan")
+    multi.fromfile(dict(assignments=list(membership), queue=membership))
+    return review, multi
+
+
+def measure(builder, *args):
+    """Return the memory in bytes retained by the result of builder."""
+    tracemalloc.start()
+    result = builder(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == "__main__":
+    nstudents = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nassignments = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    random.seed(1)
+    # Realistic Discord snowflakes are 64-bit integers
+    uids = random.sample(range(2 ** 60, 2 ** 60 + 10 ** 9), nstudents)
+    assignments = [str(i + 1) for i in range(nassignments)]
+    # Every student waits in the queues of two assignments
+    membership = {aid: [] for aid in assignments}
+    for uid in uids:
+        for aid in random.sample(assignments, 2):
+            membership[aid].append(uid)
+
+    # The uid objects themselves are created outside of the traced region
+    old = measure(build_old, uids, membership)
+    new = measure(build_new, uids, membership)
+    print(f"{nstudents} students, {nassignments} assignments")
+    print(f"old representation: {old / 1024:8.1f} KiB")
+    print(f"new representation: {new / 1024:8.1f} KiB")
+    print(f"reduction:          {100 * (1 - new / old):8.1f} %")
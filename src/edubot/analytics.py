@@ -0,0 +1,203 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Columnar store of the votes of finished quizzes."""
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Column names and types of the vote segments
+COLUMNS = (('student', np.uint64), ('quiz', np.int32),
+           ('option', np.int16), ('correct', np.int8))
+
+
+class QuizAnalytics:
+    ''' Store of the votes of all finished quizzes, for statistics over a
+        whole semester.
+
+        Each finished quiz is appended as a segment of NumPy arrays, with
+        one row per vote: (student, quiz, option, correct). correct is 1
+        for the correct option, 0 for other options, and -1 when the quiz
+        has no correct answer. Quiz metadata is kept in a json lines file.
+        Small segments are merged once there are many of them. Statistics
+        are computed on the concatenated columns, without creating Python
+        objects per vote.
+    '''
+    # Merge the segments when there are this many
+    maxsegments = 32
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        self.segmentdir = datadir.joinpath('segments')
+        self.segmentdir.mkdir(parents=True, exist_ok=True)
+        self.metafile = datadir.joinpath('quizzes.jsonl')
+        self.lock = threading.Lock()
+        self.meta = None
+        self.columns = None
+
+    def loadmeta(self):
+        ''' Load the metadata of all recorded quizzes. '''
+        if self.meta is None:
+            self.meta = []
+            if self.metafile.exists():
+                with open(self.metafile, 'r') as fin:
+                    self.meta = [json.loads(line) for line in fin if line.strip()]
+        return self.meta
+
+    def segments(self):
+        ''' Return the segment files, leaving out segments whose quizzes are
+            also in a merged segment. '''
+        ranges = []
+        for fname in self.segmentdir.glob('q*.npz'):
+            first, last = (int(i) for i in fname.stem[1:].split('-'))
+            ranges.append((first, -last, fname))
+        files, covered = [], -1
+        for first, last, fname in sorted(ranges):
+            if -last > covered:
+                files.append(fname)
+                covered = -last
+        return files
+
+    def load(self):
+        ''' Return the columns of all recorded votes, as a dict of arrays. '''
+        with self.lock:
+            if self.columns is None:
+                parts = {name: [np.zeros(0, dtype)] for name, dtype in COLUMNS}
+                for fname in self.segments():
+                    with np.load(fname) as segment:
+                        for name, _ in COLUMNS:
+                            parts[name].append(segment[name])
+                self.columns = {name: np.concatenate(parts[name]).astype(dtype)
+                                for name, dtype in COLUMNS}
+            return self.columns
+
+    def record(self, quiz, guild):
+        ''' Append the votes of finished quiz in guild to the store.
+            Returns: the id of the quiz in the store. '''
+        options = sorted(quiz.votes)
+        counts = [len(quiz.votes[option]) for option in options]
+        student = np.fromiter((uid for option in options
+                               for uid in quiz.votes[option]),
+                              np.uint64, sum(counts))
+        option = np.repeat(np.array(options, np.int16), counts)
+        if quiz.correct_answer:
+            correct = (option == quiz.correct_answer).astype(np.int8)
+        else:
+            correct = np.full(len(option), -1, np.int8)
+
+        with self.lock:
+            meta = self.loadmeta()
+            qid = len(meta)
+            entry = dict(id=qid, name=quiz.name, messageid=quiz.message_id,
+                         channelid=quiz.channel_id, guild=guild,
+                         correct=quiz.correct_answer, options=len(options),
+                         finished=time.time())
+            segment = dict(student=student, quiz=np.full(len(student), qid, np.int32),
+                           option=option, correct=correct)
+            self.write(f'q{qid:06d}-{qid:06d}', segment)
+            with open(self.metafile, 'a') as fout:
+                fout.write(json.dumps(entry) + '\n')
+            meta.append(entry)
+            if self.columns is not None:
+                self.columns = {name: np.concatenate((self.columns[name], segment[name]))
+                                for name, _ in COLUMNS}
+        if len(self.segments()) > self.maxsegments:
+            self.compact()
+        return qid
+
+    def write(self, name, segment):
+        ''' Write a segment atomically. '''
+        tmpname = self.segmentdir.joinpath(f'tmp-{name}.npz')
+        np.savez(tmpname, **segment)
+        os.replace(tmpname, self.segmentdir.joinpath(f'{name}.npz'))
+
+    def compact(self):
+        ''' Merge all segments into a single segment. '''
+        with self.lock:
+            files = self.segments()
+            if len(files) < 2:
+                return
+            parts = {name: [] for name, _ in COLUMNS}
+            for fname in files:
+                with np.load(fname) as segment:
+                    for name, _ in COLUMNS:
+                        parts[name].append(segment[name])
+            merged = {name: np.concatenate(parts[name]) for name, _ in COLUMNS}
+            first = min(int(f.stem[1:].split('-')[0]) for f in files)
+            last = max(int(f.stem[1:].split('-')[1]) for f in files)
+            # The merged segment covers all others, so a crash before they
+            # are deleted doesn't duplicate votes
+            self.write(f'q{first:06d}-{last:06d}', merged)
+            for fname in files:
+                if fname.stem != f'q{first:06d}-{last:06d}':
+                    fname.unlink()
+
+    def studentstats(self, guild=None):
+        ''' Compute the participation and accuracy of each student, over all
+            quizzes of guild (or all quizzes).
+            Returns: a dict of arrays with per student: id, the number of
+            answered quizzes, participation, the number of answered graded
+            quizzes, the number of correct answers, and accuracy; and the
+            number of quizzes. '''
+        columns = self.load()
+        meta = self.loadmeta()
+        quizzes = np.array([q['id'] for q in meta
+                            if guild is None or q['guild'] == guild], np.int32)
+        select = np.isin(columns['quiz'], quizzes)
+        student = columns['student'][select]
+        quiz = columns['quiz'][select]
+        correct = columns['correct'][select]
+
+        # One answer per student per quiz. With multiple votes, an answer is
+        # only correct when all chosen options are correct
+        order = np.lexsort((quiz, student))
+        student, quiz, correct = student[order], quiz[order], correct[order]
+        first = np.ones(len(student), bool)
+        first[1:] = (student[1:] != student[:-1]) | (quiz[1:] != quiz[:-1])
+        starts = np.flatnonzero(first)
+        answer_student = student[starts]
+        answer_correct = np.minimum.reduceat(correct, starts) if len(starts) \
+            else correct[:0]
+
+        ids, inverse = np.unique(answer_student, return_inverse=True)
+        answered = np.bincount(inverse, minlength=len(ids))
+        graded = np.bincount(inverse, answer_correct >= 0, len(ids)).astype(int)
+        right = np.bincount(inverse, answer_correct == 1, len(ids)).astype(int)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            accuracy = np.where(graded > 0, right / graded, np.nan)
+        participation = answered / max(len(quizzes), 1)
+        return dict(student=ids, answered=answered,
+                    participation=participation, graded=graded,
+                    correct=right, accuracy=accuracy), len(quizzes)
+
+    def tocsv(self, guild=None):
+        ''' Return the per-student statistics of guild as CSV text. '''
+        stats, _ = self.studentstats(guild)
+        stats['participation'] = stats['participation'].round(3)
+        stats['accuracy'] = stats['accuracy'].round(3)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(stats.keys())
+        for row in zip(*(col.tolist() for col in stats.values())):
+            # Students without graded answers have no accuracy
+            writer.writerow(['' if value != value else value for value in row])
+        return out.getvalue()
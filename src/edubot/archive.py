@@ -0,0 +1,209 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Searchable archive of answered questions."""
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from .textindex import tokenize
+
+# Row type of the offset table: question index, segment, and byte offset
+# of the latest version of each entry
+OFFSET = np.dtype([('idx', '<u4'), ('seg', '<u4'), ('off', '<u8')])
+
+
+class QuestionArchive:
+    ''' Append-only archive of the answered questions of one queue.
+
+        Entries are json lines in numbered segment files. A changed entry
+        (e.g., amended) is appended again; the offset table, with a fixed
+        size row per entry id, always points at the latest version. Each
+        full segment gets an inverted index: the sorted postings (entry
+        ids) of all its terms, and a json dict with the position of each
+        term in the postings. The postings of the segment being written
+        are kept in memory, and rebuilt from the segment when loading.
+    '''
+    # Start a new segment when the current one is this large
+    segsize = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.offsetfile = path.joinpath('offsets.bin')
+        self.offsets = np.fromfile(self.offsetfile, OFFSET) \
+            if self.offsetfile.exists() else np.zeros(0, OFFSET)
+        # Integrity check: drop a partially written last row
+        with open(self.offsetfile, 'ab') as fout:
+            fout.truncate(len(self.offsets) * OFFSET.itemsize)
+        self.nseg = max((int(f.stem[4:]) for f in path.glob('seg-*.jsonl')),
+                        default=0)
+        # Term dicts of full segments, loaded on first use
+        self.termdicts = dict()
+        self.postings = defaultdict(list)
+        self.size = 0
+        segfile = self.segment(self.nseg)
+        if segfile.exists():
+            with open(segfile, 'rb') as fin:
+                for line in fin:
+                    if not line.endswith(b'\n'):
+                        break
+                    entry = json.loads(line)
+                    if entry['id'] < len(self.offsets):
+                        self.indexterms(entry)
+                    self.size += len(line)
+            # Cut off a partially written last entry
+            with open(segfile, 'ab') as fout:
+                fout.truncate(self.size)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def segment(self, nseg, ext='jsonl'):
+        ''' Return the file name of segment nseg. '''
+        return self.path.joinpath(f'seg-{nseg:05d}.{ext}')
+
+    @staticmethod
+    def text(entry):
+        ''' Return the question, answer and amendments of entry as one text. '''
+        return ' '.join([entry['question'], entry.get('answer') or ''] +
+                        [text for _, text in entry.get('amendments', [])])
+
+    @classmethod
+    def terms(cls, entry):
+        ''' Return the searchable terms of an archive entry. '''
+        return set(tokenize(cls.text(entry)))
+
+    def indexterms(self, entry):
+        ''' Add the terms of entry to the postings of the current segment. '''
+        for term in self.terms(entry):
+            self.postings[term].append(entry['id'])
+
+    def seal(self):
+        ''' Write the inverted index of the current segment, and start a
+            new segment. '''
+        termdict, postings, start = dict(), [], 0
+        for term in sorted(self.postings):
+            ids = sorted(set(self.postings[term]))
+            termdict[term] = (start, len(ids))
+            postings.extend(ids)
+            start += len(ids)
+        np.array(postings, '<u4').tofile(self.segment(self.nseg, 'post'))
+        with open(self.segment(self.nseg, 'terms.json'), 'w') as fout:
+            json.dump(termdict, fout)
+        self.nseg += 1
+        self.postings.clear()
+        self.size = 0
+
+    def write(self, entry):
+        ''' Append entry to the current segment, and point its row in the
+            offset table at it. '''
+        if self.size >= self.segsize:
+            self.seal()
+        line = (json.dumps(entry) + '\n').encode()
+        with open(self.segment(self.nseg), 'ab') as fout:
+            fout.write(line)
+        row = np.array([(entry['idx'], self.nseg, self.size)], OFFSET)
+        eid = entry['id']
+        with open(self.offsetfile, 'r+b') as fout:
+            fout.seek(eid * OFFSET.itemsize)
+            fout.write(row.tobytes())
+        if eid == len(self.offsets):
+            self.offsets = np.concatenate((self.offsets, row))
+        else:
+            self.offsets[eid] = row[0]
+        self.size += len(line)
+        self.indexterms(entry)
+
+    def add(self, entry):
+        ''' Add a new entry to the archive.
+            Returns: the entry with its archive id. '''
+        entry = dict(entry, id=len(self.offsets))
+        self.write(entry)
+        return entry
+
+    def update(self, entry):
+        ''' Store a changed version of an archived entry. '''
+        self.write(entry)
+
+    def get(self, eid):
+        ''' Return the latest version of entry eid. '''
+        _, nseg, off = self.offsets[eid]
+        with open(self.segment(int(nseg)), 'rb') as fin:
+            fin.seek(int(off))
+            return json.loads(fin.readline())
+
+    def entries(self):
+        ''' Iterate over the latest versions of all entries, segment by
+            segment. '''
+        for nseg in range(self.nseg + 1):
+            if not self.segment(nseg).exists():
+                continue
+            with open(self.segment(nseg), 'rb') as fin:
+                off = 0
+                for line in fin:
+                    entry = json.loads(line)
+                    eid = entry['id']
+                    if eid < len(self.offsets) and \
+                            self.offsets[eid]['seg'] == nseg and \
+                            self.offsets[eid]['off'] == off:
+                        yield entry
+                    off += len(line)
+
+    def find(self, idx):
+        ''' Return the latest archived answer to the question with index
+            idx, or None. '''
+        eids = np.flatnonzero(self.offsets['idx'] == idx)
+        return self.get(int(eids[-1])) if len(eids) else None
+
+    def termpostings(self, term):
+        ''' Return the ids of all entries with term. '''
+        parts = []
+        for nseg in range(self.nseg):
+            termdict = self.termdicts.get(nseg)
+            if termdict is None:
+                with open(self.segment(nseg, 'terms.json')) as fin:
+                    termdict = self.termdicts[nseg] = json.load(fin)
+            if term in termdict:
+                start, count = termdict[term]
+                parts.append(np.fromfile(self.segment(nseg, 'post'), '<u4',
+                                         count, offset=4 * start))
+        parts.append(np.array(self.postings.get(term, []), '<u4'))
+        # Amended entries can be in the postings of several segments
+        return np.unique(np.concatenate(parts))
+
+    def search(self, text, n=5):
+        ''' Find the archived entries that best match the terms in text.
+            Entries are ranked by the summed rarity of the matched terms,
+            and then by recency.
+            Returns: a list of up to n entries. '''
+        terms = set(tokenize(text))
+        if not terms or not len(self.offsets):
+            return []
+        ids, weights = [], []
+        for term in terms:
+            postings = self.termpostings(term)
+            if len(postings):
+                ids.append(postings)
+                weights.append(np.full(len(postings), np.log1p(len(self.offsets) / len(postings))))
+        if not ids:
+            return []
+        scores = np.bincount(np.concatenate(ids).astype(np.intp),
+                             np.concatenate(weights), len(self.offsets))
+        order = np.lexsort((-np.arange(len(scores)), -scores))[:n]
+        return [self.get(int(eid)) for eid in order if scores[eid] > 0]
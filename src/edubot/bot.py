@@ -16,6 +16,7 @@
 # If not, see <https://www.gnu.org/licenses/>.
 
 """Contains the main :py:class:`EduBot` specification."""
+import os
 import sys
 from pathlib import Path
 
@@ -23,6 +24,10 @@ import discord
 from discord.ext import commands
 
 from .cogs import Poll, QueueCog
+from .cogs.queue import Queue
+from .replica import Journal, Standby
+from .storage import Storage
+from .throttle import Throttled
 
 
 class EduBot(commands.Bot):
@@ -34,12 +39,19 @@ class EduBot(commands.Bot):
     sessions in voice channels.
     """
 
-    def __init__(self):
+    def __init__(self, standby=False):
         super().__init__(command_prefix="!", case_insensitive=True)
         self.classrooms = dict()
         self.datadir = Path.joinpath(Path.home(), ".edubot")
         if not Path.exists(self.datadir):
             Path.mkdir(self.datadir)
+        # Storage backend for queues and quizzes: json (default) or sqlite
+        self.storage = Storage.make(
+            os.getenv("EDUBOT_STORAGE", "json"), self.datadir
+        )
+        # A standby follows the journal of a primary process until it stops
+        self.journal = None
+        self.standby = Standby(self.datadir, Queue.replay) if standby else None
         self.add_cog(QueueCog(self))
         self.add_cog(Poll(self))
 
@@ -53,6 +65,41 @@ class EduBot(commands.Bot):
                 await user.create_dm()
             await user.dm_channel.send(message)
 
+    async def takeover(self):
+        """Keep a copy of the state of the primary process until it stops.
+
+        Queues are replayed from the journal of the primary as they
+        change. Quizzes are saved with each change by the storage backend,
+        so they are read again once the primary is gone.
+        """
+        await self.standby.follow()
+        self.standby.close()
+        print("Primary process stopped, taking over")
+        Queue.buildindex()
+        self.get_cog("Poll").load_quizzes()
+
+    async def start(self, *args, **kwargs):
+        """Start the journal and heartbeat for a standby, and connect."""
+        if self.journal is None:
+            self.journal = Journal(self.datadir, Queue.snapshot, self.ousted)
+            Queue.journal = self.journal
+            self.journal.start()
+        await super().start(*args, **kwargs)
+
+    def ousted(self):
+        """Stop at once when a standby took over from this process.
+
+        The state now belongs to the new primary, so nothing is saved.
+        """
+        os._exit(1)
+
+    async def close(self):
+        """Unload the cogs, which saves their state, and close storage."""
+        await super().close()
+        self.storage.close()
+        if self.journal is not None:
+            self.journal.close()
+
     async def on_ready(self):
         """Bot initialisation upon connecting to Discord."""
         print(f"{self.user} has connected to Discord!")
@@ -86,6 +133,10 @@ class EduBot(commands.Bot):
         if isinstance(error, (commands.CommandNotFound, commands.UserInputError, commands.BadArgument)):
             return await ctx.send(f'Command or argument not recognised! Did you make a typo <@{ctx.author.id}>?', delete_after=10)
 
+        elif isinstance(error, Throttled):
+            # Commands of users that send too many are dropped silently
+            return
+
         elif isinstance(error, commands.DisabledCommand):
             return await ctx.send(f'{ctx.command} has been disabled, <@{ctx.author.id}>.', delete_after=10)
 
@@ -0,0 +1,236 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Pools of pre-created breakout voice channels for TAs."""
+import asyncio
+import time
+
+import discord
+
+
+class BreakoutPool:
+    ''' Pool of breakout voice channels in one channel category.
+
+        A number of spare channels is created in advance, so that TAs can
+        get a channel without waiting for Discord. All API calls to create,
+        recycle and delete channels are made by a background task; handing
+        out and returning channels only changes local state.
+
+        A pool is saved with the queue of its owner, so that its channels
+        can be found again after a restart or takeover.
+    '''
+    # Keep pools in a static dict, by category id
+    pools = dict()
+    # Saved pools that wait for the bot to connect before their channels
+    # can be found, by owner
+    detached = dict()
+
+    @classmethod
+    def get(cls, channel):
+        ''' Return the pool of the category of channel, if it has one. '''
+        return cls.pools.get(getattr(channel, 'category_id', None))
+
+    def __init__(self, category, spare, idle=600.0, interval=15.0,
+                 owner=None, onchange=None):
+        self.category = category
+        self.spare = spare
+        # The queue that saves this pool, and the function that tells it
+        # that the channels of the pool changed
+        self.owner = owner
+        self.onchange = onchange
+        # A closing pool hands out no channels, and deletes each of its
+        # channels once it is empty
+        self.closing = False
+        self.idle = idle
+        self.interval = interval
+        self.free = []
+        self.assigned = dict()
+        self.released = []
+        self.lastseen = dict()
+        self.counter = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # Background moves of TAs into their breakout channel
+        self.moves = set()
+
+    @classmethod
+    def restore(cls, category, data, getchannel, owner=None, onchange=None):
+        ''' Restore the pool in category from its saved json data, looking
+            up its channels with getchannel. Channels that no longer exist
+            are left out. When category already has a pool, the saved
+            channels are handed over to it, and recycled or deleted as its
+            spare channels.
+            Returns: the pool of category. '''
+        def channels(ids):
+            return [chan for chan in map(getchannel, ids) if chan is not None]
+        pool = cls.pools.get(category.id)
+        if pool is None:
+            pool = cls.pools[category.id] = cls(
+                category, data['spare'], owner=owner, onchange=onchange)
+            pool.closing = data['closing']
+            pool.free = channels(data['free'])
+            pool.released = channels(data['released'])
+            for taid, cid in data['assigned']:
+                chan = getchannel(cid)
+                if chan is not None:
+                    pool.assigned[taid] = chan
+        else:
+            pool.released.extend(
+                chan for chan in channels(data['free'] + data['released'] +
+                                          [cid for _, cid in data['assigned']])
+                if not pool.owns(chan))
+        # Names of new channels continue after the saved ones
+        pool.counter = max(pool.counter, data['counter'])
+        pool.wakeup.set()
+        return pool
+
+    def tojson(self):
+        ''' Return the json data of this pool, to be saved by its owner. '''
+        return dict(category=self.category.id, spare=self.spare,
+                    counter=self.counter, closing=self.closing,
+                    free=[chan.id for chan in self.free],
+                    released=[chan.id for chan in self.released],
+                    assigned=[[taid, chan.id] for taid, chan in self.assigned.items()])
+
+    def changed(self):
+        ''' Tell the owner of this pool that its channels changed. '''
+        if self.onchange is not None:
+            self.onchange()
+
+    def start(self, loop):
+        ''' Start the background task that maintains this pool. '''
+        if self.task is None:
+            self.task = loop.create_task(self.maintain())
+
+    def acquire(self, taid):
+        ''' Return the breakout channel of TA taid, handing out a spare one
+            when the TA doesn't have one yet. Returns None when no spare
+            channel is ready. '''
+        chan = self.assigned.get(taid)
+        if chan is None and self.free and not self.closing:
+            chan = self.assigned[taid] = self.free.pop()
+            # Replenish the spare channels in the background
+            self.wakeup.set()
+            self.changed()
+        if chan is not None:
+            self.lastseen[chan.id] = time.time()
+        return chan
+
+    def release(self, taid):
+        ''' Return the breakout channel of TA taid to the pool. It is
+            recycled by the background task as soon as it is empty. '''
+        chan = self.assigned.pop(taid, None)
+        if chan is not None:
+            self.released.append(chan)
+            self.wakeup.set()
+            self.changed()
+
+    def available(self, taid):
+        ''' Check whether acquire would give TA taid a channel. '''
+        return taid in self.assigned or (bool(self.free) and not self.closing)
+
+    def movein(self, member, chan):
+        ''' Move member into breakout channel chan in the background. '''
+        async def move():
+            try:
+                await member.edit(voice_channel=chan)
+            except discord.HTTPException:
+                pass
+        task = asyncio.ensure_future(move())
+        self.moves.add(task)
+        task.add_done_callback(self.moves.discard)
+
+    def owns(self, chan):
+        ''' Check whether voice channel chan belongs to this pool. '''
+        return chan is not None and (
+            chan in self.free or chan in self.released or
+            chan in self.assigned.values())
+
+    async def maintain(self):
+        ''' Background task: reclaim idle channels, recycle empty released
+            channels, and keep the requested number of spare channels. '''
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.update()
+            except discord.HTTPException as e:
+                print('Failed to maintain breakout channels:', e)
+            if self.closing and not (self.free or self.released):
+                # All channels are deleted
+                if self.pools.get(self.category.id) is self:
+                    del self.pools[self.category.id]
+                self.task = None
+                self.changed()
+                return
+
+    async def update(self):
+        ''' Perform one maintenance round of this pool. '''
+        now = time.time()
+        saved = self.tojson()
+        # Reclaim channels of TAs that left them
+        for taid, chan in list(self.assigned.items()):
+            if chan.members:
+                self.lastseen[chan.id] = now
+            elif now - self.lastseen.get(chan.id, now) > self.idle:
+                self.release(taid)
+        # Recycle released channels once everyone has left
+        for chan in list(self.released):
+            if not chan.members:
+                self.released.remove(chan)
+                self.free.append(chan)
+        # Create or delete channels to get the requested number of spares
+        try:
+            while len(self.free) < self.spare:
+                self.counter += 1
+                self.free.append(await self.category.create_voice_channel(
+                    f'Breakout {self.counter}', reason='Breakout channel pool'))
+            while len(self.free) > self.spare:
+                chan = self.free.pop(0)
+                try:
+                    await chan.delete(reason='Breakout channel pool')
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException:
+                    # Try again in the next round
+                    self.released.append(chan)
+                    raise
+        finally:
+            if self.tojson() != saved:
+                self.changed()
+
+    def stop(self):
+        ''' Stop the background task and moves of this pool. '''
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in self.moves:
+            task.cancel()
+
+    def close(self):
+        ''' Stop handing out channels, and take back the channels of all
+            TAs. The background task deletes every channel of this pool as
+            soon as it is empty, and then removes the pool. '''
+        self.closing = True
+        self.spare = 0
+        self.released.extend(self.assigned.values())
+        self.assigned.clear()
+        self.wakeup.set()
+        self.changed()
@@ -8,6 +8,8 @@ import numpy as np
 from discord.ext import commands
 from matplotlib.ticker import PercentFormatter
 
+from ..analytics import QuizAnalytics
+
 # Define a shorthand for obtaining the emoji belonging to a :emoji: string
 get_emoji = lambda em: emoji.emojize(em, use_aliases=True)
 
@@ -31,6 +33,8 @@ class Quiz:
         self.options = {}
         self.timer = None
         self.dynamic = False
+        # Footer text of the quiz message, e.g. the time left, which is kept when the quiz finishes
+        self.footer = None
 
         self.votes = {}
         self.singlevote = True
@@ -52,11 +56,13 @@ class Quiz:
                                "\N{REGIONAL INDICATOR SYMBOL LETTER X}", "\N{REGIONAL INDICATOR SYMBOL LETTER Y}",
                                "\N{REGIONAL INDICATOR SYMBOL LETTER Z}")]
 
-    def load_data(self):
-        '''Function for loading in json files containing the quiz information'''
+    def load_data(self, json_data=None):
+        '''Function for loading in json files containing the quiz information. Already parsed json data can be passed
+        to avoid reading the file.'''
         try:
-            with open(self.filename, "r") as file:
-                json_data = json.load(file)
+            if json_data is None:
+                with open(self.filename, "r") as file:
+                    json_data = json.load(file)
             self.name = json_data.get('name', 'Quiz')
             self.question = str(json_data["question"])
             self.options = {i+1: str(option) for i,option in enumerate(json_data["options"])}
@@ -149,17 +155,22 @@ class Quiz:
 
         '''Function that handles user votes to the quiz and makes sure each user only has one final vote'''
 
-        # If it's an invalid emoji, just return
-        if not emoji in self.emoji_options:
-            return
+        # If it's an invalid emoji, or it doesn't belong to one of the options, just return
+        if not emoji in self.emoji_options[:len(self.options)]:
+            return []
 
-        # Delete the voter_id from all options
+        # Delete the voter_id from all options, and keep track of the changes
+        changes = []
         if self.singlevote:
             for option in self.votes:
                 if voter_id in self.votes[option]:
                     self.votes[option].remove(voter_id)
+                    changes.append((option, False))
         # Cast the vote
-        self.votes[self.emoji_options.index(emoji) + 1].add(voter_id)
+        option = self.emoji_options.index(emoji) + 1
+        self.votes[option].add(voter_id)
+        changes.append((option, True))
+        return changes
 
 
     def create_histogram(self):
@@ -220,24 +231,190 @@ class Quiz:
         return image_buffer
 
 
+class ReactionSeeder:
+
+    """
+    Service that adds the voting reactions to new quiz messages in the background. Reactions are pipelined: each one
+    is requested without waiting for the response to the previous one, spaced to stay within the rate limit of the
+    reaction route of a channel, and with a limited number of requests in flight per channel.
+    """
+
+    def __init__(self, spacing=0.25, concurrency=4):
+        self.spacing = spacing
+        self.concurrency = concurrency
+        # Per channel: the earliest time of the next request, and a semaphore for the requests in flight
+        self.next_request = {}
+        self.in_flight = {}
+
+    def seed(self, message, emojis):
+        '''Function to start adding the emojis to message in the background. Returns the task that adds them'''
+        return asyncio.get_event_loop().create_task(self.add_reactions(message, emojis))
+
+    async def add_reactions(self, message, emojis):
+        '''Function that adds the emojis to message in order, pipelining the requests'''
+        loop = asyncio.get_event_loop()
+        channel_id = message.channel.id
+        semaphore = self.in_flight.setdefault(channel_id, asyncio.Semaphore(self.concurrency))
+        requests = []
+        for em in emojis:
+            await semaphore.acquire()
+            # Reserve a time slot, also when other messages in this channel are seeded concurrently
+            start = max(loop.time(), self.next_request.get(channel_id, 0.0))
+            self.next_request[channel_id] = start + self.spacing
+            await asyncio.sleep(start - loop.time())
+            requests.append(loop.create_task(self.add_reaction(message, em, semaphore)))
+        await asyncio.gather(*requests)
+
+    @staticmethod
+    async def add_reaction(message, em, semaphore):
+        try:
+            await message.add_reaction(em)
+        except discord.HTTPException as e:
+            print(f'Failed to add reaction {em}:', e)
+        finally:
+            semaphore.release()
+
+
+class VoteBatcher:
+
+    """
+    Buffer for the reaction events on quiz messages. The events of each message are collected for a short window,
+    and then passed on as one batch, so that a burst of votes is handled by one coroutine instead of one per vote.
+    """
+
+    def __init__(self, handler, window=0.05, onerror=None):
+        self.handler = handler
+        self.window = window
+        # Called as onerror('process_votes', message_id) while the exception of a failed batch is handled, like the
+        # on_error event handler of a bot
+        self.onerror = onerror
+        # Buffered events by message id
+        self.pending = {}
+        # Messages whose buffered events include a batch that failed before
+        self.retrying = set()
+
+    def add(self, event):
+        '''Function to buffer a raw reaction event. The first event of a batch schedules its processing'''
+        batch = self.pending.get(event.message_id)
+        if batch is None:
+            batch = self.schedule(event.message_id)
+        batch.append(event)
+
+    def schedule(self, message_id):
+        '''Function to start a new batch for a message, which is passed on after the window'''
+        batch = self.pending[message_id] = []
+        asyncio.get_event_loop().call_later(self.window, self.flush, message_id)
+        return batch
+
+    def flush(self, message_id):
+        '''Function to pass the buffered events of a message on to the handler'''
+        batch = self.pending.pop(message_id, None)
+        retry = message_id in self.retrying
+        self.retrying.discard(message_id)
+        if batch:
+            asyncio.get_event_loop().create_task(self.process(message_id, batch, retry))
+
+    async def process(self, message_id, batch, retry=False):
+        '''
+        Function to handle one batch. A failed batch is reported, and put back in front of the buffered events of its
+        message, so that its votes are handled once more, in order. A batch that fails again is dropped.
+        '''
+        try:
+            await self.handler(message_id, batch)
+        except Exception as e:
+            if not retry:
+                pending = self.pending.get(message_id)
+                if pending is None:
+                    pending = self.schedule(message_id)
+                pending[0:0] = batch
+                self.retrying.add(message_id)
+            if self.onerror is not None:
+                await self.onerror('process_votes', message_id)
+            else:
+                print(f'Failed to process the votes on message {message_id}:', e)
+
+
+class QuizTemplates:
+
+    """
+    Index of the quiz json files in the quiz directory, and a cache of their parsed contents keyed by path and mtime.
+    The index is updated by the commands that change the directory, so that starting a cached quiz and listing the
+    quizzes don't touch the disk.
+    """
 
+    def __init__(self, datadir):
+        self.datadir = datadir
+        # Modification times of the json files by name, relative to datadir
+        self.index = {}
+        # Parsed json files by name, together with the mtime they were parsed at
+        self.cache = {}
+        self.listing = []
+        self.refresh()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def refresh(self):
+        '''Function to rebuild the index by scanning the quiz directory'''
+        self.index = {path.relative_to(self.datadir).as_posix(): path.stat().st_mtime
+                      for path in self.datadir.rglob("*.json")}
+        self.listing = sorted(self.index)
+
+    def update(self, name):
+        '''Function to update the index after file name has been written or deleted'''
+        path = self.datadir.joinpath(name)
+        if path.exists():
+            self.index[name] = path.stat().st_mtime
+        else:
+            self.index.pop(name, None)
+        self.cache.pop(name, None)
+        self.listing = sorted(self.index)
+
+    def names(self):
+        '''Function that returns the sorted names of all quiz json files'''
+        return self.listing
+
+    def get(self, name):
+        '''
+        Function that returns the parsed json data of quiz file name, or None if it doesn't exist.
+        Files that were added to the directory by other means are found by rescanning it.
+        '''
+        if name not in self.index:
+            self.refresh()
+            if name not in self.index:
+                return None
+        mtime = self.index[name]
+        cached = self.cache.get(name)
+        if cached is None or cached[0] != mtime:
+            with open(self.datadir.joinpath(name), "r") as file:
+                cached = self.cache[name] = (mtime, json.load(file))
+        return cached[1]
 
 
 class Poll(commands.Cog):
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
+        self.storage = bot.storage
 
         self.datadir = bot.datadir.joinpath('quizzes')
         if not self.datadir.exists():
             self.datadir.mkdir()
-
-        self.save_filepath = self.datadir.joinpath("saved_quizzes.backupjson")
+        self.templates = QuizTemplates(self.datadir)
+        self.analytics = QuizAnalytics(bot.datadir.joinpath('analytics'))
 
         # This dictionary contains all the currently active quizzes
         self.quizzes = {}
+        # Messages of deck questions that are posted, but not yet revealed
+        self.placeholders = set()
+        # Set when the running question of a deck is finished, by message id
+        self.finished = {}
+        self.seeder = ReactionSeeder()
+        self.vote_batcher = VoteBatcher(self.process_votes, onerror=bot.on_error)
         self.last_started = ''
-        self.load_quizzes()
+        # The storage of a standby belongs to the primary until it takes over
+        if bot.standby is None:
+            self.load_quizzes()
 
     def get_chanquizzes(self, chanid):
         ids = list(
@@ -269,32 +446,43 @@ class Poll(commands.Cog):
         return super().cog_unload()
 
     def save_quizzes(self):
-        '''Function to save a pickle object containing all the currently active quizzes'''
+        '''
+        Function to save the state of the quiz system. Quizzes are stored when they start or change, and votes
+        as they come in, so only the last started quiz needs to be saved here.
+        Returns an awaitable that finishes when it is written.
+        '''
+        return self.storage.run(self.storage.writelast, self.last_started)
 
-        save_dict = {message_id: self.quizzes[message_id].create_save_data() for message_id in self.quizzes}
-        save_dict["last_started"] = self.last_started
+    def store_quiz(self, quiz):
+        '''Function to store a new or changed quiz, including its current votes'''
+        self.storage.run(self.storage.writequiz, quiz.create_save_data())
 
-        with open(self.save_filepath, 'w') as file:
-            json.dump(save_dict, file, indent=4)
+    def vote(self, quiz, votes):
+        '''
+        Function to cast a batch of votes in a quiz, given as (voter_id, emoji) tuples, and append the changes to
+        its vote log in storage
+        '''
+        changes = [(voter_id, option, added) for voter_id, emoji in votes
+                   for option, added in quiz.vote(voter_id, emoji)]
+        if changes:
+            self.storage.run(self.storage.logvotes, quiz.message_id, changes)
 
     @commands.command("savequiz",aliases=("save-quiz","save_quiz","savequizzes","save-quizzes","save_quizzes"))
     @commands.has_permissions(administrator=True)
     @commands.guild_only()
     async def save_quiz(self,ctx):
         '''Save all currently active quizzes to disk.'''
-        self.save_quizzes()
+        await self.save_quizzes()
         await ctx.channel.send(f"<@{ctx.author.id}> Currently active quizzes saved!",
                                delete_after=20)
 
     def load_quizzes(self):
-        '''Function to load the pickle object containing all the currently active quizzes'''
+        '''Function to load all the currently active quizzes from storage'''
 
-        # If it doesn't exist, there is nothing to load.
-        if not self.save_filepath.exists():
-            self.save_quizzes()
+        # Rebuild the quizzes from their snapshots and vote logs. If there are none, there is nothing to load.
+        json_data = self.storage.readquizzes()
+        if json_data is None:
             return
-        with open(self.save_filepath, 'r') as file:
-            json_data = json.load(file)
 
         self.last_started = json_data.get("last_started", None)
         json_data.pop("last_started", None)
@@ -318,6 +506,48 @@ class Poll(commands.Cog):
         embed = discord.Embed(title="Quiz system status", description=status, colour=0x25a52b)
         await ctx.message.channel.send(embed=embed, delete_after=20)
 
+    @commands.command("quizstats", aliases=("quiz-stats", "quiz_stats"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def quiz_stats(self, ctx, member: discord.Member = None):
+        '''
+        Show the participation and accuracy of students over all finished quizzes in this server.
+
+        Arguments:
+            - @user: Mention a student to show the statistics of that student (optional)
+        '''
+        stats, nquizzes = await self.bot.loop.run_in_executor(None, self.analytics.studentstats, ctx.guild.id)
+        graded = stats["graded"] > 0
+        if member is None:
+            mean_participation = stats["participation"].mean() if len(stats["student"]) else 0.0
+            mean_accuracy = stats["accuracy"][graded].mean() if graded.any() else 0.0
+            status = f"**Finished quizzes:** {nquizzes}\n" \
+                     f"**Students that answered:** {len(stats['student'])}\n" \
+                     f"**Mean participation:** {mean_participation:.0%}\n" \
+                     f"**Mean accuracy:** {mean_accuracy:.0%}"
+        else:
+            idx = np.searchsorted(stats["student"], member.id)
+            if idx == len(stats["student"]) or stats["student"][idx] != member.id:
+                status = f"<@{member.id}> did not answer any of the {nquizzes} finished quizzes."
+            else:
+                accuracy = f"{stats['accuracy'][idx]:.0%}" if graded[idx] else "no graded answers"
+                status = f"**Answered:** {stats['answered'][idx]} of {nquizzes} quizzes " \
+                         f"({stats['participation'][idx]:.0%})\n" \
+                         f"**Correct:** {stats['correct'][idx]} of {stats['graded'][idx]} ({accuracy})"
+        title = "Quiz statistics" + (f" for {member.display_name}" if member else "")
+        embed = discord.Embed(title=title, description=status, colour=0x25a52b)
+        await ctx.channel.send(embed=embed, delete_after=60)
+
+    @commands.command("exportquizstats", aliases=("export-quiz-stats", "export_quiz_stats"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def export_quiz_stats(self, ctx):
+        '''Send the per-student quiz statistics of this server as a CSV file via a direct message.'''
+        text = await self.bot.loop.run_in_executor(None, self.analytics.tocsv, ctx.guild.id)
+        file_object = discord.File(io.BytesIO(text.encode()), filename=f"quizstats_{ctx.guild.name}.csv")
+        await ctx.author.send(f"<@{ctx.author.id}> Here are the quiz statistics that you requested.",
+                              file=file_object)
+
 
     @commands.command("startquiz", aliases=("start-quiz","start_quiz","quiz","beginquiz","begin-quiz",
                                             "begin_quiz","launchquiz","launch_quiz","launch-quiz"))
@@ -343,8 +573,12 @@ class Poll(commands.Cog):
 
         quiz_filepath = self.datadir.joinpath(fname)
 
-        # Check if the filename specified actually exists
-        if not quiz_filepath.exists():
+        # Get the parsed file from the template cache, and check if the filename specified actually exists
+        try:
+            json_data = self.templates.get(fname)
+        except (IOError, ValueError):
+            json_data = {}
+        if json_data is None:
             await ctx.channel.send(
                 f"<@{ctx.author.id}> The filename provided does not seem to exist, please check spelling and try again.",
                 delete_after=20
@@ -352,7 +586,7 @@ class Poll(commands.Cog):
             return
 
         # Create the new quiz
-        was_succesful, new_quiz = Quiz(quiz_filepath, quiz_creator).load_data()
+        was_succesful, new_quiz = Quiz(quiz_filepath, quiz_creator).load_data(json_data)
 
         # Abort if the data reading has failed. If the bot has been properly configured, this means that the json
         # formatting is wrong.
@@ -380,14 +614,134 @@ class Poll(commands.Cog):
         # Add the quiz to the internal dict
         self.quizzes[new_quiz.message_id] = new_quiz
         self.last_started = new_quiz.name
+        self.store_quiz(new_quiz)
 
-        # Add the appropriate reactions
-        for em in emojis:
-            await new_message.add_reaction(em)
-
-        # If the quiz has a timer, activate it
+        # The quiz is open now: start its timer, and add the appropriate reactions in the background
         if new_quiz.timer:
             self.bot.loop.create_task(self.quiz_timer(new_quiz.timer,new_message))
+        self.seeder.seed(new_message, emojis)
+
+    @commands.command("startdeck", aliases=("start-deck", "start_deck", "deck"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def start_deck(self, ctx, fname : str, timeout : int = None):
+
+        '''
+        Discord command to start a deck: a series of quiz questions that advance automatically.
+
+        A deck file is a JSON file with a name, a default timer and a list of questions. Each question has the
+        same format as a quiz file, and can override the timer of the deck.
+
+        Arguments:
+        - fname: The JSON file containing the deck
+        - timeout: Timeout in seconds for each question (optional)
+        '''
+        fname += ".json" if ".json" not in fname else ""
+        try:
+            deck = self.templates.get(fname)
+        except (IOError, ValueError):
+            deck = {}
+        if deck is None:
+            await ctx.channel.send(
+                f"<@{ctx.author.id}> The filename provided does not seem to exist, please check spelling and try again.",
+                delete_after=20
+            )
+            return
+
+        # Create all quizzes of the deck up front
+        questions = deck.get("questions") if isinstance(deck, dict) else None
+        defaults = {key: value for key, value in (deck or {}).items() if key != "questions"}
+        name = defaults.pop("name", fname[:-5])
+        quizzes = []
+        for i, question in enumerate(questions or []):
+            json_data = dict(defaults, name=f"{name} ({i + 1}/{len(questions)})")
+            json_data.update(question if isinstance(question, dict) else {})
+            was_succesful, quiz = Quiz(self.datadir.joinpath(fname), ctx.author.id).load_data(json_data)
+            if not was_succesful:
+                break
+            if timeout is not None:
+                quiz.timer = int(timeout) if int(timeout) not in (-1, 0) else None
+            quizzes.append(quiz)
+
+        if not questions or len(quizzes) < len(questions):
+            await ctx.channel.send(
+                f"<@{ctx.author.id}> The json deck file has been improperly formatted!",
+                delete_after=20
+            )
+            return
+
+        self.bot.loop.create_task(self.run_deck(ctx.channel, name, quizzes))
+
+    async def post_quiz_message(self, channel, embed, emojis, placeholder=False):
+
+        '''
+        Function to post a message with the given embed, and start adding the reactions to vote with. Votes on
+        placeholder messages are ignored until they are revealed.
+        '''
+
+        message = await channel.send(embed=embed)
+        if placeholder:
+            self.placeholders.add(message.id)
+        self.seeder.seed(message, emojis)
+        return message
+
+    async def run_deck(self, channel, name, quizzes):
+
+        '''
+        Function to run the questions of a deck one after the other. The embeds of all questions are rendered in
+        advance, and while a question runs the message of the next one is posted with a placeholder and its
+        reactions, so that it only needs to be edited when the deck advances.
+        '''
+        rendered = []
+        for quiz in quizzes:
+            title, description, emojis = quiz.generate_quiz_message()
+            rendered.append((discord.Embed(title=title, description=description, colour=0x3939cf), emojis))
+        placeholder = discord.Embed(title=name, description="The next question is coming up...", colour=0x3939cf)
+
+        upcoming = self.bot.loop.create_task(self.post_quiz_message(channel, *rendered[0]))
+        try:
+            for i, quiz in enumerate(quizzes):
+                message = await upcoming
+                if i > 0:
+                    self.placeholders.discard(message.id)
+                    await message.edit(embed=rendered[i][0])
+
+                # The question is open from here
+                quiz.message_id = message.id
+                quiz.channel_id = channel.id
+                self.quizzes[quiz.message_id] = quiz
+                finished = self.finished[quiz.message_id] = asyncio.Event()
+                self.last_started = quiz.name
+                self.store_quiz(quiz)
+
+                # Post the next question in the background
+                if i + 1 < len(quizzes):
+                    upcoming = self.bot.loop.create_task(
+                        self.post_quiz_message(channel, placeholder, rendered[i + 1][1], placeholder=True))
+
+                # Wait for the timer, or for the question to be finished by hand
+                if quiz.timer:
+                    await self.countdown(quiz.timer, message)
+                else:
+                    await finished.wait()
+                self.finished.pop(quiz.message_id, None)
+                if quiz.message_id in self.quizzes:
+                    self.bot.loop.create_task(self.finish_quiz(quiz.message_id))
+        except Exception:
+            # The deck stops here, an open question can still be finished by hand
+            await self.bot.on_error('run_deck', name)
+        finally:
+            # Delete the next question if it was posted but not revealed
+            try:
+                message = await upcoming
+            except Exception:
+                message = None
+            if message is not None and message.id in self.placeholders:
+                self.placeholders.discard(message.id)
+                try:
+                    await message.delete()
+                except discord.HTTPException:
+                    pass
 
     @commands.command("dynamic", aliases=("makedynamic", "make_dynamic", "make-dynamic", "dynamicquiz", "dynamic-quiz",
                                           "dynamic_quiz"))
@@ -401,6 +755,7 @@ class Poll(commands.Cog):
         # Turn on dynamic quiz mode: Assume there's only one active quiz in this channel
         if quizzes:
             quizzes[0].dynamic = True
+            self.store_quiz(quizzes[0])
 
     @commands.command("allow-multiple", aliases=("allowmult","allow_mult", "allow_multiple"))
     @commands.has_permissions(administrator=True)
@@ -414,6 +769,7 @@ class Poll(commands.Cog):
             last_quiz = self.quizzes[list(
                 filter(lambda k: self.quizzes[k].name == self.last_started, self.quizzes))[0]]
             last_quiz.singlevote = False
+            self.store_quiz(last_quiz)
 
             # Now generate a new quiz embed and react with the appropriate new reaction
             title, description, emojis = last_quiz.generate_quiz_message()
@@ -447,14 +803,15 @@ class Poll(commands.Cog):
         options = [option.lower() for option in dyn_quiz.options.values()]
         if addition.lower() in options:
             vote_index = options.index(addition.lower())
-            dyn_quiz.vote(ctx.author.id, dyn_quiz.emoji_options[vote_index])
+            self.vote(dyn_quiz, [(ctx.author.id, dyn_quiz.emoji_options[vote_index])])
             return
 
         current_option_length = len(dyn_quiz.options)
         dyn_quiz.options[current_option_length + 1] = addition
         dyn_quiz.votes[current_option_length + 1] = set()
+        self.store_quiz(dyn_quiz)
 
-        dyn_quiz.vote(ctx.author.id, dyn_quiz.emoji_options[current_option_length])
+        self.vote(dyn_quiz, [(ctx.author.id, dyn_quiz.emoji_options[current_option_length])])
 
         # Now generate a new quiz embed and react with the appropriate new reaction
         title, description, emojis = dyn_quiz.generate_quiz_message()
@@ -506,38 +863,62 @@ class Poll(commands.Cog):
             author_id = quiz_to_finish.owner
             message_channel = self.bot.get_channel(quiz_to_finish.channel_id)
 
+        # Close the quiz first, so that it can't be finished twice. Then store its final snapshot and record its
+        # votes for analytics
+        channel = self.bot.get_channel(quiz_to_finish.channel_id)
+        self.quizzes.pop(quiz_to_finish.message_id, None)
+        if quiz_to_finish.message_id in self.finished:
+            self.finished.pop(quiz_to_finish.message_id).set()
+        self.storage.run(self.storage.finishquiz, quiz_to_finish.create_save_data())
+        guild = channel.guild if channel else getattr(ctx, 'guild', None)
+        if guild:
+            self.bot.loop.run_in_executor(None, self.analytics.record, quiz_to_finish, guild.id)
+        else:
+            print(f'Votes of quiz {quiz_to_finish.name} are not recorded: its channel is no longer available')
         feedback_chart = quiz_to_finish.create_histogram()
 
-        # Get the original quiz message
-        message = await message_channel.fetch_message(quiz_to_finish.message_id)
-
-        # Clear the reactions and set the embed colour to green
-        await message.clear_reactions()
-        altered_embed = message.embeds[0].to_dict()
-        altered_embed["color"] = 0x25a52b # Green
-        # altered_embed.pop("footer")
-        altered_embed = discord.Embed.from_dict(altered_embed)
-        await message.edit(embed=altered_embed)
-
-        # Get the recipients of the feedback chart
-        channel = self.bot.get_channel(quiz_to_finish.channel_id)
-        owner = self.bot.get_user(quiz_to_finish.owner)
-        author = self.bot.get_user(author_id)
+        # Get the users that get the feedback chart in a direct message
+        users = {user for user in (self.bot.get_user(quiz_to_finish.owner), self.bot.get_user(author_id)) if user}
+
+        if channel is None or message_channel is None:
+            # The quiz channel is gone, so the chart can only be sent in the direct messages
+            async def send(user):
+                file_object = discord.File(io.BytesIO(feedback_chart.getvalue()), filename=feedback_chart.name)
+                embed = discord.Embed(title=f"Feedback for {quiz_to_finish.name}", colour=0x25a52b)
+                embed.set_image(url=f"attachment://{feedback_chart.name}")
+                await user.send(embed=embed, file=file_object)
+
+            results = await asyncio.gather(*(send(user) for user in users), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f'Error while finishing quiz {quiz_to_finish.name}:', result)
+            return
 
-        # Send the feedback chart to the recipients
-        for recipient in {channel, owner, author}:
-            # Reset the buffer internal index to 0 again
-            feedback_chart.seek(0)
+        # The original quiz message doesn't need to be fetched: its embed is rebuilt with a green colour
+        message = message_channel.get_partial_message(quiz_to_finish.message_id)
+        title, description, _ = quiz_to_finish.generate_quiz_message()
+        altered_embed = discord.Embed(title=title, description=description, colour=0x25a52b) # Green
+        if quiz_to_finish.footer:
+            altered_embed.set_footer(text=quiz_to_finish.footer)
 
-            # Create the file object and embed again to avoid errors
+        async def publish():
+            # Upload the chart once to the channel, the direct messages show the uploaded image
             file_object = discord.File(feedback_chart, filename=feedback_chart.name)
             embed = discord.Embed(title=f"Feedback for {quiz_to_finish.name}", colour=0x25a52b)
             embed.set_image(url=f"attachment://{feedback_chart.name}")
+            sent = await channel.send(embed=embed, file=file_object)
 
-            await recipient.send(embed=embed,file=file_object)
+            embed = discord.Embed(title=f"Feedback for {quiz_to_finish.name}", colour=0x25a52b,
+                                  description=f"[Go to the quiz results]({sent.jump_url})")
+            embed.set_image(url=sent.attachments[0].url)
+            await asyncio.gather(*(user.send(embed=embed) for user in users))
 
-        # Remove the quiz from the internal dictionary
-        self.quizzes.pop(quiz_to_finish.message_id)
+        # Clear the reactions, recolour the quiz message and publish the results concurrently
+        results = await asyncio.gather(message.clear_reactions(), message.edit(embed=altered_embed), publish(),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f'Error while finishing quiz {quiz_to_finish.name}:', result)
 
     @commands.command("intermediate_results", aliases=("intermediateresults", "intermediate-results", "intermediate"))
     @commands.has_permissions(administrator=True)
@@ -586,23 +967,57 @@ class Poll(commands.Cog):
     @commands.Cog.listener()
     async def on_raw_reaction_add(self,ctx):
 
-        '''A Discord event listener that is triggered each time a reaction is added to a message.'''
+        '''
+        A Discord event listener that is triggered each time a reaction is added to a message. Reactions to quizzes
+        are collected in micro-batches, which are processed by process_votes.
+        '''
 
-        message_id = ctx.message_id
-        if not message_id in self.quizzes or ctx.user_id == self.bot.user.id:
+        if ctx.user_id == self.bot.user.id:
             return
-        # The RawReactionEvent object only contains id's, so these need to be converted to usable
-        # discord Channel, Message and Member objects in order to delete the received reaction
-        reaction_channel = self.bot.get_channel(ctx.channel_id)
-        reaction_message = await reaction_channel.fetch_message(message_id)
-        reaction_member = reaction_channel.guild.get_member(ctx.user_id)
+        if ctx.message_id in self.quizzes or ctx.message_id in self.placeholders:
+            self.vote_batcher.add(ctx)
 
-        # If it's not an administrator, we remove it without exception. If it is an administrator, do not remove it.
-        if not reaction_member.guild_permissions.administrator:
-            await reaction_message.remove_reaction(ctx.emoji, reaction_member)
+    async def process_votes(self, message_id, events):
 
-        # Call the vote command. If an invalid emoji has been used, this will do nothing
-        self.quizzes[message_id].vote(reaction_member.id, str(ctx.emoji))
+        '''
+        Function to process a micro-batch of reaction events on one quiz message. Only the last vote of each voter
+        in the batch counts for single-vote quizzes, and all received reactions are removed with one set of
+        concurrent calls.
+        '''
+
+        # The RawReactionEvent objects only contain id's and the member, so the message doesn't need to be fetched
+        # to delete the received reactions
+        reaction_channel = self.bot.get_channel(events[0].channel_id)
+        reaction_message = reaction_channel.get_partial_message(message_id)
+        quiz = self.quizzes.get(message_id)
+        placeholder = message_id in self.placeholders
+
+        votes = {}
+        removals = {}
+        valid = set(quiz.emoji_options[:len(quiz.options)]) if quiz is not None else ()
+        for event in events:
+            member = event.member or reaction_channel.guild.get_member(event.user_id)
+            emoji = str(event.emoji)
+            # Votes on a question that isn't revealed yet don't count. Otherwise, reactions of everyone but
+            # administrators are removed
+            if placeholder or member is None or not member.guild_permissions.administrator:
+                removals[(event.user_id, emoji)] = (event.emoji, member or discord.Object(event.user_id))
+            # Reactions that aren't an option of the quiz don't overwrite an earlier vote in the batch
+            if quiz is not None and not placeholder and emoji in valid:
+                if quiz.singlevote:
+                    votes[event.user_id] = [emoji]
+                else:
+                    votes.setdefault(event.user_id, []).append(emoji)
+
+        # Cast the votes
+        if votes:
+            self.vote(quiz, [(voter_id, emoji) for voter_id, emojis in votes.items() for emoji in emojis])
+
+        results = await asyncio.gather(*(reaction_message.remove_reaction(emoji, member)
+                                         for emoji, member in removals.values()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print('Failed to remove reaction:', result)
 
     @commands.command("makequiz", aliases=("make_quiz","make-quiz","create-quiz","create_quiz","createquiz"))
     @commands.has_permissions(administrator=True)
@@ -643,6 +1058,7 @@ class Poll(commands.Cog):
             file_name = " ".join(args)
             file_name += ".json" if ".json" not in file_name else ""
             await ctx.message.attachments[0].save(self.datadir.joinpath(file_name), use_cached=False, seek_begin=True)
+            self.templates.update(file_name)
             return
 
         # If not, the json data must be given as an argument
@@ -670,6 +1086,7 @@ class Poll(commands.Cog):
 
         with open(self.datadir.joinpath(file_name), 'w') as file:
             file.write(json_string)
+        self.templates.update(file_name)
 
     @commands.command("directquiz", aliases=("direct-quiz", "direct_quiz"))
     @commands.has_permissions(administrator=True)
@@ -726,14 +1143,12 @@ class Poll(commands.Cog):
         # Add the quiz to the internal dict
         self.quizzes[newquiz.message_id] = newquiz
         self.last_started = newquiz.name
+        self.store_quiz(newquiz)
 
-        # Add the appropriate reactions
-        for em in emojis:
-            await new_message.add_reaction(em)
-
-        # If the quiz has a timer, activate it
+        # The quiz is open now: start its timer, and add the appropriate reactions in the background
         if newquiz.timer:
             self.bot.loop.create_task(self.quiz_timer(newquiz.timer, new_message))
+        self.seeder.seed(new_message, emojis)
 
     @commands.command("yesno", aliases=("yes_no", "yes-no"))
     @commands.has_permissions(administrator=True)
@@ -760,10 +1175,10 @@ class Poll(commands.Cog):
 
         self.quizzes[new_quiz.message_id] = new_quiz
         self.last_started = new_quiz.name
+        self.store_quiz(new_quiz)
 
-        # Add the appropriate reactions
-        for em in emojis:
-            await new_message.add_reaction(em)
+        # Add the appropriate reactions in the background
+        self.seeder.seed(new_message, emojis)
 
     @commands.command("viewquiz", aliases=("viewquizzes", "view_quizzes", "view_quiz", "view-quizzes", "view-quiz"))
     @commands.has_permissions(administrator=True)
@@ -771,7 +1186,7 @@ class Poll(commands.Cog):
     async def view_quizzes(self,ctx):
         ''' List all stored json files as well as all active quizzes. '''
 
-        json_files = [path.name for path in list(self.datadir.rglob("*.json"))]
+        json_files = self.templates.names()
         currently_active = [self.quizzes[message_id].name for message_id in self.quizzes]
         to_send = "Quiz JSON files: \n- "*(len(json_files)>0) + "\n- ".join(json_files) + "\n\n" + \
             "Currently active quizzes: \n- "*(len(currently_active) > 0) + "\n- ".join(currently_active)
@@ -828,6 +1243,7 @@ class Poll(commands.Cog):
                                    delete_after=20)
         else:
             filepath.unlink()
+            self.templates.update(filename)
             await ctx.channel.send(f"<@{ctx.author.id}> File deleted!",
                                    delete_after=20)
 
@@ -836,16 +1252,22 @@ class Poll(commands.Cog):
 
         '''Function to dynamically update the timer value on a quiz and automatically end it'''
 
+        await self.countdown(timer_duration, message_object)
+        await self.finish_quiz(message_object.id)
+
+    async def countdown(self, timer_duration, message_object):
+
+        '''Function to dynamically update the timer value on a quiz until it has expired or the quiz is finished'''
+
         timer = timer_duration
         t = lambda x: f"{0 if x//60 < 10 else ''}{x // 60}:{0 if x % 60 < 10 else ''}{x % 60}{0 if x % 60 == 0 else ''}"
 
 
-        while timer > 0:
+        while timer > 0 and message_object.id in self.quizzes:
             new_timer_value = f"Time left: {t(timer)}"
+            self.quizzes[message_object.id].footer = new_timer_value
             embed = (await message_object.channel.fetch_message(message_object.id)).embeds[0]
             embed.set_footer(text=new_timer_value)
             await message_object.edit(embed=embed)
             await asyncio.sleep(1)
             timer -= 1
-
-        await self.finish_quiz(message_object.id)
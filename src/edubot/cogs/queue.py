@@ -14,17 +14,31 @@
 # You should have received a copy of the GNU Affero General Public
 # License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
-import json
+import asyncio
+import os
 import re
-from collections import OrderedDict
-from dataclasses import dataclass, field
-from typing import List
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from functools import partial
+from textwrap import shorten
 
 import discord
 from discord.ext import commands
 
+from ..archive import QuestionArchive
+from ..breakout import BreakoutPool
+from ..dashboard import Dashboard, QueueRow
+from ..selection import Selector
+from ..stats import ServiceStats, fmtduration
+from ..textindex import TextIndex
+from ..throttle import Outbox, Throttle, Throttled
+
 # Generate regular expressions for raw content parsing
-re_ask = re.compile(r'(?:!ask|!question)\s*(.*)')
+re_ask = re.compile(r'(?:!askanyway|!ask|!question)\s*(.*)')
+
+# Typecode of the arrays used to store user ids in queues
+UIDTYPE = 'Q'
 
 # Generate ordinal strings for queue positions
 def ordinal(n): return f'{n}{"tsnrhtdd"[(n//10%10!=1)*(n%10<4)*n%10::4]}'
@@ -46,34 +60,111 @@ class Queue:
     ''' Base queue implementation. '''
     # Get reference to bot in a static
     bot = None
-    datadir = None
+    storage = None
     # Keep queues in a static dict
     queues = dict()
+    # TAs who took a student within this many seconds count as active
+    activewindow = 1800.0
+    # Qids of saved queues, which are loaded on first use
+    index = set()
+    loading = dict()
+    # Queues that are idle for this many seconds are saved and unloaded
+    idlettl = float(os.getenv('EDUBOT_QUEUE_TTL', 3600))
+    # Rate limited sender of notifications to students
+    outbox = None
+    # Journal of changes for a standby process, and the indicators of
+    # queues that were replayed from a journal before connecting
+    journal = None
+    detached = dict()
+    # Numbers of people ahead at which students are notified by default
+    notifyat = (4, 1, 0)
 
     @classmethod
     def saveall(cls):
-        ''' Save all known queues. '''
+        ''' Save all known queues. The writes run in the storage executor,
+            which finishes them before the storage is closed. '''
         print('Saving all queues')
-        for qid, queue in cls.queues.items():
-            print('Saving queue', qid)
+        for queue in cls.queues.values():
             queue.save()
 
     @classmethod
-    def loadall(cls):
-        ''' Load all queue files from disk. '''
+    def buildindex(cls):
+        ''' Index the saved and loaded queues, without loading them. '''
+        cls.index = set(cls.storage.queueids()).union(cls.queues)
+
+    @classmethod
+    async def loadall(cls):
+        ''' Load all saved queues from storage. '''
         msgs = []
-        for qfile in cls.datadir.rglob('*.json'):
-            qidstr = qfile.name.replace('.json', '').split('-')
-            qid = tuple(int(i) for i in qidstr)
-            msgs.append(cls.load(qid))
+        for qid in await cls.storage.run(cls.storage.queueids):
+            msgs.append(await cls.load(qid))
         return '\n'.join(msgs)
 
+    @classmethod
+    async def get(cls, qid):
+        ''' Return the queue of qid. A saved queue that isn't loaded yet is
+            loaded from disk in an executor.
+            Returns: the queue, or None if qid doesn't have a queue. '''
+        queue = cls.queues.get(qid)
+        if queue is None and qid in cls.index:
+            # Concurrent commands in the same channel share one load
+            loading = cls.loading.get(qid)
+            if loading is None:
+                loading = cls.loading[qid] = cls.storage.run(
+                    cls.storage.readqueue, qid)
+            try:
+                qjson = await loading
+            finally:
+                cls.loading.pop(qid, None)
+            if qid not in cls.queues:
+                if qjson is None:
+                    cls.index.discard(qid)
+                else:
+                    cls.fromjson(qid, qjson)
+            queue = cls.queues.get(qid)
+        if queue is not None:
+            queue.lastused = time.time()
+        return queue
+
+    @classmethod
+    async def evictidle(cls, now=None):
+        ''' Save and unload the queues that have been idle for too long. '''
+        now = time.time() if now is None else now
+        for qid, queue in list(cls.queues.items()):
+            if now - queue.lastused > cls.idlettl and not queue.busy(now):
+                print('Unloading idle queue', qid)
+                await queue.save()
+                # Keep the queue if it was used while it was being saved
+                if cls.queues.get(qid) is not queue or \
+                        now - queue.lastused <= cls.idlettl:
+                    continue
+                del cls.queues[qid]
+                if queue.expiry is not None:
+                    queue.expiry.cancel()
+                if cls.journal is not None:
+                    cls.journal.write('unload', qid)
+
+    @classmethod
+    def snapshot(cls):
+        ''' Return journal records of all loaded queues. '''
+        return [('queue', qid, queue.tojson()) for qid, queue in cls.queues.items()]
+
+    @classmethod
+    def replay(cls, kind, key, data):
+        ''' Apply a change from the journal of the primary bot process. '''
+        qid = tuple(key)
+        cls.queues.pop(qid, None)
+        if kind == 'queue':
+            cls.fromjson(qid, data)
+            cls.index.add(qid)
+            cls.detached[qid] = data.get('indicator')
+
     @classmethod
     async def qcheck(cls, ctx, qtype=''):
         ''' Decorator function to check existence and type of queue. '''
         if 'help' in ctx.message.content:
             return True
-        queue = Queue.queues.get((ctx.guild.id, ctx.channel.id), None)
+        queue = await Queue.get((ctx.guild.id, ctx.channel.id))
         if queue is None:
             await ctx.send('This channel doesn\'t have a queue!', delete_after=20)
             return False
@@ -95,30 +186,437 @@ class Queue:
             return f'Created a {qtype} queue'
 
     @classmethod
-    def load(cls, qid):
-        ''' Load queue object from file. '''
-        try:
-            fname = cls.datadir.joinpath(f'{qid[0]}-{qid[1]}.json')
-            with open(fname, 'r') as fin:
-                qjson = json.load(fin)
-                qtype = qjson['qtype']
-                cls.makequeue(
-                    qid, qtype, qjson['guildname'], qjson['channame'])
-                cls.queues[qid].fromfile(qjson['qdata'])
-                return f'Loaded a {qtype} queue for <#{qid[1]}> in {cls.queues[qid].guildname} with {cls.queues[qid].size()} entries.'
-        except IOError:
+    def fromjson(cls, qid, qjson):
+        ''' Create queue qid from its json data. '''
+        cls.makequeue(qid, qjson['qtype'], qjson['guildname'], qjson['channame'])
+        queue = cls.queues[qid]
+        queue.enqueued = {
+            (tuple(key) if isinstance(key, list) else key): t
+            for key, t in sorted(qjson.get('enqueued', []), key=lambda item: item[1])}
+        queue.fromfile(qjson['qdata'])
+        if qjson.get('maxidx'):
+            queue.maxidx = max(queue.maxidx, qjson['maxidx'])
+        if qjson.get('stats'):
+            queue.loadstats(qjson['stats'])
+        for uid, positions in qjson.get('subscriptions', []):
+            queue.subscribe(uid, positions)
+        queue.reattach(qjson.get('indicator'))
+        queue.restorepool(qjson.get('breakouts'))
+        return queue
+
+    @classmethod
+    async def load(cls, qid):
+        ''' Load queue object from storage. '''
+        qjson = await cls.storage.run(cls.storage.readqueue, qid)
+        if qjson is None:
             return 'No saved queue available for this channel.'
+        queue = cls.fromjson(qid, qjson)
+        # The loaded state replaces what was in memory
+        queue.changed()
+        return f'Loaded a {queue.qtype} queue for <#{qid[1]}> in {queue.guildname} with {queue.size()} entries.'
 
     def __init__(self, qid, guildname, channame):
         self.qid = qid
         self.guildname = guildname
         self.channame = channame
-        self.queue = []
+        self.queue = array(UIDTYPE)
+        # Enqueue timestamps, from old to new, and the statistics derived
+        # from them
+        self.enqueued = dict()
+        self.stats = ServiceStats()
+        # Start time and statistics of the review session of each TA
+        self.sessions = dict()
+        self.indicator = None
+        self.lastused = time.time()
+        self.dirty = False
+        # Rate limit of student commands, and the last reply to each student
+        self.throttle = Throttle()
+        self.replies = dict()
+        # Notification thresholds by uid, for students that chose their own,
+        # and the union of all thresholds
+        self.subscriptions = dict()
+        self.thresholds = set(self.notifyat)
+        # Lowest threshold each (line, uid) was notified for, and the lines
+        # with moved entries that still need to be checked
+        self.reached = dict()
+        self.moved = dict()
+        # Reports to the dashboard when the next TA stops counting as active
+        self.expiry = None
+
+    def busy(self, now=None):
+        ''' Check whether this queue holds state that isn't saved to file,
+            or waiting students that are watched, and therefore can't be
+            unloaded. Students are watched by their position subscriptions
+            and by the dashboard of the guild. The queue that saves a
+            breakout pool is kept as long as the pool exists. '''
+        return self.ownedpool() is not None or \
+            self.size() > 0 and (bool(self.subscriptions) or
+                                 self.qid[0] in Dashboard.dashboards)
+
+    def reviewing(self, now=None):
+        ''' Check whether a TA recently took students that can still be put
+            back. The assigned students are not saved to file. '''
+        now = time.time() if now is None else now
+        return any(students and now - self.sessions.get(taid, (0.0,))[0] < self.activewindow
+                   for taid, students in self.assigned.items())
 
     def size(self):
         ''' Return the size of this queue. '''
         return len(self.queue)
 
+    def reattach(self, msgid):
+        ''' Reattach to the indicator message with id msgid after loading. '''
+        channel = self.bot.get_channel(self.qid[1]) if self.bot else None
+        if msgid and channel is not None:
+            self.indicator = channel.get_partial_message(msgid)
+
+    def ownedpool(self):
+        ''' Return the breakout pool that is saved with this queue, or None. '''
+        return next((pool for pool in BreakoutPool.pools.values()
+                     if pool.owner == self.qid), None)
+
+    def restorepool(self, data):
+        ''' Restore the breakout pool that was saved with this queue. Its
+            channels can only be found once the bot is connected, until
+            then the pool stays detached. '''
+        category = self.bot.get_channel(data['category']) \
+            if data and self.bot else None
+        if category is None:
+            if data:
+                BreakoutPool.detached[self.qid] = data
+            else:
+                BreakoutPool.detached.pop(self.qid, None)
+            return
+        BreakoutPool.detached.pop(self.qid, None)
+        pool = BreakoutPool.restore(category, data, self.bot.get_channel,
+                                    self.qid, partial(Queue.poolchanged, self.qid))
+        pool.start(self.bot.loop)
+
+    @classmethod
+    def poolchanged(cls, qid):
+        ''' Save the breakout pool of queue qid along with its queue. '''
+        queue = cls.queues.get(qid)
+        if queue is not None:
+            queue.changed()
+
+    def indicatorembed(self):
+        ''' Return the embed of the floating indicator of this queue. '''
+        return None
+
+    async def showIndicator(self, channel, embed):
+        ''' Replace the floating indicator by a new one at the bottom of
+            channel. '''
+        # Delete previous indicator
+        if self.indicator is not None:
+            try:
+                await self.indicator.delete()
+            except discord.NotFound:
+                pass
+
+        # Send new indicator
+        self.indicator = await channel.send(embed=embed)
+        self.changed()
+
+    async def updateIndicator(self, ctx):
+        ''' Floating indicator displaying next in line and length of queue.
+            Not a command invoked by a user, but by changes in the queue.'''
+        embed = self.indicatorembed()
+        if embed is not None:
+            await self.showIndicator(ctx.channel, embed)
+
+    async def refreshIndicator(self):
+        ''' Edit the indicator in place, e.g. after reattaching to it. '''
+        embed = self.indicatorembed()
+        if self.indicator is None or embed is None:
+            return
+        try:
+            await self.indicator.edit(embed=embed)
+        except discord.NotFound:
+            # The indicator was removed while the bot was away
+            channel, self.indicator = self.indicator.channel, None
+            await self.showIndicator(channel, embed)
+
+    def requeued(self, key, now):
+        ''' Set the enqueue time of entry key to now, keeping the enqueue
+            times in order. '''
+        self.enqueued.pop(key, None)
+        self.enqueued[key] = now
+
+    def dequeued(self, key, stats, now=None):
+        ''' Register that entry 'key' was taken from the queue, and add its
+            waiting time to all statistics in 'stats'. '''
+        now = time.time() if now is None else now
+        start = self.enqueued.pop(key, None)
+        if start is not None:
+            for stat in stats:
+                stat.record_wait(now - start, now)
+
+    def startservice(self, taid, stats, count=1, now=None):
+        ''' Start timing the review session of TA 'taid' with 'count'
+            students. The previous session of this TA is considered
+            completed. '''
+        now = time.time() if now is None else now
+        self.endservice(taid, now, completed=True)
+        self.sessions[taid] = (now, stats, count)
+
+    def endservice(self, taid, now=None, completed=False):
+        ''' Stop timing the review session of TA 'taid'. Only completed
+            sessions count towards the service time statistics. '''
+        now = time.time() if now is None else now
+        start, stats, count = self.sessions.pop(taid, (None, (), 1))
+        if start is not None and completed:
+            for stat in stats:
+                stat.record_service((now - start) / count)
+
+    def reduceservice(self, taid, count):
+        ''' Register that count students were put back from the review
+            session of TA 'taid', which continues with the others. '''
+        session = self.sessions.get(taid)
+        if session is not None:
+            start, stats, n = session
+            self.sessions[taid] = (start, stats, max(1, n - count))
+
+    def activetas(self, now=None):
+        ''' Return the number of TAs that recently took a student. '''
+        now = time.time() if now is None else now
+        return sum(now - session[0] < self.activewindow
+                   for session in self.sessions.values())
+
+    def namedstats(self):
+        ''' Return all statistics of this queue by name. '''
+        return {'': self.stats}
+
+    def setstats(self, name, stats):
+        ''' Replace the statistics with the given name. '''
+        self.stats = stats
+
+    def statsjson(self):
+        ''' Return the statistics and review sessions for storage. '''
+        named = self.namedstats()
+        names = {id(stats): name for name, stats in named.items()}
+        return dict(
+            stats={name: stats.tojson() for name, stats in named.items()},
+            sessions=[[taid, start, [names[id(stat)] for stat in stats
+                                     if id(stat) in names], count]
+                      for taid, (start, stats, count) in self.sessions.items()])
+
+    def loadstats(self, data):
+        ''' Restore the statistics and review sessions from storage. '''
+        for name, stats in data.get('stats', {}).items():
+            self.setstats(name, ServiceStats.fromjson(stats))
+        named = self.namedstats()
+        self.sessions = {
+            taid: (start, tuple(named[name] for name in names if name in named), count)
+            for taid, start, names, count in data.get('sessions', [])}
+
+    def waitestimate(self, ahead, stats=None):
+        ''' Expected waiting time with 'ahead' people in front. '''
+        return (stats or self.stats).expected_wait(ahead, self.activetas())
+
+    @staticmethod
+    def statstext(stats, length):
+        ''' Format queue statistics for display in an embed field. '''
+        return f'**Length of queue:** {length}\n' + \
+            f'**Served:** {stats.throughput():.0f} per hour\n' + \
+            f'**Wait p50 / p95:** {fmtduration(stats.quantile(0.5))} / ' + \
+            f'{fmtduration(stats.quantile(0.95))}\n' + \
+            f'**Average review:** {fmtduration(stats.service)}'
+
+    def statistics(self):
+        ''' Return (title, text) tuples describing the queue statistics. '''
+        return [('Queue', self.statstext(self.stats, self.size()))]
+
+    async def claim(self, ctx, line, n):
+        ''' Take the first n students that are ready to be moved from line
+            of this queue. Students that are not ready are placed back in
+            the queue once. The entries of line are looked up again after
+            each await, as other commands can change the queue meanwhile.
+            Each removal and reinsertion is registered for the position
+            notifications when it is made, so they stay in order.
+            Returns: a list of (uid, member) tuples of claimed students. '''
+        ready, unready = [], []
+        while len(ready) < n:
+            entries = self.entries(line)
+            if not entries:
+                break
+            # Take the candidates out of the queue before fetching them, so
+            # that concurrent commands can't claim the same students
+            chunk = entries[:n - len(ready)]
+            del entries[:len(chunk)]
+            self.shifted(line, 0, chunk)
+            members = await asyncio.gather(
+                *(ctx.guild.fetch_member(uid) for uid in chunk),
+                return_exceptions=True)
+            for uid, member in zip(chunk, members):
+                if isinstance(member, Exception):
+                    member = None
+                (ready if readymovevoice(member) else unready).append(
+                    (uid, member))
+        entries = self.entries(line)
+        # A line that was closed in the meantime has no entries to return to
+        if unready and isinstance(entries, array):
+            # Placement of unready depends on the length of the queue left. Priority goes
+            # to those who are ready, but doesn't send unready to the end of the queue.
+            uids = array(UIDTYPE, (uid for uid, _ in unready))
+            if len(entries) <= len(unready):
+                insertPos = len(entries)
+            else:
+                insertPos = min(len(entries) // 2, 10)
+            entries[insertPos:insertPos] = uids
+            self.inserted(line, insertPos, len(uids))
+            await asyncio.gather(
+                *(self.bot.dm(member, f'You were invited by a TA, but you\'re not in a voice channel yet!'
+                              'You will be placed back in the queue. Make sure that you\'re more prepared next time!')
+                  for _, member in unready if member is not None),
+                return_exceptions=True)
+        return ready
+
+    @staticmethod
+    async def moveall(ctx, cv, members):
+        ''' Move members concurrently into voice channel cv.
+            Returns: the members that could not be moved. '''
+        results = await asyncio.gather(
+            *(member.edit(voice_channel=cv,
+                          reason=f'{ctx.author.display_name} takes {member.display_name} into {cv.name}')
+              for member in members),
+            return_exceptions=True)
+        return [member for member, result in zip(members, results)
+                if isinstance(result, Exception)]
+
+    @staticmethod
+    def canreview(ctx):
+        ''' Check whether the calling TA has a voice channel to review
+            students in: a channel of the breakout pool of this category, or
+            the voice channel the TA is in. '''
+        pool = BreakoutPool.get(ctx.channel)
+        return getvoicechan(ctx.author) is not None or \
+            (pool is not None and pool.available(ctx.author.id))
+
+    @staticmethod
+    async def reviewchannel(ctx):
+        ''' Return the voice channel in which the calling TA reviews students.
+            In categories with a breakout pool this is the TA's breakout
+            channel, and a TA that is in another voice channel is moved
+            along in the background. '''
+        cv = getvoicechan(ctx.author)
+        pool = BreakoutPool.get(ctx.channel)
+        chan = pool.acquire(ctx.author.id) if pool else None
+        if chan is None:
+            return cv
+        if cv is None:
+            await ctx.send(f'<@{ctx.author.id}>: Your students will be waiting for you in <#{chan.id}>!', delete_after=20)
+        elif cv != chan:
+            pool.movein(ctx.author, chan)
+        return chan
+
+    def unclaim(self, line, claimed):
+        ''' Return claimed students to the front of line. '''
+        entries = self.entries(line)
+        if isinstance(entries, array):
+            entries[0:0] = array(UIDTYPE, (uid for uid, _ in claimed))
+            self.inserted(line, 0, len(claimed))
+            self.changed()
+
+    @staticmethod
+    def releasechannel(ctx):
+        ''' Return the breakout channel of the calling TA to the pool. '''
+        pool = BreakoutPool.get(ctx.channel)
+        if pool is not None:
+            pool.release(ctx.author.id)
+
+    @classmethod
+    async def notify(cls, key, text):
+        ''' Send notification text to user key = (guild id, user id). '''
+        guild = cls.bot.get_guild(key[0])
+        member = await guild.fetch_member(key[1])
+        await cls.bot.dm(member, text +
+                         ('' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!'))
+
+    def subscribe(self, uid, positions):
+        ''' Set the numbers of people ahead at which user uid is notified. '''
+        if tuple(positions) == self.notifyat:
+            self.subscriptions.pop(uid, None)
+        else:
+            self.subscriptions[uid] = tuple(positions)
+        self.thresholds = set(self.notifyat).union(*self.subscriptions.values())
+
+    def entries(self, line):
+        ''' Return the uids in line of this queue. '''
+        return self.queue
+
+    def shifted(self, line, pos, removed=()):
+        ''' Register that the users in removed left line at position pos,
+            which moved the later entries forward. '''
+        for uid in removed:
+            self.reached.pop((line, uid), None)
+        self.movedby(line, pos, -len(removed))
+
+    def inserted(self, line, pos, count=1):
+        ''' Register that count entries were inserted in line at position
+            pos, which moved the later entries back. Users that moved back
+            behind the threshold they were notified for are notified again
+            when they reach it. '''
+        entries = self.entries(line)
+        # The position at which list.insert(pos, ...) put the new entries
+        before = len(entries) - count
+        pos = min(pos, before) if pos >= 0 else max(0, before + pos)
+        for ahead in range(pos + count, min(len(entries), max(self.thresholds) + count + 1)):
+            key = (line, entries[ahead])
+            if self.reached.get(key, ahead) < ahead:
+                self.reached[key] = ahead
+        self.movedby(line, pos, count)
+
+    def movedby(self, line, pos, count):
+        ''' Register that the entries in line at position pos and later moved
+            by count positions. The thresholds of the moved users are checked
+            once per event loop iteration. '''
+        first = not self.moved
+        self.moved.setdefault(line, []).append((pos, count))
+        if first:
+            try:
+                asyncio.get_running_loop().call_soon(self.checkpositions)
+            except RuntimeError:
+                # Not running in the event loop: check right away
+                self.checkpositions()
+
+    def checkpositions(self):
+        ''' Notify users that moved past one of their thresholds. Only the
+            users that are now within the highest threshold need to be
+            checked. Users that passed several thresholds at once are
+            notified once, for the lowest. '''
+        moved, self.moved = self.moved, dict()
+        highest = max(self.thresholds)
+        for line, changes in moved.items():
+            entries = self.entries(line)
+            for ahead in range(min(pos for pos, _ in changes), min(len(entries), highest + 1)):
+                # Find the position of this user before the changes
+                prev = ahead
+                for pos, count in reversed(changes):
+                    if prev < pos:
+                        continue
+                    if prev < pos + count:
+                        # Inserted by this change
+                        prev = None
+                        break
+                    prev -= count
+                if prev is None or prev <= ahead:
+                    continue
+                uid = entries[ahead]
+                below = min(prev, self.reached.get((line, uid), prev))
+                crossed = [t for t in self.subscriptions.get(uid, self.notifyat)
+                           if ahead <= t < below]
+                if crossed:
+                    self.reached[(line, uid)] = min(crossed)
+                    if Queue.outbox is not None:
+                        Queue.outbox.put((self.qid[0], uid), self.notifytext(line, ahead))
+
+    def notifytext(self, line, ahead):
+        ''' Return the notification for a user with ahead people in front. '''
+        chan = f'<#{self.qid[1]}>'
+        if ahead == 0:
+            return f'Get ready! You\'re next in line for the queue in {chan}!'
+        return f'You\'re {ordinal(ahead + 1)} in line for the queue in {chan}!'
+
     async def add(self, ctx, uid, *args):
         ''' Add user with uid to this queue. '''
         try:
@@ -128,13 +626,19 @@ class Queue:
                     'You are next in line!')
         except ValueError:
             self.queue.append(uid)
+            self.enqueued[uid] = time.time()
+            self.changed()
             msg = f'Added <@{uid}> to the queue at position {len(self.queue)}'
         await ctx.send(msg, delete_after=10)
 
     def remove(self, uid, *args):
         ''' Remove user with uid from this queue. '''
         try:
-            self.queue.remove(uid)
+            pos = self.queue.index(uid)
+            del self.queue[pos]
+            self.enqueued.pop(uid, None)
+            self.shifted(None, pos, (uid,))
+            self.changed()
         except ValueError:
             return f'<@{uid}> is not listed in the queue!'
         else:
@@ -142,30 +646,130 @@ class Queue:
 
     def fromfile(self, qdata):
         ''' Build queue from data out of json file. '''
-        self.queue = qdata
+        self.queue = array(UIDTYPE, qdata)
 
     def tofile(self):
         ''' Return queue data for storage in json file. '''
-        return self.queue
+        return self.queue.tolist()
+
+    def tojson(self):
+        ''' Return the json data of this queue for storage. '''
+        return dict(qtype=self.qtype,
+                    guildname=self.guildname,
+                    channame=self.channame,
+                    qdata=self.tofile(),
+                    enqueued=list(self.enqueued.items()),
+                    indicator=getattr(self.indicator, 'id', None),
+                    stats=self.statsjson(),
+                    subscriptions=sorted([uid, list(positions)] for uid, positions
+                                         in self.subscriptions.items()),
+                    breakouts=self.pooljson())
+
+    def pooljson(self):
+        ''' Return the json data of the breakout pool saved with this queue,
+            or None. '''
+        pool = self.ownedpool()
+        return pool.tojson() if pool else BreakoutPool.detached.get(self.qid)
 
     def save(self):
-        ''' Save queue object to file. '''
-        fname = Queue.datadir.joinpath(f'{self.qid[0]}-{self.qid[1]}.json')
-        print('Saving', fname)
-        with open(fname, 'w') as fout:
-            qjson = dict(qtype=self.qtype,
-                         guildname=self.guildname,
-                         channame=self.channame,
-                         qdata=self.tofile())
-            json.dump(qjson, fout, indent=4)
+        ''' Save queue object to storage. The state is taken right away,
+            and written in the storage executor.
+            Returns: an awaitable that finishes when the queue is written. '''
+        print('Saving queue', self.qid)
+        Queue.index.add(self.qid)
+        return Queue.storage.run(Queue.storage.writequeue, self.qid, self.tojson())
+
+    def oldest(self):
+        ''' Return the time at which the longest waiting entry was queued. '''
+        return next(iter(self.enqueued.values()), None)
+
+    def summary(self):
+        ''' Return the dashboard summary of this queue. '''
+        return QueueRow(self.channame, self.qtype, self.size(), self.oldest(),
+                        self.activetas())
+
+    def changed(self):
+        ''' Register a change of this queue. Each method that changes the
+            saved state of a queue calls this. Incremental storage backends
+            and the journal get the new state once per event loop
+            iteration. '''
+        self.report()
+        incremental = Queue.storage is not None and Queue.storage.incremental
+        if (incremental or Queue.journal is not None) and not self.dirty:
+            self.dirty = True
+            asyncio.get_event_loop().call_soon(self.flush)
+
+    def report(self):
+        ''' Pass the summary of this queue to the dashboard of its guild. '''
+        dashboard = Dashboard.dashboards.get(self.qid[0])
+        if dashboard is not None:
+            dashboard.update(self.qid, self.summary())
+            self.watchtas()
+
+    def watchtas(self, now=None):
+        ''' Report again once the next active TA stops counting as active,
+            which happens without a change of this queue. '''
+        now = time.time() if now is None else now
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        start = min((session[0] for session in self.sessions.values()
+                     if now - session[0] < self.activewindow), default=None)
+        if start is not None:
+            try:
+                self.expiry = asyncio.get_running_loop().call_later(
+                    start + self.activewindow - now, self.report)
+            except RuntimeError:
+                # Not running in the event loop
+                pass
+
+    def flush(self):
+        ''' Write the state of this queue in the storage executor, and to
+            the journal. '''
+        self.dirty = False
+        Queue.index.add(self.qid)
+        qjson = self.tojson()
+        if Queue.storage.incremental:
+            Queue.storage.run(Queue.storage.writequeue, self.qid, qjson)
+        if Queue.journal is not None:
+            Queue.journal.write('queue', self.qid, qjson)
+
+    def queued(self, uid, *args):
+        ''' Check whether user uid is already in this queue. '''
+        return uid in self.queue
+
+    async def reply(self, ctx, text, ttl=10):
+        ''' Send text to the author of ctx. While an earlier reply to the
+            same user is still shown, that reply is reused instead. '''
+        uid = ctx.author.id
+        now = time.time()
+        prev = self.replies.get(uid)
+        if prev is not None and prev[2] > now + 1:
+            msg, shown, expires = prev
+            self.throttle.count('coalesced')
+            if shown == text:
+                return
+            try:
+                await msg.edit(content=text)
+                self.replies[uid] = (msg, text, expires)
+                return
+            except discord.NotFound:
+                pass
+        msg = await ctx.send(text, delete_after=ttl)
+        if len(self.replies) > 100:
+            self.replies = {key: reply for key, reply in self.replies.items()
+                            if reply[2] > now}
+        self.replies[uid] = (msg, text, now + ttl)
 
     def whereis(self, uid):
         ''' Find user with id 'uid' in this queue. '''
         try:
             pos = self.queue.index(uid)
+            wait = self.waitestimate(pos)
             return f'Hi <@{uid}>! ' + \
                 (f'You are **{ordinal(pos + 1)}** in line' if pos else
-                 'You are next in line!')
+                 'You are next in line!') + \
+                (f' Expected wait: {fmtduration(wait)}.' if wait is not None else '')
         except ValueError:
             return f'You are not in the queue in this channel <@{uid}>!'
 
@@ -176,109 +780,95 @@ class ReviewQueue(Queue):
     def __init__(self, qid, guildname, channame):
         super().__init__(qid, guildname, channame)
         self.assigned = dict()
-        self.indicator = None
         self.assignments = list()
 
+    def busy(self, now=None):
+        return self.reviewing(now) or super().busy(now)
+
     async def convert(self, ctx, multiQueue, aid):
         ''' Convert a multiqueue into a single queue. '''
         self.indicator = multiQueue.indicator
         self.assignments = multiQueue.assignments
+        # Merge the queues in assignment order, keeping only the first
+        # occurrence of each student
+        seen = set()
+        queue = array(UIDTYPE)
         for aid in self.assignments:
-            self.queue += [uid for uid in multiQueue.queue[aid]
-                           if uid not in self.queue]
-
-    async def takenext(self, ctx, aid=None):
-        ''' Take the next student from the queue. '''
-        # Get the voice channel of the caller
-        cv = getvoicechan(ctx.author)
-        if cv is None:
+            for uid in multiQueue.queue[aid]:
+                if uid not in seen:
+                    seen.add(uid)
+                    queue.append(uid)
+        self.queue = queue
+        # Keep the earliest enqueue time of students in multiple queues
+        for (aid, uid), t in multiQueue.enqueued.items():
+            self.enqueued.setdefault(uid, t)
+        self.stats = multiQueue.stats
+        self.sessions = multiQueue.sessions
+        self.changed()
+
+    async def takenext(self, ctx, aid=None, n=1):
+        ''' Take the next n students from the queue. '''
+        # Check that the caller has a voice channel
+        if not self.canreview(ctx):
             await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=10)
             return
         if not self.queue:
             await ctx.send(f'<@{ctx.author.id}>: Hurray, the queue is empty!', delete_after=20)
             return
 
-        # Get the next student in the queue
-        uid = self.queue.pop(0)
-        try:
-            member = await ctx.guild.fetch_member(uid)
-        except:
-            member = None
-        unready = []
-        while self.queue and not readymovevoice(member):
-            if member is not None:
-                await self.bot.dm(member, f'You were invited by a TA, but you\'re not in a voice channel yet!'
-                                'You will be placed back in the queue. Make sure that you\'re more prepared next time!')
-            # Store the studentID to place them back in the queue, and get the next one to try
-            unready.append(uid)
-            if self.queue:
-                uid = self.queue.pop(0)
-                try:
-                    member = await ctx.guild.fetch_member(uid)
-                except:
-                    member = None
-            else:
-                await ctx.send(f'<@{ctx.author.id}> : There\'s noone in the queue who is ready (in a voice lounge)!', delete_after=10)
-                self.queue = unready
-                return
-        # Placement of unready depends on the length of the queue left. Priority goes
-        # to those who are ready, but doesn't send unready to the end of the queue.
-        if len(self.queue) <= len(unready):
-            self.queue += unready
-        else:
-            insertPos = min(len(self.queue) // 2, 10)
-            self.queue = self.queue[:insertPos] + \
-                unready + self.queue[insertPos:]
+        # Get the next ready students in the queue
+        claimed = await self.claim(ctx, None, n)
+        self.changed()
+        if not claimed:
+            await ctx.send(f'<@{ctx.author.id}> : There\'s noone in the queue who is ready (in a voice lounge)!', delete_after=10)
+            return
 
-        # move the student to the callee's voice channel, and store him/her
-        # as assigned for the caller
-        self.assigned[ctx.author.id] = (
-            member.id, self.qid, getvoicechan(member))
-        try:
-            await member.edit(voice_channel=cv, reason=f'<@{ctx.author.nick}> takes {member.nick} into {cv.name}. {len(unready)} skipped')
-        except discord.HTTPException:
-            ctx.send(
-                f'Failed to move {member.mention}. Putback into queue', delete_after=5)
-            await self.putback(ctx, 10)
+        # Only now hand out a breakout channel
+        cv = await self.reviewchannel(ctx)
+        if cv is None:
+            # The last spare breakout channel was taken in the meantime
+            self.unclaim(None, claimed)
+            await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=10)
+            return
 
-        # are there still students in the queue?
-        if self.queue:
-            try:
-                member = await ctx.guild.fetch_member(self.queue[0])
-                await self.bot.dm(member,
-                                  f'Get ready! You\'re next in line for the queue in <#{ctx.channel.id}>!' +
-                                  ('' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!'))
-            except:
-                pass
+        # Update the waiting and service time statistics
+        for uid, _ in claimed:
+            self.dequeued(uid, (self.stats,))
+        self.startservice(ctx.author.id, (self.stats,), len(claimed))
 
-            if len(self.queue) > 1:
-                # Also send a message to the third person in the queue
-                try:
-                    member = await ctx.guild.fetch_member(self.queue[1])
-                    await self.bot.dm(member,
-                                    f'Almost there {member.name}, You\'re second in line for the queue in <#{ctx.channel.id}>!' +
-                                    ('' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!'))
-                except:
-                    pass
-
-            if len(self.queue) > 5:
-                # Also send a message to the fifth person in the queue
-                try:
-                    member = await ctx.guild.fetch_member(self.queue[4])
-                    await self.bot.dm(member,
-                                    f'Your patience will soon be rewarded, {member.name}... You\'re fifth in line for the queue in <#{ctx.channel.id}>!' +
-                                    '' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!')
-                except:
-                    pass
-
-    async def putback(self, ctx, pos):
-        ''' Put the student you currently have in your voice channel back in the queue. '''
-        uid, qid, voicechan = self.assigned.get(
-            ctx.author.id, (False, False, False))
-        if not uid:
+        # move the students to the callee's voice channel, and store them
+        # as assigned for the caller
+        self.assigned[ctx.author.id] = [
+            (member.id, self.qid, getvoicechan(member)) for _, member in claimed]
+        failed = await self.moveall(ctx, cv, [member for _, member in claimed])
+        if failed:
+            await ctx.send(
+                f'Failed to move {", ".join(m.mention for m in failed)}. Putback into queue', delete_after=5)
+            await self.putback(ctx, 10, {member.id for member in failed})
+
+    async def putback(self, ctx, pos, uids=None):
+        ''' Put the students you currently have in your voice channel back in the queue.
+            When uids is given, only those students are put back. '''
+        assigned = self.assigned.get(ctx.author.id)
+        if not assigned:
             await ctx.send(f'<@{ctx.author.id}>: You don\'t have a student assigned to you yet!', delete_after=10)
+            return
+        back = [entry for entry in assigned if uids is None or entry[0] in uids]
+        self.assigned[ctx.author.id] = [entry for entry in assigned if entry not in back]
+        if self.assigned[ctx.author.id]:
+            self.reduceservice(ctx.author.id, len(back))
         else:
+            # Nobody is left in this review session
+            self.releasechannel(ctx)
+            self.endservice(ctx.author.id)
+        now = time.time()
+        for uid, qid, voicechan in reversed(back):
             self.queue.insert(pos, uid)
+            self.inserted(None, pos)
+            self.requeued(uid, now)
+        self.changed()
+
+        async def moveback(uid, voicechan):
             try:
                 member = await ctx.guild.fetch_member(uid)
                 if readymovevoice(member):
@@ -286,23 +876,21 @@ class ReviewQueue(Queue):
                 await self.bot.dm(member, 'You were moved back into the queue, probably because you didn\'t respond.')
             except:
                 pass
+        await asyncio.gather(*(moveback(uid, voicechan)
+                               for uid, _, voicechan in back))
 
-    async def updateIndicator(self, ctx):
-        ''' Floating indicator displaying next in line and length of queue.
-            Not a command invoked by a user, but by changes in the queue.'''
+    def indicatorembed(self):
+        ''' Indicator with the length and next three of the queue. '''
         msg = f'**Length of queue:** {len(self.queue)}.\n' + \
             'Next three in queue:\n'
         for idx, member in enumerate(self.queue[:3]):
             msg += f'{idx+1}: <@{member}>\n'
+        wait = self.waitestimate(len(self.queue))
+        if wait is not None:
+            msg += f'\n**Expected wait:** {fmtduration(wait)}'
         msg += '\n\nType !ready to enter the queue when you\n also want to hand in your assignment!'
-        embed = discord.Embed(title=f"Queue for assignment{'' if len(self.assignments) == 1 else 's'} {', '.join(i for i in self.assignments)}",
-                              description=msg, colour=0xae8b0c)
-        # Delete previous indicator
-        if self.indicator is not None:
-            await self.indicator.delete()
-
-        # Send new indicator
-        self.indicator = await ctx.channel.send(embed=embed)
+        return discord.Embed(title=f"Queue for assignment{'' if len(self.assignments) == 1 else 's'} {', '.join(i for i in self.assignments)}",
+                             description=msg, colour=0xae8b0c)
 
     async def startReviewing(self, ctx, aid):
         if aid not in self.assignments:
@@ -325,10 +913,17 @@ class ReviewQueue(Queue):
 class MultiReviewQueue(Queue):
     qtype = 'MultiReview'
 
-    @dataclass
     class Student:
-        id: int
-        aid: List[str] = field(default_factory=list)
+        ''' Compact record of a queued student. The queues the student is in
+            are stored as a bitmask over the assignment bits of the queue. '''
+        __slots__ = ('id', 'mask', 'oldVC', 'check', 'qid')
+
+        def __init__(self, id, mask=0):
+            self.id = id
+            self.mask = mask
+            self.oldVC = None
+            self.check = None
+            self.qid = None
 
     def __init__(self, qid, guildname, channame):
         super().__init__(qid, guildname, channame)
@@ -336,12 +931,69 @@ class MultiReviewQueue(Queue):
         self.studentsQueued = {}
         self.assigned = dict()
         self.assignments = list()
-        self.indicator = None
+        self.aidstats = dict()
+        # Membership bit of each assignment
+        self.aidbits = dict()
+        # Strategy to pick a queue when a TA doesn't specify one
+        self.selector = Selector.make('oldest')
 
     def size(self):
         ''' Return the amount of students in all queues '''
         return len(self.studentsQueued)
 
+    def busy(self, now=None):
+        return self.reviewing(now) or super().busy(now)
+
+    def bit(self, aid):
+        ''' Return the membership bit of assignment aid. '''
+        bit = self.aidbits.get(aid)
+        if bit is None:
+            used = 0
+            for b in self.aidbits.values():
+                used |= b
+            # Allocate the lowest free bit
+            bit = self.aidbits[aid] = (used + 1) & ~used
+        return bit
+
+    def aidsof(self, student):
+        ''' Return the assignments of the queues student is in. '''
+        return [aid for aid in self.assignments
+                if student.mask & self.aidbits.get(aid, 0)]
+
+    def touched(self, aid):
+        ''' Update the queue selection after queue aid has changed. '''
+        self.selector.update(self, aid)
+
+    def aidstat(self, aid):
+        ''' Return the statistics of the queue for assignment aid. '''
+        stats = self.aidstats.get(aid)
+        if stats is None:
+            stats = self.aidstats[aid] = ServiceStats()
+        return stats
+
+    def namedstats(self):
+        return dict(super().namedstats(), **self.aidstats)
+
+    def setstats(self, name, stats):
+        if name:
+            self.aidstats[name] = stats
+        else:
+            super().setstats(name, stats)
+
+    def aidwait(self, aid, ahead):
+        ''' Expected waiting time in queue aid, falling back to the overall
+            statistics when this assignment has no data yet. '''
+        stats = self.aidstat(aid)
+        return self.waitestimate(
+            ahead, stats if stats.service is not None else None)
+
+    def statistics(self):
+        fields = super().statistics()
+        for aid in self.assignments:
+            fields.append((f'Queue {aid}', self.statstext(
+                self.aidstat(aid), len(self.queue[aid]))))
+        return fields
+
     async def convert(self, ctx, singleQueue, aid):
         ''' Convert data from singleQueue to MultiQueue format '''
         self.indicator = singleQueue.indicator
@@ -349,32 +1001,42 @@ class MultiReviewQueue(Queue):
         if not self.assignments:
             self.assignments.append(aid)
         else:
-            self.queue = {i: [] for i in self.assignments}
+            self.queue = {i: array(UIDTYPE) for i in self.assignments}
         aid = next(iter(self.assignments))
         self.queue[aid] = singleQueue.queue
+        bit = self.bit(aid)
         for uid in singleQueue.queue:
-            student = MultiReviewQueue.Student(uid)
-            student.aid.append(aid)
-            self.studentsQueued[uid] = student
+            self.studentsQueued[uid] = MultiReviewQueue.Student(uid, bit)
+        self.enqueued = {(aid, uid): t
+                         for uid, t in singleQueue.enqueued.items()}
+        self.stats = singleQueue.stats
+        self.sessions = singleQueue.sessions
+        self.selector.rebuild(self)
+        self.changed()
 
     def fromfile(self, qdata):
-        self.queue = qdata['queue']
+        self.queue = {aid: array(UIDTYPE, q)
+                      for aid, q in qdata['queue'].items()}
         self.assignments = qdata['assignments']
         students = OrderedDict()
         for aid in self.assignments:
+            bit = self.bit(aid)
             for uid in self.queue[aid]:
                 if uid in students:
-                    students[uid].aid.append(aid)
+                    students[uid].mask |= bit
                 else:
-                    student = MultiReviewQueue.Student(uid)
-                    student.aid.append(aid)
-                    students[uid] = student
+                    students[uid] = MultiReviewQueue.Student(uid, bit)
         self.studentsQueued = students
+        self.selector = Selector.make(qdata.get('strategy', 'oldest'),
+                                      qdata.get('weights'))
+        self.selector.rebuild(self)
 
     def tofile(self):
         qdata = {
-            'assignments': self.assignments,
-            'queue': self.queue
+            'assignments': list(self.assignments),
+            'queue': {aid: q.tolist() for aid, q in self.queue.items()},
+            'strategy': self.selector.name,
+            'weights': dict(self.selector.weights)
         }
         return qdata
 
@@ -382,9 +1044,14 @@ class MultiReviewQueue(Queue):
         ''' Find user with id 'uid' in queues. Returns all positions'''
         try:
             student = self.studentsQueued.get(uid)
-            pos = [(aid, self.queue[aid].index(uid)) for aid in student.aid]
+            pos = [(aid, self.queue[aid].index(uid))
+                   for aid in self.aidsof(student)]
             msg = f'<@{uid}>, you are: '
-            msg += ', '.join([f"**{ordinal(p+1)}** in Queue {q}" for q, p in pos])
+            waits = [self.aidwait(q, p) for q, p in pos]
+            msg += ', '.join([f"**{ordinal(p+1)}** in Queue {q}" +
+                              ('' if w is None else
+                               f" (expected wait {fmtduration(w)})")
+                              for (q, p), w in zip(pos, waits)])
             return msg
         except:
             return f'<@{uid}>, you do not seem to be in any queues!'
@@ -411,162 +1078,164 @@ class MultiReviewQueue(Queue):
                         'You are next in line!')
             except ValueError:
                 self.queue[aid].append(student.id)
-                if aid not in student.aid:
-                    student.aid.append(aid)
+                self.enqueued[(aid, student.id)] = time.time()
+                student.mask |= self.bit(aid)
+                self.touched(aid)
+                self.changed()
                 msg = f'Added <@{student.id}> to the queue at position {len(self.queue[aid])}'
         else:  # Wrong queue selection
             msg = f"Hi <@{student.id}>! We aren't reviewing that assignment yet, so you'll have to wait until we open that queue."
-        student.aid.sort()
         await ctx.send(msg, delete_after=10)
 
+    def entries(self, line):
+        return self.queue.get(line, ())
+
+    def notifytext(self, line, ahead):
+        return super().notifytext(line, ahead)[:-1] + f', assignment {line}!'
+
+    def queued(self, uid, aid=None):
+        if aid is None:
+            return uid in self.studentsQueued
+        return aid in self.queue and uid in self.queue[aid]
+
     def remove(self, uid, aid=None):
         if aid is not None:
             return self.removeone(uid, aid)
         else:
             try:
                 student = self.studentsQueued[uid]
-                for aid in student.aid:
-                    self.queue[aid].remove(uid)
+                for aid in self.aidsof(student):
+                    pos = self.queue[aid].index(uid)
+                    del self.queue[aid][pos]
+                    self.enqueued.pop((aid, uid), None)
+                    self.touched(aid)
+                    self.shifted(aid, pos, (uid,))
                 self.studentsQueued.pop(uid)
+                self.changed()
                 return f'<@{uid}> removed from all queues.'
             except:
                 return f'<@{uid}> is not in any queue!'
 
     def removeone(self, uid, aid):
         try:
-            self.queue[aid].remove(uid)
-            self.studentsQueued[uid].aid.remove(aid)
+            pos = self.queue[aid].index(uid)
+            del self.queue[aid][pos]
+            self.studentsQueued[uid].mask &= ~self.bit(aid)
+            self.enqueued.pop((aid, uid), None)
+            self.touched(aid)
+            self.shifted(aid, pos, (uid,))
+            self.changed()
             return f'<@{uid}> removed from queue {aid}.'
         except ValueError:
             return f'<@{uid}> not in queue {aid}'
 
-    async def takenext(self, ctx, aid=None, prevAll=False):
-        ''' Take the next student from the queue. Optionally add the queue number'''
-        # In case TAs forget to specify which queue, default to first
-        # non-empty queue
+    async def takenext(self, ctx, aid=None, n=1):
+        ''' Take the next n students from the queue. Optionally add the queue number'''
+        # In case TAs don't specify which queue, let the selection strategy
+        # pick one
         if aid is None:
-            aidIter = iter(self.assignments)
-            aid = next(aidIter)
-            while len(self.queue[aid]) == 0:
-                aid = next(aidIter)
-        # Get the voice channel of the caller
-        cv = getvoicechan(ctx.author)
-        if cv is None:
+            aid = self.selector.select()
+            if aid is None:
+                await ctx.send(f'<@{ctx.author.id}>: Hurray, all queues are empty!', delete_after=20)
+                return
+        elif aid not in self.assignments:
+            await ctx.send(f'<@{ctx.author.id}>: There is no queue for assignment {aid}!', delete_after=20)
+            return
+        # Check that the caller has a voice channel
+        if not self.canreview(ctx):
             await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=10)
             return
         if not self.queue[aid]:
             await ctx.send(f'<@{ctx.author.id}>: Hurray, queue {aid} is empty! Might want to check the other ones now', delete_after=20)
             return
 
-        # Get the next student in the queue
-        uid = self.queue[aid].pop(0)
-        try:
-            member = await ctx.guild.fetch_member(uid)
-        except:
-            member = None
-        unready = []
-        while self.queue[aid] and not readymovevoice(member):
-            if member is not None:
-                await self.bot.dm(member.id, f'You were invited by a TA, but you\'re not in a voice channel yet!'
-                                'You will be placed back in the queue. Make sure that you\'re more prepared next time!')
-            # Store the studentID to place them back in the queue, and get the next one to try
-            unready.append(uid)
-            if self.queue[aid]:
-                uid = self.queue[aid].pop(0)
-                try:
-                    member = await ctx.guild.fetch_member(uid)
-                except:
-                    member = None
-            else:
-                await ctx.send(f'<@{ctx.author.id}> : There\'s noone in queue {aid} who is ready (in a voice lounge)!', delete_after=10)
-                self.queue[aid] = unready
-                return
-        # Placement of unready depends on the length of the queue left. Priority goes
-        # to those who are ready, but doesn't send unready to the end of the queue.
-        if len(self.queue[aid]) <= len(unready):
-            self.queue[aid] += unready
-        else:
-            insertPos = min(len(self.queue[aid]) // 2, 10)
-            self.queue[aid] = self.queue[aid][:insertPos] + \
-                unready + self.queue[aid][insertPos:]
+        # Get the next ready students in the queue
+        claimed = await self.claim(ctx, aid, n)
+        self.touched(aid)
+        self.changed()
+        if not claimed:
+            await ctx.send(f'<@{ctx.author.id}> : There\'s noone in queue {aid} who is ready (in a voice lounge)!', delete_after=10)
+            return
 
-        # move the student to the callee's voice channel, and store him/her
-        # as assigned for the caller.
+        # Only now hand out a breakout channel
+        cv = await self.reviewchannel(ctx)
+        if cv is None:
+            # The last spare breakout channel was taken in the meantime
+            self.unclaim(aid, claimed)
+            self.touched(aid)
+            await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=10)
+            return
 
-        newStudent = self.studentsQueued[uid]
-        newStudent.oldVC = getvoicechan(member)
-        newStudent.check = aid
-        newStudent.aid.remove(aid)  # parallels the pop in self.queue[aid]
-        # I saw in the original putback you pass qid, couldn't see what for
-        newStudent.qid = self.qid
-        self.assigned[ctx.author.id] = newStudent
-        try:
-            await member.edit(voice_channel=cv)
-        except:
-            ctx.send(
-                f"Failed to move <@{newStudent.id}> into voice channel. Putback in queue", delete_after=5)
-            await self.putback(10)
+        # Update the waiting and service time statistics
+        stats = (self.stats, self.aidstat(aid))
+        for uid, _ in claimed:
+            self.dequeued((aid, uid), stats)
+        self.startservice(ctx.author.id, stats, len(claimed))
 
-        # are there still students in the queue?
-        if self.queue[aid]:
-            try:
-                member = await ctx.guild.fetch_member(self.queue[aid][0])
-                await self.bot.dm(member,
-                                f'Get ready! You\'re next in line for the queue in <#{ctx.channel.id}>!' +
-                                ('' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!'))
-            except:
-                pass
-            if len(self.queue[aid]) > 1:
-                # Also send a message to the third person in the queue
-                try:
-                    member = await ctx.guild.fetch_member(self.queue[aid][1])
-                    await self.bot.dm(member,
-                                    f'Almost there {member.name}, You\'re second in line for the queue in <#{ctx.channel.id}>!' +
-                                    ('' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!'))
-                except:
-                    pass
-            if len(self.queue[aid]) > 5:
-                # Also send a message to the fifth person in the queue
-                try:
-                    member = await ctx.guild.fetch_member(self.queue[aid][4])
-                    await self.bot.dm(member,
-                                    f'Your patience will soon be rewarded, {member.name}... You\'re fifth in line for the queue in <#{ctx.channel.id}>!' +
-                                    '' if getvoicechan(member) else ' Please join a general voice channel so you can be moved!')
-                except:
-                    pass
-    
-    def cleanPrev(self, ctx):
-        try:
-            prevStudent = self.assigned.get(ctx.author.id)
-            self.remove(prevStudent.id)
-        except:
-            pass
+        # move the students to the callee's voice channel, and store them
+        # as assigned for the caller.
+        students = []
+        for uid, member in claimed:
+            student = self.studentsQueued.setdefault(
+                uid, MultiReviewQueue.Student(uid))
+            student.oldVC = getvoicechan(member)
+            student.check = aid
+            student.mask &= ~self.bit(aid)  # parallels the pop in self.queue[aid]
+            student.qid = self.qid
+            students.append(student)
+        self.assigned[ctx.author.id] = students
+        failed = await self.moveall(ctx, cv, [member for _, member in claimed])
+        if failed:
+            await ctx.send(
+                f'Failed to move {", ".join(m.mention for m in failed)} into voice channel. Putback in queue', delete_after=5)
+            await self.putback(ctx, 10, {member.id for member in failed})
 
-    async def putback(self, ctx, pos):
-        ''' Put the student you currently have in your voice channel back in the queue.'''
-        student = self.assigned.get(
-            ctx.author.id, None)
-        if not student:
+    def cleanPrev(self, ctx):
+        ''' Remove the students previously taken by this TA from all queues. '''
+        for student in self.assigned.get(ctx.author.id, ()):
+            self.remove(student.id)
+
+    async def putback(self, ctx, pos, uids=None):
+        ''' Put the students you currently have in your voice channel back in the queue.
+            When uids is given, only those students are put back. '''
+        assigned = self.assigned.get(ctx.author.id)
+        if not assigned:
             await ctx.send(f'<@{ctx.author.id}>: You don\'t have a student assigned to you yet!', delete_after=10)
+            return
+        back = [student for student in assigned if uids is None or student.id in uids]
+        self.assigned[ctx.author.id] = [student for student in assigned if student not in back]
+        if self.assigned[ctx.author.id]:
+            self.reduceservice(ctx.author.id, len(back))
         else:
-            uid = student.id
+            # Nobody is left in this review session
+            self.releasechannel(ctx)
+            self.endservice(ctx.author.id)
+        now = time.time()
+        for student in reversed(back):
             checking = student.check
-            self.queue[checking].insert(pos, uid)
-            if checking not in student.aid:
-                student.aid.append(checking)
-                student.aid.sort()
+            if checking not in self.queue:
+                # This queue was closed in the meantime
+                continue
+            self.queue[checking].insert(pos, student.id)
+            self.inserted(checking, pos)
+            self.requeued((checking, student.id), now)
+            student.mask |= self.bit(checking)
+            self.studentsQueued.setdefault(student.id, student)
+            self.touched(checking)
+        self.changed()
+
+        async def moveback(student):
             try:
-                member = await ctx.guild.fetch_member(uid)
+                member = await ctx.guild.fetch_member(student.id)
                 if readymovevoice(member):
                     await member.edit(voice_channel=student.oldVC)
                 await self.bot.dm(member, 'You were moved back into the queue, probably because you didn\'t respond.')
             except:
                 pass
+        await asyncio.gather(*(moveback(student) for student in back))
 
-    async def updateIndicator(self, ctx):
-        '''Floating indicator displaying next in line and length of queue. Not implemented for MultiReview
-
-        Not a command invoked by a user, but by changes in the queue.'''
+    def indicatorembed(self):
+        ''' Indicator with the length and next in line of every queue. '''
         title = "Queue Tracker Widget"
         fieldData = []
         for i in self.assignments:
@@ -575,6 +1244,9 @@ class MultiReviewQueue(Queue):
                 'Next three in queue:\n'
             for idx, member in enumerate(self.queue[i][:3]):
                 fieldtext += f'{idx+1}: <@{member}>\n'
+            wait = self.aidwait(i, len(self.queue[i]))
+            if wait is not None:
+                fieldtext += f'**Expected wait:** {fmtduration(wait)}\n'
             fieldData.append((fieldname, fieldtext))
         footer = 'Type `!ready <queue number>` to enter the queue when you also want to hand in your assignment!'
 
@@ -593,21 +1265,17 @@ class MultiReviewQueue(Queue):
                 colour=0xae8b0c
             )
         embed.set_author(name=title)
-
-        # Delete previous indicator
-        if self.indicator is not None:
-            await self.indicator.delete()
-
-        # Send new indicator
-        self.indicator = await ctx.channel.send(embed=embed)
+        return embed
 
 
     async def startReviewing(self, ctx, aid):
         """Adds a queue to the list of allowed queues and updates the indicator"""
         if aid not in self.assignments:
             self.assignments.append(aid)
-            self.queue[aid] = []
+            self.queue[aid] = array(UIDTYPE)
+            self.bit(aid)
             self.assignments.sort()
+            self.changed()
             await self.updateIndicator(ctx)
             await ctx.send(f'Added queue for assignment {aid}', delete_after=5)
         else:
@@ -617,10 +1285,17 @@ class MultiReviewQueue(Queue):
     async def stopReviewing(self, ctx, aid):
         """Removes a queue, and clears it."""
         if aid in self.assignments:
-            for uid in self.queue[aid]:
-                self.studentsQueued[uid].aid.remove(aid)
-            self.queue.pop(aid)
+            bit = self.aidbits.pop(aid, 0)
+            for uid in self.queue.pop(aid):
+                student = self.studentsQueued[uid]
+                student.mask &= ~bit
+                self.enqueued.pop((aid, uid), None)
+                # Forget students that are no longer in any queue
+                if not student.mask:
+                    del self.studentsQueued[uid]
             self.assignments.remove(aid)
+            self.touched(aid)
+            self.changed()
             await self.updateIndicator(ctx)
             await ctx.send(f'Removed queue for assignment {aid}. Queue cleared.', delete_after=5)
         else:
@@ -629,49 +1304,170 @@ class MultiReviewQueue(Queue):
 
 class QuestionQueue(Queue):
     qtype = 'Question'
+    # Minimum similarity of a new question to an open question to suggest
+    # following the open question instead
+    similarity = 0.6
 
     class Question:
         def __init__(self, askedby, qmsg, disc_msg=None):
             self.qmsg = qmsg
             self.disc_msg = disc_msg
             self.followers = [askedby]
+            self.asked = time.time()
+            # The archive entry of the answer
+            self.entry = None
+
+    # Minimum similarity of an archived answer to a new question to suggest
+    # it to the student
+    suggestsimilarity = 0.3
+    # Number of recent answers kept in memory
+    maxanswers = 20
+    # Number of questions per page of the question list
+    pagesize = 15
+    # Amendments within this many seconds are combined in one edit of the
+    # answer message. By default each amendment is shown immediately
+    amendwindow = float(os.getenv('EDUBOT_AMEND_WINDOW', 0))
 
     def __init__(self, qid, guildname, channame):
         super().__init__(qid, guildname, channame)
         self.queue = OrderedDict()
         self.answers = dict()
         self.maxidx = 0
+        # Index of the open questions, to find near-duplicates
+        self.textindex = TextIndex()
+        self._archive = None
+        # Index of the archived answers, built on first use
+        self.answerindex = None
+        # Amended answers waiting to be shown, by question index
+        self.amending = dict()
+        # The open questions followed by each user
+        self.following = defaultdict(set)
+        # Cached question list, see listing()
+        self._listing = None
+
+    def busy(self, now=None):
+        # Question messages and amendments waiting to be shown are not
+        # saved to file, answers are archived
+        return bool(self.queue or self.amending)
+
+    @property
+    def archive(self):
+        ''' The archive of answered questions of this queue. '''
+        if self._archive is None:
+            self._archive = QuestionArchive(Queue.storage.datadir.joinpath(
+                'archive', f'{self.qid[0]}-{self.qid[1]}'))
+        return self._archive
+
+    def buildanswerindex(self):
+        ''' Build the text index of all archived answers. '''
+        index = TextIndex()
+        for entry in self.archive.entries():
+            index.add(entry['id'], QuestionArchive.text(entry))
+        return index
+
+    def indexanswer(self, entry):
+        ''' Add a new or amended answer to the answer index. '''
+        if self.answerindex is not None:
+            self.answerindex.add(entry['id'], QuestionArchive.text(entry))
+
+    async def suggest(self, ctx, askedby, qmsg):
+        ''' Offer archived answers that are similar to question qmsg. '''
+        if self.answerindex is None:
+            self.answerindex = await Queue.storage.run(self.buildanswerindex)
+        matches = self.answerindex.search(qmsg, n=3, threshold=self.suggestsimilarity)
+        if not matches:
+            return
+        entries = await Queue.storage.run(
+            lambda: [self.archive.get(eid) for eid, _ in matches])
+        msg = ''
+        for entry in entries:
+            answer = entry['answer'] or 'Answered in a voice channel'
+            amendments = ''.join(f' {text}' for _, text in entry['amendments'])
+            msg += f'**{entry["question"]}**\n{shorten(answer + amendments, 300)}\n\n'
+        embed = discord.Embed(title="Earlier answers to similar questions:",
+                              description=msg, colour=0x3939cf)
+        await ctx.send(f'<@{askedby}>: Maybe one of these answers already helps you while you wait!',
+                       embed=embed, delete_after=120)
 
     def fromfile(self, qdata):
         ''' Build queue from data out of json file. '''
-        idx = -1
-        for idx, (qmsg, qf) in enumerate(qdata):
+        for pos, (qmsg, qf, *stored) in enumerate(qdata):
+            # Older files don't store the question index
+            idx = stored[0] if stored else pos + 1
             question = QuestionQueue.Question(0, qmsg)
             question.followers = qf
-            self.queue[idx+1] = question
-        self.maxidx = idx + 1
+            self.queue[idx] = question
+            self.textindex.add(idx, qmsg)
+            for uid in qf:
+                self.following[uid].add(idx)
+            self.maxidx = max(self.maxidx, idx)
+        self._listing = None
 
     def tofile(self):
         ''' Return queue data for storage in json file. '''
-        return [(q.qmsg, q.followers) for q in self.queue.values()]
+        return [(q.qmsg, list(q.followers), idx) for idx, q in self.queue.items()]
+
+    def tojson(self):
+        # Indices of answered questions are not reused, so that amendments
+        # can't end up at an older archived answer
+        return dict(super().tojson(), maxidx=self.maxidx)
+
+    def listing(self):
+        ''' Return the lines of the question list, and the position of each
+            question in it. The list is rebuilt after the queue changes. '''
+        if self._listing is None:
+            lines = [f'**- {qidx:02d}:** {shorten(qstn.qmsg, 200)}'
+                     for qidx, qstn in self.queue.items()]
+            positions = {qidx: pos for pos, qidx in enumerate(self.queue)}
+            self._listing = (lines, positions)
+        return self._listing
+
+    def oldest(self):
+        for qstn in self.queue.values():
+            return qstn.asked
+        return None
+
+    def npages(self):
+        ''' Return the number of pages of the question list. '''
+        return max(1, -(-len(self.queue) // self.pagesize))
+
+    def page(self, uid, page=1):
+        ''' Return page number page of the question list, marking the
+            questions followed by user uid. '''
+        lines, positions = self.listing()
+        first = (page - 1) * self.pagesize
+        lines = lines[first:first + self.pagesize]
+        for qidx in self.following.get(uid, ()):
+            pos = positions[qidx] - first
+            if 0 <= pos < len(lines):
+                lines[pos] += ' (already following)'
+        return '\n'.join(lines)
+
+    async def questions(self, ctx, page=1):
+        ''' Show a page of the list of questions in this queue. '''
+        if not self.queue:
+            await ctx.send('There are no questions in the queue!', delete_after=20)
+            return
+        npages = self.npages()
+        page = min(max(page, 1), npages)
+        msg = '**The following questions can be followed:**\n\n' + \
+            self.page(ctx.author.id, page)
+        embed = discord.Embed(title="Questions in this queue:",
+                              description=msg, colour=0x3939cf)
+        if npages > 1:
+            embed.set_footer(text=f'Page {page}/{npages}. Use !questions <page> to see other pages.')
+        await ctx.channel.send(embed=embed, delete_after=30)
 
     async def follow(self, ctx, idx=None):
         """ Follow a question. """
+        if idx is None:
+            await self.questions(ctx)
+            return
         if not self.queue:
             await ctx.send('There are no questions in the queue!', delete_after=20)
             return
 
         member = ctx.author.id
-        if idx is None:
-            msg = '**The following questions can be followed:**\n\n'
-            for qidx, qstn in self.queue.items():
-                msg = msg + f'**- {qidx:02d}:** {qstn.qmsg}' + \
-                    (' (already following)\n' if member in qstn.followers else '\n')
-            embed = discord.Embed(title="Questions in this queue:",
-                                  description=msg, colour=0x3939cf)
-            await ctx.channel.send(embed=embed, delete_after=30)
-            return
-
         question = self.queue.get(idx, None)
         if question is None:
             msg = f'Hi <@{member}>! There\'s no question in the queue with index {idx}!'
@@ -679,14 +1475,44 @@ class QuestionQueue(Queue):
             msg = f'You are already following question {idx} <@{member}>!'
         else:
             question.followers.append(member)
+            self.following[member].add(idx)
+            self.changed()
             msg = f'You are now following question {idx} <@{member}>!'
         await ctx.send(msg, delete_after=20)
 
-    async def add(self, ctx, askedby, qmsg):
-        ''' Add question to this queue. '''
+    def unlist(self, idx):
+        ''' Remove question idx from the open questions. '''
+        qstn = self.queue.pop(idx)
+        self.textindex.remove(idx)
+        self._listing = None
+        for uid in qstn.followers:
+            followed = self.following.get(uid)
+            if followed is not None:
+                followed.discard(idx)
+                if not followed:
+                    del self.following[uid]
+        return qstn
+
+    def similar(self, qmsg):
+        ''' Find the open question most similar to qmsg.
+            Returns: the index of that question, or None if no open question
+            is similar enough. '''
+        match = self.textindex.search(qmsg, n=1, threshold=self.similarity)
+        return match[0][0] if match else None
+
+    async def add(self, ctx, askedby, qmsg, force=False):
+        ''' Add question to this queue. Unless force is True, near-duplicates
+            of open questions are not added; instead the student is offered
+            to follow the open question. '''
         if not qmsg:
             await ctx.send('You can\'t ask without a question!', delete_after=10)
             return
+        idx = None if force else self.similar(qmsg)
+        if idx is not None:
+            msg = f'<@{askedby}>: Your question looks like question {idx}: *{self.queue[idx].qmsg}*\n' + \
+                f'Use `!follow {idx}` to follow that question, or `!askanyway <question>` if your question is different.'
+            await ctx.send(msg, delete_after=30)
+            return
         self.maxidx += 1
         content = f'**Question:** {qmsg}\n\n**Asked by:** <@{askedby}>'
         embed = discord.Embed(title=f"Question {self.maxidx}:",
@@ -694,146 +1520,308 @@ class QuestionQueue(Queue):
         disc_msg = await ctx.send(embed=embed)
         self.queue[self.maxidx] = QuestionQueue.Question(
             askedby, qmsg, disc_msg)
+        self.textindex.add(self.maxidx, qmsg)
+        self.following[askedby].add(self.maxidx)
+        self._listing = None
+        self.changed()
         msg = f'<@{askedby}>: Your question is added at position {len(self.queue)} with index {self.maxidx}'
         await ctx.send(msg, delete_after=10)
+        await self.suggest(ctx, askedby, qmsg)
+
+    def answerembed(self, entry):
+        ''' Build the answer message embed of an archived answer. '''
+        if entry['answer']:
+            content = f'**Question:** {entry["question"]}\n\n**Answer:** {entry["answer"]}\n\n'
+        else:
+            content = f'**Question:** {entry["question"]}\n\nQuestion {entry["idx"]} will be answered in voice channel <#{entry["voice"]}>\n\n'
+        for uid, amendment in entry['amendments']:
+            content += f'**Amendment from <@{uid}>: ** {amendment}\n\n'
+        content += f'**Answered by: **<@{entry["answeredby"]}>'
+        colour = 0x2cc533 if entry['amendments'] else 0x25a52b
+        return discord.Embed(title=f"Answer to question {entry['idx']}:",
+                             description=content, colour=colour)
 
     async def answer(self, ctx, idx, answer=None):
         if idx not in self.queue:
             await ctx.send(f'<@{ctx.author.id}>: No question in the queue with index {idx}!', delete_after=20)
+            return
 
-        elif answer:
-            # This is a text-based answer
-            qstn = self.queue.pop(idx)
-            # Delete the question message
-            if qstn.disc_msg is not None:
-                await qstn.disc_msg.delete()
-            # Create the answer message
-            content = f'**Question:** {qstn.qmsg}\n\n**Answer:** {answer}\n\n' + \
-                f'**Answered by: **<@{ctx.author.id}>'
-            msg = '**Followers:** ' + \
-                  ', '.join([f'<@{uid}>' for uid in qstn.followers])
-            embed = discord.Embed(title=f"Answer to question {idx}:",
-                                  description=content, colour=0x25a52b)  # 0x41f109
-            # Store the answer message object for possible later amendments
-            qstn.disc_msg = await ctx.channel.send(msg, embed=embed)
-            self.answers[idx] = qstn
-
-            # Say something nice if student answers his/her own question
-            if qstn.followers[0] == ctx.author.id:
-                await ctx.send(f'Well done <@{ctx.author.id}>! You solved your own question!', delete_after=20)
-
-        else:
+        cv = None
+        if not answer:
             # The question will be answered in a voice chat
             cv = getvoicechan(ctx.author)
             if cv is None:
                 await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=20)
                 return
 
-            qstn = self.queue.pop(idx)
-            if qstn.disc_msg is not None:
-                await qstn.disc_msg.delete()
-            content = f'**Question:** {qstn.qmsg}\n\nQuestion {idx} will be answered in voice channel <#{cv.id}>\n\n' + \
-                f'**Answered by: **<@{ctx.author.id}>'
-            embed = discord.Embed(title=f"Answer to question {idx}:",
-                                  description=content, colour=0x25a52b)
-            msg = '**Followers:** ' + \
-                  ', '.join([f'<@{uid}>' for uid in qstn.followers])
-            # Store the answer message object for possible later amendments
-            qstn.disc_msg = await ctx.channel.send(msg, embed=embed)
-            self.answers[idx] = qstn
+        qstn = self.unlist(idx)
+        self.changed()
+        entry = dict(idx=idx, question=qstn.qmsg, followers=list(qstn.followers),
+                     answer=answer, voice=cv and cv.id, answeredby=ctx.author.id,
+                     amendments=[], time=time.time())
+        mentions = ', '.join([f'<@{uid}>' for uid in qstn.followers])
+        embed = self.answerembed(entry)
+        # Turn the question message into the answer
+        answered = await self.editanswer(qstn.disc_msg, embed, content=f'**Followers:** {mentions}')
+        if answered is None:
+            # Without a question message, the answer message pings the followers
+            qstn.disc_msg = await ctx.channel.send(f'**Followers:** {mentions}', embed=embed)
+        else:
+            # Mentions added in an edit don't notify, so ping followers in a reply
+            qstn.disc_msg = answered
+            await ctx.channel.send(f'{mentions}: question {idx} is answered!',
+                                   reference=answered, mention_author=False)
+        entry['messageid'] = qstn.disc_msg.id
+        qstn.entry = await Queue.storage.run(self.archive.add, entry)
+        self.indexanswer(qstn.entry)
+        self.answers[idx] = qstn
+        # Older answers are only kept in the archive
+        while len(self.answers) > self.maxanswers:
+            self.answers.pop(next(iter(self.answers)))
+
+        # Say something nice if student answers his/her own question
+        if answer and qstn.followers[0] == ctx.author.id:
+            await ctx.send(f'Well done <@{ctx.author.id}>! You solved your own question!', delete_after=20)
+
+    @staticmethod
+    async def editanswer(msg, embed, **kwargs):
+        ''' Edit message msg to show embed.
+            Returns: msg, or None when the message no longer exists. '''
+        if msg is None:
+            return None
+        try:
+            await msg.edit(embed=embed, **kwargs)
+        except discord.NotFound:
+            return None
+        return msg
 
     async def amend(self, ctx, idx, amendment=''):
-        ''' Amend the answer to question with index idx. '''
+        ''' Amend the answer to question with index idx. Amendments within
+            amendwindow seconds are shown in a single edit. '''
+        pending = self.amending.get(idx)
         qstn = self.answers.get(idx, None)
-        if qstn is None:
+        if pending is not None:
+            entry, msg = pending
+        elif qstn is not None:
+            entry, msg = qstn.entry, qstn.disc_msg
+        else:
+            # Answers that are no longer in memory are looked up in the archive
+            entry = await Queue.storage.run(self.archive.find, idx)
+            msg = entry and ctx.channel.get_partial_message(entry['messageid'])
+        if entry is None:
             await ctx.send(f'<@{ctx.author.id}>: No answered question found with index {idx}', delete_after=20)
             return
 
-        msg = qstn.disc_msg
-        embed = msg.embeds[0]
-        title = embed.title
-        colour = 0x2cc533  # embed.colour
-        content = embed.description
-        inspos = content.find('**Answered by: **')
-        # Delete the original answer
-        await msg.delete()
-        # and create an amended one
-        newcontent = content[:inspos] + \
-            f'**Amendment from <@{ctx.author.id}>: ** {amendment}\n\n' + \
-            content[inspos:]
-        newembed = discord.Embed(title=title,
-                                 description=newcontent, colour=colour)
-        msg = '**Followers:** ' + \
-            ', '.join([f'<@{uid}>' for uid in qstn.followers])
-        qstn.disc_msg = await ctx.channel.send(msg, embed=newembed)
+        entry['amendments'] = entry['amendments'] + [[ctx.author.id, amendment]]
+        if self.amendwindow <= 0:
+            await self.showamended(ctx.channel, entry, msg)
+        elif pending is None:
+            self.amending[idx] = (entry, msg)
+            asyncio.get_event_loop().call_later(
+                self.amendwindow,
+                lambda: asyncio.ensure_future(self.flushamend(ctx.channel, idx)))
+
+    async def flushamend(self, channel, idx):
+        ''' Show the amendments to answer idx made within the window. '''
+        entry, msg = self.amending.pop(idx)
+        await self.showamended(channel, entry, msg)
+
+    async def showamended(self, channel, entry, msg):
+        ''' Edit the answer message to show amended entry, and store it. '''
+        embed = self.answerembed(entry)
+        shown = await self.editanswer(msg, embed)
+        if shown is None:
+            # The answer message is gone; post the amended answer again
+            shown = await channel.send(embed=embed)
+            entry['messageid'] = shown.id
+        qstn = self.answers.get(entry['idx'])
+        if qstn is not None and qstn.entry is entry:
+            qstn.disc_msg = shown
+        await Queue.storage.run(self.archive.update, dict(entry))
+        self.indexanswer(entry)
+
+    async def search(self, ctx, terms):
+        ''' Search the answered questions of this queue. '''
+        if not terms:
+            await ctx.send('What do you want to search for?', delete_after=10)
+            return
+        entries = await Queue.storage.run(self.archive.search, terms)
+        if not entries:
+            await ctx.send(f'No answered questions found for *{terms}*', delete_after=20)
+            return
+        msg = ''
+        for entry in entries:
+            answer = entry['answer'] or f'Answered in voice channel <#{entry["voice"]}>'
+            amendments = ''.join(f' {text}' for _, text in entry['amendments'])
+            msg += f'**{entry["idx"]:02d}: {entry["question"]}**\n{shorten(answer + amendments, 200)}\n\n'
+        embed = discord.Embed(title=f"Answered questions matching '{terms}':",
+                              description=msg, colour=0x3939cf)
+        await ctx.send(embed=embed, delete_after=120)
 
     def whereis(self, uid):
         ''' Find questions followed by user with id 'uid' in this queue. '''
         qlst = []
-        for pos, (idx, qstn) in enumerate(self.queue.items()):
-            if uid in qstn.followers:
-                if qstn.followers[0] == uid:
-                    qlst.append(f'Your own question ({idx}) at position {pos}')
-                else:
-                    qlst.append(f'Question {idx} at position {pos}')
+        _, positions = self.listing()
+        for idx in sorted(self.following.get(uid, ()), key=positions.get):
+            pos = positions[idx]
+            if self.queue[idx].followers[0] == uid:
+                qlst.append(f'Your own question ({idx}) at position {pos}')
+            else:
+                qlst.append(f'Question {idx} at position {pos}')
         if not qlst:
             return f'You are not following questions in this channel <@{uid}>!'
         return f'Questions followed by <@{uid}>:\n' + '\n'.join(qlst)
 
 
 class QueueCog(commands.Cog, name='Queue'):
+    # Commands that are rate limited per student and queue
+    throttled = {'queueme', 'removeme', 'whereami', 'ask', 'askanyway',
+                 'follow', 'questions', 'search', 'notifyme'}
+
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
         Queue.bot = bot
-        Queue.datadir = bot.datadir.joinpath('queues')
-        if not Queue.datadir.exists():
-            Queue.datadir.mkdir()
+        Queue.storage = bot.storage
+        Queue.outbox = Outbox(Queue.notify, onerror=bot.on_error)
+        Queue.buildindex()
+        self.evictor = None
 
     def cog_unload(self):
         # Save all queues upon exit
         print('Unloading QueueCog')
         Queue.saveall()
+        for pool in BreakoutPool.pools.values():
+            pool.stop()
+        if self.evictor is not None:
+            self.evictor.cancel()
         return super().cog_unload()
 
+    async def cog_check(self, ctx):
+        # Rate limit the commands of each student in each queue
+        if ctx.guild is None or ctx.command.name not in self.throttled or \
+                ctx.author.guild_permissions.administrator:
+            return True
+        queue = Queue.queues.get((ctx.guild.id, ctx.channel.id))
+        if queue is None or queue.throttle.allow(ctx.author.id):
+            return True
+        raise Throttled()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Queues replayed by a standby can only find their indicator now
+        for qid, msgid in Queue.detached.items():
+            if qid in Queue.queues and Queue.queues[qid].indicator is None:
+                Queue.queues[qid].reattach(msgid)
+        Queue.detached.clear()
+        # The same holds for the channels of their breakout pools
+        for qid, data in list(BreakoutPool.detached.items()):
+            if qid in Queue.queues:
+                Queue.queues[qid].restorepool(data)
+        if self.evictor is None:
+            self.evictor = self.bot.loop.create_task(self.evictidle())
+
+    async def evictidle(self):
+        ''' Background task that unloads idle queues. '''
+        while True:
+            await asyncio.sleep(60)
+            await Queue.evictidle()
+
+    @commands.command()
+    @commands.check(Queue.qcheck)
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def breakouts(self, ctx, spare: int = 3):
+        """ Admin command: keep breakout voice channels ready for TAs.
+
+            TAs in this category get their own breakout channel when they
+            take a student, and it is recycled when they are done. The
+            channels are saved with the queue in this channel.
+
+            Arguments:
+            - spare: The number of spare channels to keep ready. (optional,
+              default=3). Use 0 to stop using breakout channels.
+        """
+        category = ctx.channel.category
+        if category is None:
+            await ctx.send('Breakout channels can only be used in a channel category!', delete_after=10)
+            return
+        pool = BreakoutPool.pools.get(category.id)
+        if spare <= 0:
+            if pool is not None:
+                # The channels are deleted as soon as they are empty
+                pool.close()
+                pool.start(self.bot.loop)
+            await ctx.send(f'Stopped using breakout channels in {category.name}.', delete_after=10)
+            return
+        if pool is None:
+            qid = (ctx.guild.id, ctx.channel.id)
+            pool = BreakoutPool.pools[category.id] = BreakoutPool(
+                category, spare, owner=qid, onchange=partial(Queue.poolchanged, qid))
+        pool.closing = False
+        pool.spare = spare
+        pool.changed()
+        pool.start(self.bot.loop)
+        pool.wakeup.set()
+        await ctx.send(f'Keeping {spare} breakout channels ready in {category.name}.', delete_after=10)
+
     @commands.command()
     @commands.has_permissions(administrator=True)
     async def loadallqueues(self, ctx):
         ''' Load all queues that were previously stored to disk. '''
-        await ctx.send(Queue.loadall())
+        await ctx.send(await Queue.loadall())
+        # Show the current state in the reattached indicators
+        await asyncio.gather(*(queue.refreshIndicator()
+                               for queue in Queue.queues.values()),
+                             return_exceptions=True)
 
     @commands.group(invoke_without_command=True)
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
     @commands.has_permissions(administrator=True)
-    async def takenext(self, ctx, aid=None):
+    async def takenext(self, ctx, *args):
         """ Take the next in line from the queue.
 
-        Optional argument:
-         - aid: supply which assignment was checked for previous student.
+        Optional arguments:
+         - Review queues: `!takenext [n]`
+         - MultiReview queues: `!takenext [aid] [n]`
+         - aid: the assignment queue to take from. Use `any` (or leave out) to
+           let the bot pick a queue.
+         - n: take the first n ready students at once, for group reviews.
 
         Optional subcommand:
          - `!takenext all` removes previous student from all queues."""
-        qid = (ctx.guild.id, ctx.channel.id)
-        await Queue.queues[qid].takenext(ctx, aid)
-        await Queue.queues[qid].updateIndicator(ctx)
+        await self.taken(ctx, args)
 
     @takenext.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, 'MultiReview'))
     @commands.has_permissions(administrator=True)
-    async def all(self, ctx, aid=None):
+    async def all(self, ctx, *args):
         qid = (ctx.guild.id, ctx.channel.id)
         Queue.queues[qid].cleanPrev(ctx)
-        await Queue.queues[qid].takenext(ctx, aid)
-        await Queue.queues[qid].updateIndicator(ctx)
+        await self.taken(ctx, args)
+
+    @staticmethod
+    async def taken(ctx, args):
+        ''' Parse the arguments of !takenext and take the students. '''
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        if queue.qtype != 'MultiReview':
+            args = (None,) + args
+        aid = args[0] if args and args[0] != 'any' else None
+        try:
+            n = int(args[1]) if len(args) > 1 else 1
+        except ValueError:
+            raise commands.BadArgument(f'{args[1]} is not a number')
+        await queue.takenext(ctx, aid, max(1, n))
+        await queue.updateIndicator(ctx)
 
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
     @commands.has_permissions(administrator=True)
     async def putback(self, ctx, pos: int = 10):
-        ''' Put the student you currently have in your voice channel back in the queue.
+        ''' Put the students you currently have in your voice channel back in the queue.
 
             Arguments:
-            - pos: The position in the queue to put the student. (optional)
+            - pos: The position in the queue to put the students. (optional)
               Default position is 10. '''
         qid = (ctx.guild.id, ctx.channel.id)
         await Queue.queues[qid].putback(ctx, pos)
@@ -848,7 +1836,10 @@ class QueueCog(commands.Cog, name='Queue'):
             - qtype: The type of queue to create. (optional, default=Review)
         """
         qid = (ctx.guild.id, ctx.channel.id)
+        # Load a saved queue of this channel first, so it isn't overwritten
+        await Queue.get(qid)
         await ctx.send(Queue.makequeue(qid, qtype, ctx.guild.name, ctx.channel.name))
+        Queue.queues[qid].changed()
         await Queue.queues[qid].updateIndicator(ctx)
 
     @commands.command()
@@ -856,29 +1847,41 @@ class QueueCog(commands.Cog, name='Queue'):
     @commands.has_permissions(administrator=True)
     async def savequeue(self, ctx):
         """ Save the queue in this channel. """
-        Queue.queues[(ctx.guild.id, ctx.channel.id)].save()
+        await Queue.queues[(ctx.guild.id, ctx.channel.id)].save()
 
     @commands.command()
     @commands.has_permissions(administrator=True)
     async def loadqueue(self, ctx):
         """ Load this channel's queue from disk. """
-        await ctx.send(Queue.load((ctx.guild.id, ctx.channel.id)))
+        qid = (ctx.guild.id, ctx.channel.id)
+        await ctx.send(await Queue.load(qid))
+        if qid in Queue.queues:
+            await Queue.queues[qid].refreshIndicator()
 
     @commands.command(aliases=('ready', 'done'))
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
     async def queueme(self, ctx, *args):
         """ Add me to the queue in this channel. """
-        qid = (ctx.guild.id, ctx.channel.id)
-        await Queue.queues[qid].add(ctx, ctx.author.id, *args)
-        await Queue.queues[qid].updateIndicator(ctx)
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        if queue.queued(ctx.author.id, *args):
+            # Nothing changes, so just tell where the student is
+            queue.throttle.count('redundant')
+            await queue.reply(ctx, queue.whereis(ctx.author.id))
+            return
+        await queue.add(ctx, ctx.author.id, *args)
+        await queue.updateIndicator(ctx)
 
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
     async def removeme(self, ctx, *args):
         """ Remove me from the queue in this channel. """
-        qid = (ctx.guild.id, ctx.channel.id)
-        await ctx.send(Queue.queues[qid].remove(ctx.author.id, *args), delete_after=10)
-        await Queue.queues[qid].updateIndicator(ctx)
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        if not queue.queued(ctx.author.id, *args):
+            queue.throttle.count('redundant')
+            await queue.reply(ctx, queue.remove(ctx.author.id, *args))
+            return
+        await ctx.send(queue.remove(ctx.author.id, *args), delete_after=10)
+        await queue.updateIndicator(ctx)
 
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
@@ -905,6 +1908,19 @@ class QueueCog(commands.Cog, name='Queue'):
         qmsg = re_ask.match(ctx.message.content).groups()[0]
         await Queue.queues[qid].add(ctx, ctx.author.id, qmsg)
 
+    @commands.command(rest_is_raw=True)
+    @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
+    async def askanyway(self, ctx):
+        """ Ask a question, also when it looks like a question that is
+            already in the queue.
+
+            Arguments:
+            - question: The question you want to ask.
+        """
+        qid = (ctx.guild.id, ctx.channel.id)
+        qmsg = re_ask.match(ctx.message.content).groups()[0]
+        await Queue.queues[qid].add(ctx, ctx.author.id, qmsg, force=True)
+
     @commands.command(rest_is_raw=True)
     @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
     async def answer(self, ctx, idx: int):
@@ -934,6 +1950,28 @@ class QueueCog(commands.Cog, name='Queue'):
         amstring = ctx.message.content[offset:].strip()
         await Queue.queues[qid].amend(ctx, idx, amstring)
 
+    @commands.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
+    async def questions(self, ctx, page: int = 1):
+        ''' Show the questions in this channel.
+
+            Arguments:
+            - page: The page of the question list to show (optional).
+        '''
+        qid = (ctx.guild.id, ctx.channel.id)
+        await Queue.queues[qid].questions(ctx, page)
+
+    @commands.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
+    async def search(self, ctx, *, terms=''):
+        ''' Search the answered questions in this channel.
+
+            Arguments:
+            - terms: The words to search for.
+        '''
+        qid = (ctx.guild.id, ctx.channel.id)
+        await Queue.queues[qid].search(ctx, terms)
+
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
     async def follow(self, ctx, idx: int = None):
@@ -946,12 +1984,40 @@ class QueueCog(commands.Cog, name='Queue'):
         qid = (ctx.guild.id, ctx.channel.id)
         await Queue.queues[qid].follow(ctx, idx)
 
+    @commands.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
+    async def notifyme(self, ctx, *positions):
+        """ Choose when you get a DM about your place in the queue of this channel.
+
+            Arguments:
+            - positions: The numbers of people in front of you at which you
+              want a DM, e.g. '!notifyme 10 0' (0 means you are next). Use
+              '!notifyme off' to get no DMs. (optional: if no positions are
+              given, your current choice is shown)
+        """
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        uid = ctx.author.id
+        if positions:
+            if positions == ('off',):
+                positions = ()
+            elif not all(pos.isdigit() and int(pos) < 100 for pos in positions):
+                await queue.reply(ctx, f'<@{uid}>: Positions should be numbers below 100, or \'off\'.')
+                return
+            queue.subscribe(uid, sorted({int(pos) for pos in positions}, reverse=True))
+            queue.changed()
+        chosen = queue.subscriptions.get(uid, queue.notifyat)
+        if chosen:
+            msg = f'<@{uid}>: You get a DM when there are {", ".join(map(str, chosen))} people in front of you.'
+        else:
+            msg = f'<@{uid}>: You don\'t get DMs about your place in this queue.'
+        await queue.reply(ctx, msg)
+
     @commands.command()
     @commands.check(Queue.qcheck)
     async def whereami(self, ctx):
         """ What's my position in the queue of this channel. """
-        uid = ctx.author.id
-        await ctx.send(Queue.queues[(ctx.guild.id, ctx.channel.id)].whereis(uid), delete_after=10)
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        await queue.reply(ctx, queue.whereis(ctx.author.id))
 
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review',  'MultiReview']))
@@ -973,6 +2039,74 @@ class QueueCog(commands.Cog, name='Queue'):
             await Queue.queues[qid].add(ctx, member.id)
         await Queue.queues[qid].updateIndicator(ctx)
 
+    @commands.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
+    @commands.has_permissions(administrator=True)
+    async def queuestats(self, ctx):
+        """ Admin command: show throughput, wait times and active TAs. """
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        description = f'**Active TAs:** {queue.activetas()}'
+        if queue.qtype == 'MultiReview':
+            description += f'\n**Queue selection:** {queue.selector.name}'
+        embed = discord.Embed(title=f'Statistics for the queue in #{ctx.channel.name}',
+                              description=description, colour=0xae8b0c)
+        for name, text in queue.statistics():
+            embed.add_field(name=name, value=text, inline=True)
+        embed.add_field(name='Student commands', value=queue.throttle.metrics(),
+                        inline=False)
+        await ctx.send(embed=embed, delete_after=60)
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def dashboard(self, ctx):
+        """ Admin command: show a live overview of all queues in this server. """
+        old = Dashboard.dashboards.get(ctx.guild.id)
+        if old is not None:
+            old.stop()
+        # Start from the loaded queues, other queues are added when they change
+        queues = [queue for qid, queue in Queue.queues.items() if qid[0] == ctx.guild.id]
+        dashboard = Dashboard(ctx.guild.id, {queue.qid: queue.summary() for queue in queues})
+        Dashboard.dashboards[ctx.guild.id] = dashboard
+        for queue in queues:
+            queue.watchtas()
+        dashboard.message = await ctx.send(embed=dashboard.embed())
+        if dashboard.waiting:
+            dashboard.schedule(time.time() + dashboard.refreshinterval)
+
+    @commands.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, 'MultiReview'))
+    @commands.has_permissions(administrator=True)
+    async def strategy(self, ctx, name=None, *weights):
+        """ Admin command: choose how !takenext picks a queue when no
+            assignment is given.
+
+            Arguments:
+            - name: 'oldest' (longest waiting student first), 'longest'
+              (longest queue first) or 'first' (lowest assignment first).
+              (optional: if no name is given, the current strategy is shown)
+            - weights: per-assignment weights as aid=weight (optional). For
+              'longest' queue lengths are multiplied by the weight, for
+              'oldest' the weight is a head start in seconds.
+        """
+        queue = Queue.queues[(ctx.guild.id, ctx.channel.id)]
+        if name is None:
+            await ctx.send(f'Queues are selected with the {queue.selector.name} strategy.', delete_after=10)
+            return
+        if name not in Selector.strategies:
+            await ctx.send(f'Unknown strategy {name}! Choose from: {", ".join(Selector.strategies)}', delete_after=10)
+            return
+        try:
+            weights = {aid: float(w) for aid, w in
+                       (weight.split('=') for weight in weights)}
+        except ValueError:
+            await ctx.send('Weights should be given as aid=weight!', delete_after=10)
+            return
+        queue.selector = Selector.make(name, weights)
+        queue.selector.rebuild(queue)
+        queue.changed()
+        await ctx.send(f'Queues are now selected with the {name} strategy.', delete_after=10)
+
     @commands.command('toggle', aliases=('toggleReview',))
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review', 'MultiReview']))
     @commands.has_permissions(administrator=True)
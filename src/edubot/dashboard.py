@@ -0,0 +1,127 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Live overview of all queues of a guild for staff."""
+import asyncio
+import time
+from collections import namedtuple
+
+import discord
+
+from .stats import fmtduration
+
+# Summary of one queue: channel name, queue type, number of waiting
+# entries, time at which the oldest entry was queued, and active TAs
+QueueRow = namedtuple('QueueRow', 'channame qtype length oldest tas')
+
+
+class Dashboard:
+    ''' Dashboard message showing all queues of a guild.
+
+        Queues report their summary after each change. The totals over all
+        queues are updated incrementally from the difference with the
+        previous summary of that queue. The message is edited at most once
+        per interval, and additionally every refreshinterval seconds while
+        people are waiting, to keep the waiting times current. Queues report
+        again when one of their TAs stops counting as active.
+    '''
+    # Dashboards by guild id
+    dashboards = dict()
+    # Minimum time between two edits of the dashboard message
+    interval = 10.0
+    # Time between edits without changes, while people are waiting
+    refreshinterval = 60.0
+    # Discord allows at most 25 fields per embed
+    maxrows = 25
+
+    def __init__(self, guildid, rows):
+        self.guildid = guildid
+        self.message = None
+        self.rows = dict(rows)
+        self.waiting = sum(row.length for row in self.rows.values())
+        self.tas = sum(row.tas for row in self.rows.values())
+        # The message is posted with the initial state
+        self.lastedit = time.time()
+        self.handle = None
+        self.due = None
+
+    def update(self, qid, row):
+        ''' Store the new summary of queue qid, and schedule an edit. '''
+        old = self.rows.get(qid)
+        if old is not None:
+            self.waiting -= old.length
+            self.tas -= old.tas
+        self.rows[qid] = row
+        self.waiting += row.length
+        self.tas += row.tas
+        self.schedule(self.lastedit + self.interval)
+
+    def schedule(self, due):
+        ''' Make sure the dashboard is edited no later than time due. '''
+        if self.handle is not None:
+            if self.due <= due:
+                return
+            self.handle.cancel()
+        self.due = due
+        self.handle = asyncio.get_event_loop().call_later(
+            max(0.0, due - time.time()),
+            lambda: asyncio.ensure_future(self.refresh()))
+
+    def stop(self):
+        ''' Stop updating this dashboard. '''
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if Dashboard.dashboards.get(self.guildid) is self:
+            del Dashboard.dashboards[self.guildid]
+
+    def embed(self, now=None):
+        ''' Build the dashboard embed. '''
+        now = time.time() if now is None else now
+        oldest = min((row.oldest for row in self.rows.values()
+                      if row.oldest is not None), default=None)
+        description = f'**Waiting:** {self.waiting} in {len(self.rows)} queues\n' + \
+            f'**Active TAs:** {self.tas}\n' + \
+            f'**Longest wait:** {fmtduration(oldest and now - oldest)}'
+        embed = discord.Embed(title='Queue dashboard', description=description,
+                              colour=0xae8b0c)
+        # Show the queues with the longest waits first
+        rows = sorted(self.rows.values(),
+                      key=lambda row: (row.oldest is None, row.oldest or 0))
+        for row in rows[:self.maxrows]:
+            wait = fmtduration(row.oldest and now - row.oldest) if row.length else '-'
+            embed.add_field(name=f'#{row.channame}',
+                            value=f'{row.qtype}: **{row.length}** waiting\n' +
+                            f'Oldest: {wait}\nActive TAs: {row.tas}')
+        return embed
+
+    async def refresh(self):
+        ''' Edit the dashboard message to show the current state. '''
+        self.handle = None
+        if self.message is None:
+            # Still being posted
+            self.schedule(time.time() + self.interval)
+            return
+        self.lastedit = time.time()
+        try:
+            await self.message.edit(embed=self.embed(self.lastedit))
+        except discord.NotFound:
+            # The dashboard message was deleted
+            self.stop()
+            return
+        if self.waiting:
+            self.schedule(self.lastedit + self.refreshinterval)
@@ -0,0 +1,232 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Replication of the bot state to a hot-standby process."""
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Journal:
+    ''' Journal of state changes, written by the primary bot process.
+
+        Each line is a json list [kind, key, data]. The journal starts with
+        a snapshot of the current state, given by the snapshot function,
+        and is replaced by a new snapshot when it grows beyond maxsize.
+        Changes are serialised and written in a single writer thread, in
+        the order in which they are made. The snapshot itself is taken by
+        the caller of write(), in the event loop where the state changes.
+
+        The primary also writes a heartbeat file every beat seconds. When
+        it finds a heartbeat of another process instead, a standby took
+        over, and the heartbeat stops and calls ousted().
+    '''
+    # Start a new journal from a snapshot when it is this large
+    maxsize = 16 << 20
+    # Time between two heartbeats
+    beat = 1.0
+
+    def __init__(self, datadir, snapshot, ousted=None):
+        self.path = datadir.joinpath('replica')
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.journalfile = self.path.joinpath('journal.jsonl')
+        self.heartbeatfile = self.path.joinpath('heartbeat.json')
+        self.snapshot = snapshot
+        self.ousted = ousted
+        self.fout = None
+        self.size = 0
+        self.task = None
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.rotating = False
+        # Identifies the heartbeats of this process, and the time of the last
+        self.owner = uuid.uuid4().hex
+        self.lastbeat = None
+        self.restart(snapshot())
+
+    def restart(self, records):
+        ''' Replace the journal by the records of a snapshot. '''
+        tmpname = self.path.joinpath('journal.tmp')
+        with open(tmpname, 'w') as fout:
+            for record in records:
+                fout.write(json.dumps(record) + '\n')
+            self.size = fout.tell()
+        # A standby notices the new file and reads it from the start
+        os.replace(tmpname, self.journalfile)
+        if self.fout is not None:
+            self.fout.close()
+        self.fout = open(self.journalfile, 'a')
+        self.rotating = False
+
+    def rotate(self):
+        ''' Take a snapshot of the current state, and have the writer
+            replace the journal with it. '''
+        self.writer.submit(self.restart, self.snapshot())
+
+    def write(self, kind, key, data=None):
+        ''' Append a change to the journal, in the writer thread. '''
+        self.writer.submit(self.append, kind, key, data)
+        # The size is counted by the writer, so the journal can grow a
+        # little beyond maxsize before it is replaced
+        if self.size > self.maxsize and not self.rotating:
+            self.rotating = True
+            self.rotate()
+
+    def append(self, kind, key, data):
+        ''' Write a change to the journal file. '''
+        line = json.dumps([kind, key, data]) + '\n'
+        self.fout.write(line)
+        self.fout.flush()
+        self.size += len(line)
+
+    def flush(self):
+        ''' Wait until all changes so far are written. '''
+        self.writer.submit(lambda: None).result()
+
+    def heartbeat(self, stopped=False):
+        ''' Write the heartbeat file.
+            Returns: False, without writing, when another process wrote a
+            heartbeat since the last one of this process. '''
+        try:
+            with open(self.heartbeatfile) as fin:
+                beat = json.load(fin)
+        except (FileNotFoundError, ValueError):
+            beat = None
+        if beat is not None and self.lastbeat is not None and \
+                beat.get('owner') != self.owner and beat['time'] > self.lastbeat:
+            return False
+        self.lastbeat = time.time()
+        tmpname = self.path.joinpath('heartbeat.tmp')
+        with open(tmpname, 'w') as fout:
+            json.dump(dict(pid=os.getpid(), owner=self.owner, time=self.lastbeat,
+                           stopped=stopped), fout)
+        os.replace(tmpname, self.heartbeatfile)
+        return True
+
+    def start(self):
+        ''' Start the heartbeat task. '''
+        async def beat():
+            while self.heartbeat():
+                await asyncio.sleep(self.beat)
+            print('Another process took over from this one')
+            if self.ousted is not None:
+                self.ousted()
+        self.task = asyncio.ensure_future(beat())
+
+    def close(self):
+        ''' Write the remaining changes, stop the heartbeat, and tell
+            standbys the stop was intended. '''
+        if self.task is not None:
+            self.task.cancel()
+        self.writer.shutdown(wait=True)
+        self.heartbeat(stopped=True)
+        self.fout.close()
+
+
+class Standby:
+    ''' Follower of the journal of a primary bot process.
+
+        Each change in the journal is passed to apply(kind, key, data), so
+        that a warm copy of the state is kept. Following stops when the
+        heartbeat of the primary is older than timeout, unless the primary
+        stopped on purpose. A primary that is only stuck is stopped by its
+        own heartbeat once it notices the takeover. When the process of
+        the primary is gone, following stops without waiting for the
+        timeout; this check assumes both processes run on the same host.
+    '''
+    # Time after the last heartbeat at which the primary is considered dead
+    timeout = 5.0
+    # Time between two reads of the journal
+    interval = 0.25
+
+    def __init__(self, datadir, apply):
+        self.path = datadir.joinpath('replica')
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.journalfile = self.path.joinpath('journal.jsonl')
+        self.heartbeatfile = self.path.joinpath('heartbeat.json')
+        self.apply = apply
+        self.fin = None
+        self.partial = ''
+
+    def poll(self):
+        ''' Apply the changes added to the journal since the last poll. '''
+        try:
+            inode = os.stat(self.journalfile).st_ino
+        except FileNotFoundError:
+            return
+        if self.fin is not None and os.fstat(self.fin.fileno()).st_ino != inode:
+            # The primary restarted the journal: finish the old one, and
+            # continue with the new one from the start
+            self.read()
+            self.fin.close()
+            self.fin = None
+        if self.fin is None:
+            self.fin = open(self.journalfile, 'r')
+            self.partial = ''
+        self.read()
+
+    def read(self):
+        ''' Apply the complete lines that are not yet applied. '''
+        data = self.partial + self.fin.read()
+        lines = data.split('\n')
+        # The last line is still being written
+        self.partial = lines.pop()
+        for line in lines:
+            if line:
+                self.apply(*json.loads(line))
+
+    def primaryalive(self, now=None):
+        ''' Check whether the primary still writes its heartbeat, and its
+            process is still running. '''
+        now = time.time() if now is None else now
+        try:
+            with open(self.heartbeatfile) as fin:
+                beat = json.load(fin)
+        except (FileNotFoundError, ValueError):
+            # No primary yet
+            return True
+        return beat['stopped'] or \
+            (now - beat['time'] < self.timeout and self.running(beat['pid']))
+
+    @staticmethod
+    def running(pid):
+        ''' Check whether process pid exists. '''
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # The process exists, but belongs to another user
+            return True
+        return True
+
+    async def follow(self):
+        ''' Follow the journal until the primary dies. '''
+        while True:
+            self.poll()
+            if not self.primaryalive():
+                # Take in the last changes
+                self.poll()
+                return
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        ''' Stop following the journal. '''
+        if self.fin is not None:
+            self.fin.close()
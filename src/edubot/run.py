@@ -19,6 +19,7 @@
 
 import asyncio
 import os
+from pathlib import Path
 from typing import Optional
 
 import click
@@ -40,19 +41,27 @@ except ImportError as e:  # Edubot is not installed
         # usage so we raise the exception
         raise e
 
+from edubot.storage import Storage, migrate  # noqa: E402
+
 TOKEN = os.getenv("DISCORD_TOKEN")
 
 
 class BotRunner:
     """Runs :py:class:`EduBot` in the standard blocking manner."""
 
-    def __init__(self, token: Optional[str] = TOKEN):
+    def __init__(self, token: Optional[str] = TOKEN, standby: bool = False):
         self.validate_token(token)
-        self.bot = EduBot()
+        self.bot = EduBot(standby)
         self.run(token)
 
     def run(self, token: str) -> None:
-        """Runs the bot with the given ``token`` as a blocking call."""
+        """Runs the bot with the given ``token`` as a blocking call.
+
+        A standby bot first follows the primary bot, and only connects
+        when the primary stops.
+        """
+        if self.bot.standby is not None:
+            self.bot.loop.run_until_complete(self.bot.takeover())
         self.bot.run(token)
 
     # TODO find a better validation method later or remove completely
@@ -119,14 +128,44 @@ class InteractiveBotRunner(BotRunner):
 
 @click.command()
 @click.option("--token", default=TOKEN, help="Specifies the Discord API Token")
-def cli(token: str) -> BotRunner:
+@click.option(
+    "--standby",
+    is_flag=True,
+    help="Follow a running bot on this machine, and take over when it stops",
+)
+def cli(token: str, standby: bool) -> BotRunner:
     """Command Line Interface (CLI) of :py:class:`EduBot`.
 
     Args:
         token: Discord API Token
+        standby: Run as hot standby of the bot that is already running
+
+    """
+    return BotRunner(token, standby)
+
+
+@click.command()
+@click.argument("source", type=click.Choice(sorted(Storage.backends)))
+@click.argument("target", type=click.Choice(sorted(Storage.backends)))
+def migrate_cli(source: str, target: str) -> None:
+    """Copy saved queues and quizzes between storage backends.
+
+    This is used to import the JSON files of earlier versions into the
+    SQLite backend (``edubot-migrate json sqlite``), and to export the
+    SQLite backend to JSON files (``edubot-migrate sqlite json``).
+
+    Args:
+        source: Name of the storage backend to copy from
+        target: Name of the storage backend to copy to
 
     """
-    return BotRunner(token)
+    datadir = Path.joinpath(Path.home(), ".edubot")
+    src = Storage.make(source, datadir)
+    dst = Storage.make(target, datadir)
+    nqueues, nquizzes = migrate(src, dst)
+    src.close()
+    dst.close()
+    click.echo(f"Copied {nqueues} queues and {nquizzes} quizzes")
 
 
 def is_ipython() -> bool:
@@ -0,0 +1,112 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Strategies to select which assignment queue a TA serves next."""
+import heapq
+from abc import ABC, abstractmethod
+
+
+class Selector(ABC):
+    ''' Base class of the assignment queue selection strategies.
+
+        Each non-empty assignment queue has a key, and the queue with the
+        lowest key is served first. Keys are kept in a heap that is
+        updated whenever a queue changes, so selection costs O(log k)
+        for k assignments. Outdated heap entries are skipped lazily.
+    '''
+    name = ''
+    # Registry of all selection strategies by name
+    strategies = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Selector.strategies[cls.name] = cls
+
+    @classmethod
+    def make(cls, name, weights=None):
+        ''' Create the selection strategy with the given name. '''
+        return cls.strategies[name](weights)
+
+    def __init__(self, weights=None):
+        self.weights = dict(weights or {})
+        self.heap = []
+        self.keys = dict()
+
+    @abstractmethod
+    def key(self, mqueue, aid):
+        ''' Return the key of queue aid in mqueue. Lower keys are served
+            first. '''
+
+    def update(self, mqueue, aid):
+        ''' Recompute the key of queue aid after it has changed. '''
+        if aid not in mqueue.queue or not mqueue.queue[aid]:
+            self.keys.pop(aid, None)
+            return
+        key = self.key(mqueue, aid)
+        if self.keys.get(aid) != key:
+            self.keys[aid] = key
+            heapq.heappush(self.heap, (key, aid))
+            # Rebuild when outdated entries dominate the heap
+            if len(self.heap) > 2 * len(self.keys) + 16:
+                self.heap = [(k, a) for a, k in self.keys.items()]
+                heapq.heapify(self.heap)
+
+    def rebuild(self, mqueue):
+        ''' Recompute the keys of all queues of mqueue. '''
+        self.heap = []
+        self.keys = dict()
+        for aid in mqueue.assignments:
+            self.update(mqueue, aid)
+
+    def select(self):
+        ''' Return the assignment of the queue to serve next, or None when
+            all queues are empty. '''
+        while self.heap:
+            key, aid = self.heap[0]
+            if self.keys.get(aid) == key:
+                return aid
+            heapq.heappop(self.heap)
+        return None
+
+
+class FirstNonEmpty(Selector):
+    ''' Serve the lowest assignment with a non-empty queue. '''
+    name = 'first'
+
+    def key(self, mqueue, aid):
+        # Assignments are kept sorted, so they can be their own key
+        return aid
+
+
+class OldestFirst(Selector):
+    ''' Serve the queue whose first student has been waiting longest.
+        Optional weights shift a queue's head as if it waited that many
+        seconds longer. '''
+    name = 'oldest'
+
+    def key(self, mqueue, aid):
+        head = mqueue.queue[aid][0]
+        return mqueue.enqueued.get((aid, head), 0.0) - \
+            self.weights.get(aid, 0.0)
+
+
+class LongestFirst(Selector):
+    ''' Serve the queue with the largest weighted length. '''
+    name = 'longest'
+
+    def key(self, mqueue, aid):
+        return -len(mqueue.queue[aid]) * self.weights.get(aid, 1.0)
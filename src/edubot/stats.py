@@ -0,0 +1,113 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Streaming statistics used to estimate waiting times in queues."""
+import time
+from collections import deque
+
+
+def fmtduration(seconds):
+    ''' Format a duration in seconds as a short human readable string. '''
+    if seconds is None:
+        return 'unknown'
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return '<1 min'
+    if minutes < 60:
+        return f'~{minutes} min'
+    return f'~{minutes // 60}h{minutes % 60:02d}'
+
+
+class ServiceStats:
+    ''' Streaming wait and service time statistics.
+
+        Service and wait times are tracked as exponentially weighted
+        moving averages, so old samples fade out as the session
+        progresses. A bounded window of recent waits is kept to
+        estimate wait time percentiles, and the timestamps of the last
+        hour of served students give the throughput.
+    '''
+
+    def __init__(self, alpha=0.2, window=256, period=3600.0):
+        self.alpha = alpha
+        self.period = period
+        self.service = None
+        self.wait = None
+        self.waits = deque(maxlen=window)
+        self.served = deque()
+        self.total = 0
+
+    def tojson(self):
+        ''' Return the state of these statistics for storage. '''
+        return dict(service=self.service, wait=self.wait,
+                    waits=list(self.waits), served=list(self.served),
+                    total=self.total)
+
+    @classmethod
+    def fromjson(cls, data):
+        ''' Create statistics from their stored state. '''
+        stats = cls()
+        stats.service = data.get('service')
+        stats.wait = data.get('wait')
+        stats.waits.extend(data.get('waits', ()))
+        stats.served.extend(data.get('served', ()))
+        stats.total = data.get('total', 0)
+        return stats
+
+    @staticmethod
+    def _ewma(avg, sample, alpha):
+        return sample if avg is None else avg + alpha * (sample - avg)
+
+    def _expire(self, now):
+        while self.served and now - self.served[0] > self.period:
+            self.served.popleft()
+
+    def record_wait(self, seconds, now=None):
+        ''' Register that a student was taken from the queue after waiting
+            for 'seconds'. '''
+        now = time.time() if now is None else now
+        seconds = max(0.0, seconds)
+        self.wait = self._ewma(self.wait, seconds, self.alpha)
+        self.waits.append(seconds)
+        self.served.append(now)
+        self.total += 1
+        self._expire(now)
+
+    def record_service(self, seconds):
+        ''' Register the duration of a completed review. '''
+        if seconds > 0:
+            self.service = self._ewma(self.service, seconds, self.alpha)
+
+    def throughput(self, now=None):
+        ''' Number of students served per hour over the last period. '''
+        now = time.time() if now is None else now
+        self._expire(now)
+        return len(self.served) * 3600.0 / self.period
+
+    def quantile(self, q):
+        ''' Return the q-quantile (0 <= q <= 1) of the recent wait times. '''
+        if not self.waits:
+            return None
+        samples = sorted(self.waits)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def expected_wait(self, ahead, servers=1):
+        ''' Expected wait for someone with 'ahead' people in front of them,
+            when 'servers' TAs are reviewing in parallel. '''
+        if self.service is None:
+            return None
+        return (ahead + 0.5) * self.service / max(1, servers)
@@ -0,0 +1,638 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Storage backends for the saved state of queues and quizzes."""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Storage(ABC):
+    ''' Base class of the storage backends.
+
+        Queues are stored as the json data of Queue.save, by qid. Queues
+        are written after each change when the backend is incremental,
+        and otherwise only on (periodic) full saves.
+
+        Quizzes are stored as the save data of Quiz.create_save_data, by
+        message id. They are written when they start or change, and votes
+        are written one change at a time. Reading all quizzes gives a dict
+        with an extra 'last_started' key.
+    '''
+    name = ''
+    incremental = False
+    # Registry of all storage backends by name
+    backends = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Storage.backends[cls.name] = cls
+
+    @classmethod
+    def make(cls, name, datadir):
+        ''' Create the storage backend with the given name in datadir. '''
+        return cls.backends[name](datadir)
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        # Blocking storage calls from the event loop are made in order, in
+        # a single thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def run(self, func, *args):
+        ''' Run the blocking storage call func(*args) in the executor of
+            this backend. Returns an awaitable future. '''
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor, func, *args)
+
+    @abstractmethod
+    def queueids(self):
+        ''' Return the qids of all saved queues. '''
+
+    @abstractmethod
+    def readqueue(self, qid):
+        ''' Return the json data of saved queue qid, or None. '''
+
+    @abstractmethod
+    def writequeue(self, qid, qjson):
+        ''' Save the json data of queue qid. '''
+
+    @abstractmethod
+    def readquizzes(self):
+        ''' Return the dict of saved quizzes, or None if there is none. '''
+
+    @abstractmethod
+    def writequizzes(self, quizzes):
+        ''' Save the dict of all active quizzes, replacing what was saved. '''
+
+    @abstractmethod
+    def writequiz(self, quiz):
+        ''' Save the data of a single new or changed quiz. '''
+
+    @abstractmethod
+    def writelast(self, name):
+        ''' Save the name of the last started quiz. '''
+
+    @abstractmethod
+    def logvotes(self, msgid, changes):
+        ''' Save a batch of vote changes in quiz msgid, as a list of
+            (uid, option, added) tuples. '''
+
+    @abstractmethod
+    def finishquiz(self, quiz):
+        ''' Remove a finished quiz from the active quizzes. '''
+
+    def close(self):
+        ''' Release the resources held by this backend. '''
+        self.executor.shutdown()
+
+
+class JSONStorage(Storage):
+    ''' Store each queue in its own json file, which is rewritten in full
+        on each save.
+
+        Each active quiz has a snapshot file, and a log to which its vote
+        changes are appended. Snapshots are only rewritten when a quiz
+        changes, when its log is compacted, and when it is finished.
+    '''
+    name = 'json'
+    # Compact a vote log when it has this many lines
+    compactsize = 1000
+
+    def __init__(self, datadir):
+        super().__init__(datadir)
+        self.queuedir = datadir.joinpath('queues')
+        self.queuedir.mkdir(parents=True, exist_ok=True)
+        self.activedir = datadir.joinpath('quizstate', 'active')
+        self.activedir.mkdir(parents=True, exist_ok=True)
+        self.finisheddir = datadir.joinpath('quizstate', 'finished')
+        self.finisheddir.mkdir(parents=True, exist_ok=True)
+        self.lastfile = datadir.joinpath('quizstate', 'last_started.json')
+        # Single file with all quizzes, saved by earlier versions
+        self.legacyfile = datadir.joinpath('quizzes', 'saved_quizzes.backupjson')
+        # Number of lines in the vote log of each active quiz, and the logs
+        # written by this process, which end with a complete line
+        self.logsize = dict()
+        self.clean = set()
+
+    def filename(self, qid):
+        ''' Return the path of the file in which queue qid is stored. '''
+        return self.queuedir.joinpath(f'{qid[0]}-{qid[1]}.json')
+
+    def queueids(self):
+        return [tuple(int(i) for i in qfile.stem.split('-'))
+                for qfile in self.queuedir.glob('*.json')]
+
+    def readqueue(self, qid):
+        try:
+            with open(self.filename(qid), 'r') as fin:
+                return json.load(fin)
+        except IOError:
+            return None
+
+    def writequeue(self, qid, qjson):
+        with open(self.filename(qid), 'w') as fout:
+            json.dump(qjson, fout, indent=4)
+
+    @staticmethod
+    def dump(data, fname):
+        ''' Write data to json file fname, replacing it atomically. '''
+        tmpname = fname.with_suffix('.tmp')
+        with open(tmpname, 'w') as fout:
+            json.dump(data, fout, indent=4)
+        os.replace(tmpname, fname)
+
+    def snapshot(self, msgid):
+        ''' Return the path of the snapshot of active quiz msgid. '''
+        return self.activedir.joinpath(f'{msgid}.json')
+
+    def votelog(self, msgid):
+        ''' Return the path of the vote log of active quiz msgid. '''
+        return self.activedir.joinpath(f'{msgid}.log')
+
+    def readquiz(self, msgid):
+        ''' Read the snapshot of active quiz msgid, and apply the changes
+            in its vote log. A partially written last line of the log is
+            skipped, so that the files aren't changed while a primary
+            process may still write them. '''
+        with open(self.snapshot(msgid), 'r') as fin:
+            quiz = json.load(fin)
+        votes = {option: set(uids) for option, uids in quiz['votes'].items()}
+        nlines = 0
+        try:
+            with open(self.votelog(msgid), 'rb') as fin:
+                for line in fin:
+                    if not line.endswith(b'\n'):
+                        break
+                    nlines += 1
+                    option, uid = line[1:].decode().split()
+                    if line.startswith(b'+'):
+                        votes.setdefault(option, set()).add(int(uid))
+                    else:
+                        votes.setdefault(option, set()).discard(int(uid))
+        except IOError:
+            pass
+        self.logsize[msgid] = nlines
+        quiz['votes'] = {option: sorted(uids) for option, uids in votes.items()}
+        return quiz
+
+    def readquizzes(self):
+        if self.legacyfile.exists():
+            # Import the quizzes saved by an earlier version
+            with open(self.legacyfile, 'r') as fin:
+                self.writequizzes(json.load(fin))
+            os.replace(self.legacyfile, self.legacyfile.with_suffix('.imported'))
+        msgids = [snap.stem for snap in self.activedir.glob('*.json')]
+        if not msgids and not self.lastfile.exists():
+            return None
+        quizzes = {msgid: self.readquiz(msgid) for msgid in msgids}
+        try:
+            with open(self.lastfile, 'r') as fin:
+                quizzes['last_started'] = json.load(fin)
+        except IOError:
+            quizzes['last_started'] = None
+        return quizzes
+
+    def writequizzes(self, quizzes):
+        quizzes = dict(quizzes)
+        self.writelast(quizzes.pop('last_started', None))
+        for fname in self.activedir.iterdir():
+            fname.unlink()
+        self.logsize.clear()
+        for quiz in quizzes.values():
+            self.writequiz(quiz)
+
+    def writequiz(self, quiz):
+        msgid = quiz['messageid']
+        self.dump(quiz, self.snapshot(msgid))
+        # The snapshot contains all votes so far
+        self.votelog(msgid).write_text('')
+        self.logsize[str(msgid)] = 0
+        self.clean.add(str(msgid))
+
+    def writelast(self, name):
+        self.dump(name, self.lastfile)
+
+    @staticmethod
+    def cuttail(fout):
+        ''' Cut a partially written last line off the log open in fout. '''
+        size = fout.seek(0, os.SEEK_END)
+        if not size:
+            return
+        fout.seek(max(0, size - 64))
+        tail = fout.read()
+        if not tail.endswith(b'\n'):
+            # Vote lines are short, so the previous line end is in the tail
+            fout.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+
+    def logvotes(self, msgid, changes):
+        if str(msgid) not in self.clean:
+            # A process that crashed may have left a partial line
+            try:
+                with open(self.votelog(msgid), 'rb+') as fout:
+                    self.cuttail(fout)
+            except FileNotFoundError:
+                pass
+            self.clean.add(str(msgid))
+        with open(self.votelog(msgid), 'a') as fout:
+            for uid, option, added in changes:
+                fout.write(f'{"+" if added else "-"}{option} {uid}\n')
+        msgid = str(msgid)
+        self.logsize[msgid] = self.logsize.get(msgid, 0) + len(changes)
+        if self.logsize[msgid] >= self.compactsize:
+            self.writequiz(self.readquiz(msgid))
+
+    def finishquiz(self, quiz):
+        msgid = quiz['messageid']
+        self.dump(quiz, self.finisheddir.joinpath(f'{msgid}.json'))
+        for fname in (self.snapshot(msgid), self.votelog(msgid)):
+            try:
+                fname.unlink()
+            except FileNotFoundError:
+                pass
+        self.logsize.pop(str(msgid), None)
+        self.clean.discard(str(msgid))
+
+
+class SQLiteStorage(Storage):
+    ''' Store queues and quizzes in an SQLite database in WAL mode.
+
+        Queue entries, assignments, questions, followers and quiz votes
+        have their own indexed tables, so that each change is a small
+        write. Queue entries are ordered by a position key that is kept
+        when other entries are added or removed, so that only added and
+        removed entries are written. All calls are serialised on a single
+        connection, and from the event loop they are made in a
+        single-threaded executor.
+    '''
+    name = 'sqlite'
+    incremental = True
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS queues (
+            guild INTEGER, channel INTEGER, qtype TEXT, guildname TEXT,
+            channame TEXT, indicator INTEGER, extra TEXT,
+            PRIMARY KEY (guild, channel));
+        CREATE TABLE IF NOT EXISTS entries (
+            guild INTEGER, channel INTEGER, aid TEXT, pos INTEGER,
+            uid INTEGER, enqueued REAL,
+            PRIMARY KEY (guild, channel, aid, pos));
+        CREATE TABLE IF NOT EXISTS assignments (
+            guild INTEGER, channel INTEGER, pos INTEGER, aid TEXT,
+            PRIMARY KEY (guild, channel, pos));
+        CREATE TABLE IF NOT EXISTS questions (
+            guild INTEGER, channel INTEGER, pos INTEGER, question TEXT,
+            PRIMARY KEY (guild, channel, pos));
+        CREATE TABLE IF NOT EXISTS followers (
+            guild INTEGER, channel INTEGER, question INTEGER, pos INTEGER,
+            uid INTEGER, PRIMARY KEY (guild, channel, question, pos));
+        CREATE TABLE IF NOT EXISTS stats (
+            guild INTEGER, channel INTEGER, data TEXT,
+            PRIMARY KEY (guild, channel));
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            guild INTEGER, channel INTEGER, uid INTEGER, positions TEXT,
+            PRIMARY KEY (guild, channel, uid));
+        CREATE TABLE IF NOT EXISTS breakouts (
+            guild INTEGER, channel INTEGER, data TEXT,
+            PRIMARY KEY (guild, channel));
+        CREATE TABLE IF NOT EXISTS quizzes (
+            message INTEGER PRIMARY KEY, data TEXT);
+        CREATE TABLE IF NOT EXISTS finished (
+            message INTEGER PRIMARY KEY, data TEXT);
+        CREATE TABLE IF NOT EXISTS votes (
+            message INTEGER, option INTEGER, uid INTEGER,
+            PRIMARY KEY (message, option, uid));
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    '''
+    # Tables with rows per queue, in the order in which they are cleared
+    queuetables = ('entries', 'assignments', 'questions', 'followers',
+                   'stats', 'subscriptions', 'breakouts', 'queues')
+    # Spacing of the position keys of new queue entries, which leaves room
+    # to insert entries without renumbering the others
+    gap = 1024
+
+    def __init__(self, datadir):
+        super().__init__(datadir)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(datadir.joinpath('edubot.sqlite')),
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(self.schema)
+        # The rows of each queue as last written by this process, so that
+        # a write only needs to change the rows that differ
+        self.stored = dict()
+
+    def queueids(self):
+        with self.lock:
+            return [tuple(row) for row in
+                    self.db.execute('SELECT guild, channel FROM queues')]
+
+    def readqueue(self, qid):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT qtype, guildname, channame, indicator, extra '
+                'FROM queues WHERE guild=? AND channel=?', qid).fetchone()
+            if row is None:
+                return None
+            qtype, guildname, channame, indicator, extra = row
+            entries = self.db.execute(
+                'SELECT aid, uid, enqueued FROM entries '
+                'WHERE guild=? AND channel=? ORDER BY aid, pos', qid).fetchall()
+            assignments = [aid for aid, in self.db.execute(
+                'SELECT aid FROM assignments WHERE guild=? AND channel=? '
+                'ORDER BY pos', qid)]
+            questions = self.db.execute(
+                'SELECT pos, question FROM questions '
+                'WHERE guild=? AND channel=? ORDER BY pos', qid).fetchall()
+            followers = self.db.execute(
+                'SELECT question, uid FROM followers '
+                'WHERE guild=? AND channel=? ORDER BY question, pos',
+                qid).fetchall()
+            stats = self.db.execute(
+                'SELECT data FROM stats WHERE guild=? AND channel=?',
+                qid).fetchone()
+            subscriptions = self.db.execute(
+                'SELECT uid, positions FROM subscriptions '
+                'WHERE guild=? AND channel=? ORDER BY uid', qid).fetchall()
+            breakouts = self.db.execute(
+                'SELECT data FROM breakouts WHERE guild=? AND channel=?',
+                qid).fetchone()
+
+        qdata = json.loads(extra) if extra else None
+        if qtype == 'Question':
+            followed = {pos: [] for pos, _ in questions}
+            for pos, uid in followers:
+                followed[pos].append(uid)
+            qdata = [(qmsg, followed[idx], idx) for idx, qmsg in questions]
+            enqueued = []
+        elif isinstance(qdata, dict):
+            qdata['assignments'] = assignments
+            qdata['queue'] = {aid: [] for aid in assignments}
+            for aid, uid, _ in entries:
+                qdata['queue'].setdefault(aid, []).append(uid)
+            enqueued = [((aid, uid), t) for aid, uid, t in entries
+                        if t is not None]
+        else:
+            qdata = [uid for _, uid, _ in entries]
+            enqueued = [(uid, t) for _, uid, t in entries if t is not None]
+        qjson = dict(qtype=qtype, guildname=guildname, channame=channame,
+                     qdata=qdata, enqueued=enqueued, indicator=indicator)
+        if qtype == 'Question' and extra:
+            qjson.update(json.loads(extra))
+        if stats is not None:
+            qjson['stats'] = json.loads(stats[0])
+        if subscriptions:
+            qjson['subscriptions'] = [[uid, json.loads(positions)]
+                                      for uid, positions in subscriptions]
+        if breakouts is not None:
+            qjson['breakouts'] = json.loads(breakouts[0])
+        return qjson
+
+    @staticmethod
+    def queuerows(qid, qjson):
+        ''' Split the json data of queue qid into the (uid, enqueued) entries
+            of each line, and the rows of the other queue tables. '''
+        guild, channel = qid
+        qdata = qjson['qdata']
+        enqueued = {(tuple(key) if isinstance(key, list) else key): t
+                    for key, t in qjson.get('enqueued', [])}
+        extra = None
+        lines, assignments, questions, followers = dict(), [], [], []
+        if qjson['qtype'] == 'Question':
+            # Questions are stored by their index, which also keeps their order
+            for pos, (qmsg, qf, *stored) in enumerate(qdata):
+                idx = stored[0] if stored else pos + 1
+                questions.append((guild, channel, idx, qmsg))
+                followers.extend((guild, channel, idx, i, uid)
+                                 for i, uid in enumerate(qf))
+            if 'maxidx' in qjson:
+                extra = json.dumps(dict(maxidx=qjson['maxidx']))
+        elif isinstance(qdata, dict):
+            extra = json.dumps({key: value for key, value in qdata.items()
+                                if key not in ('assignments', 'queue')})
+            assignments = [(guild, channel, pos, aid)
+                           for pos, aid in enumerate(qdata['assignments'])]
+            for aid, uids in qdata['queue'].items():
+                lines[aid] = [(uid, enqueued.get((aid, uid))) for uid in uids]
+        else:
+            lines[''] = [(uid, enqueued.get(uid)) for uid in qdata]
+        stats = [(guild, channel, json.dumps(qjson['stats']))] \
+            if qjson.get('stats') else []
+        subscriptions = [(guild, channel, uid, json.dumps(positions))
+                         for uid, positions in qjson.get('subscriptions', [])]
+        breakouts = [(guild, channel, json.dumps(qjson['breakouts']))] \
+            if qjson.get('breakouts') else []
+        rows = dict(queues=[(guild, channel, qjson['qtype'], qjson['guildname'],
+                             qjson['channame'], qjson.get('indicator'), extra)],
+                    assignments=assignments, questions=questions,
+                    followers=followers, stats=stats,
+                    subscriptions=subscriptions, breakouts=breakouts)
+        return lines, rows
+
+    @classmethod
+    def orderkeys(cls, stored, entries):
+        ''' Return the (pos, uid, enqueued) rows of the (uid, enqueued)
+            entries of a line. Entries that are already stored keep their
+            position key, new entries get keys in between their neighbours.
+            Returns: the rows, or None when the line needs to be
+            renumbered. '''
+        keys = {uid: pos for pos, uid, _ in stored}
+        rows, new, prev = [], [], None
+        for uid, t in entries + [(None, None)]:
+            pos = keys.get(uid)
+            if uid is not None and pos is None:
+                new.append((uid, t))
+                continue
+            if new:
+                if pos is None:
+                    first, step = (0 if prev is None else prev + cls.gap), cls.gap
+                elif prev is None:
+                    first, step = pos - cls.gap * len(new), cls.gap
+                else:
+                    step = (pos - prev) // (len(new) + 1)
+                    if step < 1:
+                        return None
+                    first = prev + step
+                rows.extend((first + i * step, nuid, nt)
+                            for i, (nuid, nt) in enumerate(new))
+                new = []
+            if uid is None:
+                return rows
+            if prev is not None and pos <= prev:
+                # The order of stored entries changed
+                return None
+            rows.append((pos, uid, t))
+            prev = pos
+
+    def writeline(self, qid, aid, stored, entries):
+        ''' Write the changes from the stored rows of line aid of queue
+            qid to its new entries.
+            Returns: the new rows of the line. '''
+        rows = self.orderkeys(stored, entries)
+        if rows is None:
+            self.db.execute('DELETE FROM entries WHERE guild=? AND channel=? '
+                            'AND aid=?', (*qid, aid))
+            stored = []
+            rows = [(i * self.gap, uid, t) for i, (uid, t) in enumerate(entries)]
+        old = {uid: (pos, t) for pos, uid, t in stored}
+        uids = {uid for _, uid, _ in rows}
+        self.db.executemany(
+            'DELETE FROM entries WHERE guild=? AND channel=? AND aid=? AND pos=?',
+            [(*qid, aid, pos) for pos, uid, _ in stored if uid not in uids])
+        self.db.executemany(
+            'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+            [(*qid, aid, pos, uid, t) for pos, uid, t in rows if uid not in old])
+        self.db.executemany(
+            'UPDATE entries SET enqueued=? WHERE guild=? AND channel=? '
+            'AND aid=? AND pos=?',
+            [(t, *qid, aid, pos) for pos, uid, t in rows
+             if uid in old and old[uid][1] != t])
+        return rows
+
+    def writequeue(self, qid, qjson):
+        lines, rows = self.queuerows(qid, qjson)
+        with self.lock, self.db:
+            stored = self.stored.get(qid)
+            if stored is None:
+                # Start from scratch the first time this queue is written
+                for table in self.queuetables:
+                    self.db.execute(
+                        f'DELETE FROM {table} WHERE guild=? AND channel=?', qid)
+                stored = self.stored[qid] = dict(lines=dict(), rows=dict())
+            for aid in set(stored['lines']) - set(lines):
+                self.db.execute('DELETE FROM entries WHERE guild=? AND '
+                                'channel=? AND aid=?', (*qid, aid))
+                del stored['lines'][aid]
+            for aid, entries in lines.items():
+                stored['lines'][aid] = self.writeline(
+                    qid, aid, stored['lines'].get(aid, []), entries)
+            # The other tables have a few rows per queue, which are only
+            # rewritten when they change
+            for table, tablerows in rows.items():
+                if stored['rows'].get(table) == tablerows:
+                    continue
+                self.db.execute(
+                    f'DELETE FROM {table} WHERE guild=? AND channel=?', qid)
+                if tablerows:
+                    marks = ', '.join('?' * len(tablerows[0]))
+                    self.db.executemany(
+                        f'INSERT INTO {table} VALUES ({marks})', tablerows)
+                stored['rows'][table] = tablerows
+
+    def readquizzes(self):
+        with self.lock:
+            quizrows = self.db.execute(
+                'SELECT message, data FROM quizzes').fetchall()
+            voterows = self.db.execute(
+                'SELECT message, option, uid FROM votes '
+                'ORDER BY message, option, uid').fetchall()
+            last = self.db.execute(
+                "SELECT value FROM meta WHERE key='last_started'").fetchone()
+        if not quizrows and last is None:
+            return None
+        quizzes = {str(msgid): json.loads(data) for msgid, data in quizrows}
+        for quiz in quizzes.values():
+            quiz['votes'] = {option: [] for option in quiz['options']}
+        for msgid, option, uid in voterows:
+            quiz = quizzes.get(str(msgid))
+            if quiz is not None:
+                quiz['votes'].setdefault(str(option), []).append(uid)
+        quizzes['last_started'] = json.loads(last[0]) if last else None
+        return quizzes
+
+    @staticmethod
+    def quizrow(quiz):
+        ''' Return the quizzes row of the save data of a quiz. Votes are
+            stored separately, and counts are derived from them. '''
+        data = {key: value for key, value in quiz.items()
+                if key not in ('votes', 'counted_votes')}
+        return int(quiz['messageid']), json.dumps(data)
+
+    def writequizzes(self, quizzes):
+        quizzes = dict(quizzes)
+        last = quizzes.pop('last_started', None)
+        votes = [(int(msgid), int(option), uid)
+                 for msgid, quiz in quizzes.items()
+                 for option, uids in quiz.get('votes', {}).items()
+                 for uid in uids]
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM votes')
+            self.db.execute('DELETE FROM quizzes')
+            self.db.executemany(
+                'INSERT INTO quizzes VALUES (?, ?)',
+                [self.quizrow(quiz) for quiz in quizzes.values()])
+            self.db.executemany('INSERT INTO votes VALUES (?, ?, ?)', votes)
+        self.writelast(last)
+
+    def writequiz(self, quiz):
+        msgid, data = self.quizrow(quiz)
+        votes = [(msgid, int(option), uid)
+                 for option, uids in quiz.get('votes', {}).items()
+                 for uid in uids]
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO quizzes VALUES (?, ?)',
+                            (msgid, data))
+            self.db.execute('DELETE FROM votes WHERE message=?', (msgid,))
+            self.db.executemany('INSERT INTO votes VALUES (?, ?, ?)', votes)
+
+    def writelast(self, name):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES "
+                            "('last_started', ?)", (json.dumps(name),))
+
+    def logvotes(self, msgid, changes):
+        with self.lock, self.db:
+            for uid, option, added in changes:
+                if added:
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO votes VALUES (?, ?, ?)',
+                        (msgid, option, uid))
+                else:
+                    self.db.execute(
+                        'DELETE FROM votes WHERE message=? AND option=? '
+                        'AND uid=?', (msgid, option, uid))
+
+    def finishquiz(self, quiz):
+        msgid = int(quiz['messageid'])
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO finished VALUES (?, ?)',
+                            (msgid, json.dumps(quiz)))
+            self.db.execute('DELETE FROM votes WHERE message=?', (msgid,))
+            self.db.execute('DELETE FROM quizzes WHERE message=?', (msgid,))
+
+    def close(self):
+        super().close()
+        with self.lock:
+            self.db.close()
+
+
+def migrate(source, target):
+    ''' Copy all saved queues and quizzes from storage backend source to
+        storage backend target.
+        Returns: the number of copied queues and quizzes. '''
+    qids = source.queueids()
+    for qid in qids:
+        target.writequeue(qid, source.readqueue(qid))
+    quizzes = source.readquizzes() or {}
+    if quizzes:
+        target.writequizzes(quizzes)
+    return len(qids), sum(key != 'last_started' for key in quizzes)
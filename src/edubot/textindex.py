@@ -0,0 +1,157 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Incremental TF-IDF index to find similar texts."""
+import re
+from collections import Counter
+
+import numpy as np
+
+re_word = re.compile(r'[a-z0-9_]+')
+
+# Words that say little about what a question is about
+STOPWORDS = frozenset('''
+    a an and are as at be but by can do does for from have how i if in is it
+    my of on or so that the this to was what when where which why with you
+    your me we there their then than should would could will just not no
+    any some get got use using im its'''.split())
+
+
+def tokenize(text):
+    ''' Return the lowercase words in text, without stop words. '''
+    return [word for word in re_word.findall(text.lower())
+            if word not in STOPWORDS and len(word) > 1]
+
+
+class TextIndex:
+    ''' TF-IDF index of short texts, such as questions.
+
+        Texts can be added and removed one at a time. The term counts of
+        all texts are kept in flat NumPy arrays (one entry per distinct
+        term per text), so that a query is scored against all texts at
+        once. Term weights and text norms are derived from the current
+        document frequencies at query time, so nothing needs retraining
+        when texts are added or removed.
+    '''
+    def __init__(self):
+        self.vocab = dict()
+        self.df = np.zeros(64, np.int32)
+        self.keys = []
+        self.rows = dict()
+        self.alive = np.zeros(64, bool)
+        # Flat (row, term, count) entries of all texts
+        self.size = 0
+        self.entryrow = np.zeros(256, np.int32)
+        self.entryterm = np.zeros(256, np.int32)
+        self.entrycount = np.zeros(256, np.float32)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    @staticmethod
+    def grow(arr, size):
+        ''' Return arr, enlarged to hold at least size elements. '''
+        if size <= len(arr):
+            return arr
+        new = np.zeros(max(size, 2 * len(arr)), arr.dtype)
+        new[:len(arr)] = arr
+        return new
+
+    def counts(self, text, add=False):
+        ''' Return the term ids and counts of text. Unknown terms are added
+            to the vocabulary when add is True, and skipped otherwise. '''
+        counts = Counter(tokenize(text))
+        if add:
+            for term in counts:
+                if term not in self.vocab:
+                    self.vocab[term] = len(self.vocab)
+            self.df = self.grow(self.df, len(self.vocab))
+        terms = [(self.vocab[t], c) for t, c in counts.items() if t in self.vocab]
+        return (np.array([t for t, _ in terms], np.int32),
+                np.array([c for _, c in terms], np.float32))
+
+    def add(self, key, text):
+        ''' Add text under key, replacing an earlier text of key. '''
+        if key in self.rows:
+            self.remove(key)
+        terms, counts = self.counts(text, add=True)
+        row = len(self.keys)
+        self.keys.append(key)
+        self.rows[key] = row
+        self.alive = self.grow(self.alive, row + 1)
+        self.alive[row] = True
+        end = self.size + len(terms)
+        self.entryrow = self.grow(self.entryrow, end)
+        self.entryterm = self.grow(self.entryterm, end)
+        self.entrycount = self.grow(self.entrycount, end)
+        self.entryrow[self.size:end] = row
+        self.entryterm[self.size:end] = terms
+        self.entrycount[self.size:end] = counts
+        self.size = end
+        self.df[terms] += 1
+
+    def remove(self, key):
+        ''' Remove the text of key from the index. '''
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        sel = self.entryrow[:self.size] == row
+        self.df[self.entryterm[:self.size][sel]] -= 1
+        # Drop removed texts once they take up most of the index
+        if len(self.keys) > 2 * len(self.rows) + 16:
+            self.compact()
+
+    def compact(self):
+        ''' Rebuild the flat arrays without the removed texts. '''
+        keep = self.alive[self.entryrow[:self.size]]
+        newrow = np.cumsum(self.alive[:len(self.keys)]) - 1
+        self.entryrow = newrow[self.entryrow[:self.size][keep]].astype(np.int32)
+        self.entryterm = self.entryterm[:self.size][keep]
+        self.entrycount = self.entrycount[:self.size][keep]
+        self.size = len(self.entryrow)
+        self.keys = [key for row, key in enumerate(self.keys) if self.alive[row]]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.alive = np.ones(len(self.keys), bool)
+
+    def search(self, text, n=3, threshold=0.0):
+        ''' Return up to n (key, score) tuples of the texts most similar to
+            text, with a cosine similarity of at least threshold. '''
+        if not self.rows:
+            return []
+        terms, counts = self.counts(text)
+        if not len(terms):
+            return []
+        idf = np.log((1.0 + len(self.rows)) / (1.0 + self.df[:len(self.vocab)])) + 1.0
+        query = np.zeros(len(self.vocab), np.float32)
+        query[terms] = counts * idf[terms]
+        qnorm = np.sqrt(np.dot(query, query))
+
+        rows = self.entryrow[:self.size]
+        weights = self.entrycount[:self.size] * idf[self.entryterm[:self.size]]
+        nrows = len(self.keys)
+        norms = np.sqrt(np.bincount(rows, weights * weights, nrows))
+        dots = np.bincount(rows, weights * query[self.entryterm[:self.size]], nrows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = np.where(self.alive[:nrows] & (norms > 0),
+                              dots / (norms * qnorm), 0.0)
+        best = np.argsort(-scores)[:n]
+        return [(self.keys[row], float(scores[row])) for row in best
+                if scores[row] >= threshold and scores[row] > 0]
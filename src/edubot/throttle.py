@@ -0,0 +1,120 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Rate limiting of user commands and of messages sent by the bot."""
+import asyncio
+import sys
+import time
+import traceback
+from collections import Counter, OrderedDict
+
+from discord.ext import commands
+
+
+class Throttled(commands.CheckFailure):
+    ''' Raised when a user sends commands faster than allowed. '''
+
+
+class Throttle:
+    ''' Token bucket per key (e.g., user id). Each bucket holds up to burst
+        tokens, and refills at rate tokens per second. A call costs one
+        token, and is refused when the bucket is empty. The counts of
+        allowed and throttled calls, and of any other named events, are
+        kept as metrics.
+    '''
+    # Drop full buckets when there are this many
+    maxbuckets = 1000
+
+    def __init__(self, rate=0.2, burst=3):
+        self.rate = rate
+        self.burst = burst
+        # (tokens, time of last update) by key
+        self.buckets = dict()
+        self.counts = Counter()
+
+    def allow(self, key, now=None):
+        ''' Take a token from the bucket of key.
+            Returns: True if there was a token. '''
+        now = time.time() if now is None else now
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        allowed = tokens >= 1
+        self.buckets[key] = (tokens - allowed, now)
+        self.counts['allowed' if allowed else 'throttled'] += 1
+        if len(self.buckets) > self.maxbuckets:
+            self.prune(now)
+        return allowed
+
+    def prune(self, now):
+        ''' Drop the buckets that are full again. '''
+        self.buckets = {key: (tokens, last) for key, (tokens, last)
+                        in self.buckets.items()
+                        if tokens + (now - last) * self.rate < self.burst}
+
+    def count(self, name):
+        ''' Count an event in the metrics of this throttle. '''
+        self.counts[name] += 1
+
+    def metrics(self):
+        ''' Return the metrics as display text. '''
+        return ', '.join(f'{name}: {self.counts[name]}' for name in
+                         ('allowed', 'throttled', 'coalesced', 'redundant'))
+
+
+class Outbox:
+    ''' Queue of messages that are sent at a limited rate, e.g., DMs.
+
+        Messages are sent in order by calling send(key, *args). When a new
+        message is put for a key that still has a message waiting, the
+        waiting message is replaced, so a user only gets the latest news.
+        Failed sends are reported to onerror('send', key, *args) while the
+        exception is handled, like the on_error event handler of a bot.
+    '''
+    def __init__(self, send, rate=2.0, onerror=None):
+        self.send = send
+        self.rate = rate
+        self.onerror = onerror
+        self.pending = OrderedDict()
+        self.task = None
+        self.counts = Counter()
+
+    def put(self, key, *args):
+        ''' Queue a message for key. '''
+        if key in self.pending:
+            self.counts['replaced'] += 1
+        self.pending[key] = args
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        ''' Send the queued messages. '''
+        try:
+            while self.pending:
+                key, args = self.pending.popitem(last=False)
+                try:
+                    await self.send(key, *args)
+                    self.counts['sent'] += 1
+                except Exception:
+                    self.counts['failed'] += 1
+                    if self.onerror is not None:
+                        await self.onerror('send', key, *args)
+                    else:
+                        print(f'Failed to send message to {key}:', file=sys.stderr)
+                        traceback.print_exc()
+                await asyncio.sleep(1.0 / self.rate)
+        finally:
+            self.task = None
@@ -0,0 +1,57 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from edubot.analytics import QuizAnalytics
+from edubot.cogs.poll import Quiz
+
+
+def make_quiz(msgid, votes, correct=None):
+    """Returns a finished quiz with the given votes per option."""
+    quiz = Quiz(None, 1)
+    quiz.message_id, quiz.channel_id = msgid, 5
+    quiz.options = {option: str(option) for option in votes}
+    quiz.votes = {option: set(uids) for option, uids in votes.items()}
+    quiz.correct_answer = correct
+    return quiz
+
+
+def test_student_stats(tmp_path, monkeypatch):
+    """Participation and accuracy are computed per student and guild."""
+    monkeypatch.setattr(QuizAnalytics, "maxsegments", 2)
+    analytics = QuizAnalytics(tmp_path)
+    analytics.record(make_quiz(1, {1: [10, 11], 2: [12]}, correct=1), 7)
+    # Multiple votes are only correct when all chosen options are correct
+    analytics.record(make_quiz(2, {1: [10], 2: [10, 12]}, correct=2), 7)
+    analytics.record(make_quiz(3, {1: [11], 2: [13]}), 7)
+    analytics.record(make_quiz(4, {1: [10]}, correct=1), 8)
+    assert len(analytics.segments()) == 2
+
+    # A new instance reads the columns back from disk
+    stats, nquizzes = QuizAnalytics(tmp_path).studentstats(7)
+    assert nquizzes == 3
+    assert stats["student"].tolist() == [10, 11, 12, 13]
+    assert stats["answered"].tolist() == [2, 2, 2, 1]
+    assert stats["graded"].tolist() == [2, 1, 2, 0]
+    assert stats["correct"].tolist() == [1, 1, 1, 0]
+    assert np.isnan(stats["accuracy"][3])
+
+    csv = analytics.tocsv(7).splitlines()
+    assert csv[0].startswith("student,answered,participation")
+    assert csv[4] == "13,1,0.333,0,0,"
+    assert analytics.studentstats(8)[0]["correct"].tolist() == [1]
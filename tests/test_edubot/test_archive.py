@@ -0,0 +1,59 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+from edubot.archive import QuestionArchive
+
+
+def entry(idx, question, answer):
+    return dict(idx=idx, question=question, answer=answer, amendments=[])
+
+
+def test_archive_search(tmp_path, monkeypatch):
+    """Entries are found in full and current segments, also after reloading."""
+    monkeypatch.setattr(QuestionArchive, "segsize", 200)
+    archive = QuestionArchive(tmp_path)
+    for idx in range(1, 11):
+        archive.add(entry(idx, f"Question about topic{idx}", "Some answer"))
+    numpy = archive.add(entry(11, "How do I install numpy?", "Use pip"))
+    assert archive.nseg > 1
+
+    # An amendment is appended to the current segment, and is searchable
+    first = archive.find(1)
+    first["amendments"].append([5, "See also the numpy docs"])
+    archive.update(first)
+
+    for arch in (archive, QuestionArchive(tmp_path)):
+        assert len(arch) == 11
+        assert arch.find(11) == numpy
+        assert arch.find(1)["amendments"] == [[5, "See also the numpy docs"]]
+        assert [e["idx"] for e in arch.search("install numpy")] == [11, 1]
+        assert [e["idx"] for e in arch.search("topic3")] == [3]
+        assert arch.search("nothing") == []
+
+
+def test_archive_partial_write(tmp_path):
+    """Partially written entries are dropped when loading."""
+    archive = QuestionArchive(tmp_path)
+    archive.add(entry(1, "Why?", "Because"))
+    with open(archive.segment(0), "a") as fout:
+        fout.write('{"id": 1, "idx": 2')
+    with open(archive.offsetfile, "ab") as fout:
+        fout.write(b"\0" * 5)
+    archive = QuestionArchive(tmp_path)
+    assert len(archive) == 1
+    assert archive.add(entry(2, "How?", "Like this"))["id"] == 1
+    assert archive.find(2)["question"] == "How?"
@@ -0,0 +1,158 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import itertools
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from edubot.breakout import BreakoutPool
+from edubot.cogs.queue import Queue, QueueCog, ReviewQueue
+from tests.helpers import MockContext
+
+
+@pytest.fixture
+def pool() -> BreakoutPool:
+    """Returns a pool in a mocked category that creates empty channels."""
+    ids = itertools.count(100)
+    category = MagicMock()
+    category.create_voice_channel = AsyncMock(
+        side_effect=lambda *args, **kwargs: MagicMock(
+            id=next(ids), members=[], delete=AsyncMock()
+        )
+    )
+    return BreakoutPool(category, spare=2)
+
+
+@pytest.mark.asyncio
+async def test_acquire_and_recycle(pool):
+    """Channels are handed out without API calls and recycled when empty."""
+    assert pool.acquire(1) is None
+    await pool.update()
+    assert len(pool.free) == 2
+
+    chan = pool.acquire(1)
+    assert chan is not None and pool.acquire(1) is chan
+    assert pool.owns(chan)
+    await pool.update()
+    assert len(pool.free) == 2
+
+    # A released channel is only recycled once everyone has left
+    chan.members = [MagicMock()]
+    pool.release(1)
+    await pool.update()
+    assert chan in pool.released
+    chan.members = []
+    await pool.update()
+    # Surplus spare channels are deleted
+    assert chan not in pool.released
+    assert len(pool.free) == 2
+
+
+@pytest.mark.asyncio
+async def test_reclaim_idle(pool):
+    """Channels of TAs that left are reclaimed after the idle time."""
+    await pool.update()
+    spare = pool.free[0]
+    chan = pool.acquire(1)
+    pool.idle = -1.0
+    await pool.update()
+    assert pool.assigned == {}
+    assert pool.released == []
+    # The reclaimed channel is spare again, so none are created or deleted
+    assert pool.free == [spare, chan]
+    chan.delete.assert_not_awaited()
+    assert pool.category.create_voice_channel.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_no_channel_without_students(pool, monkeypatch):
+    """A breakout channel is only handed out once students are claimed."""
+    await pool.update()
+    monkeypatch.setitem(BreakoutPool.pools, 7, pool)
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile([10])
+    queue.bot = MagicMock(dm=AsyncMock())
+    ctx = MockContext(author=MagicMock(id=1, voice=None))
+    ctx.channel.category_id = 7
+    ctx.guild.fetch_member = AsyncMock(return_value=MagicMock(id=10, voice=None))
+    ctx.send = AsyncMock()
+
+    await queue.takenext(ctx)
+    assert pool.assigned == {}
+    assert queue.tofile() == [10]
+    assert "noone in the queue who is ready" in ctx.send.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_restore_after_restart(pool, monkeypatch):
+    """The channels and counter of a pool are saved with its queue."""
+    monkeypatch.setattr(BreakoutPool, "pools", {})
+    monkeypatch.setattr(BreakoutPool, "detached", {})
+    monkeypatch.setattr(Queue, "queues", {})
+    monkeypatch.setattr(Queue, "storage", MagicMock(incremental=False))
+    pool.category.id = 7
+    pool.owner = (1, 2)
+    BreakoutPool.pools[7] = pool
+    await pool.update()
+    chan = pool.acquire(1)
+    await pool.update()
+    qjson = ReviewQueue((1, 2), "guild", "channel").tojson()
+    assert qjson["breakouts"]["counter"] == 3
+    assert ReviewQueue((1, 2), "guild", "channel").busy()
+
+    # After a restart the channels are found again once the bot is ready
+    channels = {c.id: c for c in pool.free + [chan, pool.category]}
+    BreakoutPool.pools.clear()
+    bot = MagicMock(get_channel=lambda cid: None, loop=asyncio.get_running_loop())
+    monkeypatch.setattr(Queue, "bot", bot)
+    Queue.fromjson((1, 2), qjson)
+    assert BreakoutPool.pools == {}
+    assert Queue.queues[(1, 2)].tojson()["breakouts"] == qjson["breakouts"]
+    bot.get_channel = channels.get
+    await QueueCog.on_ready(MagicMock(evictor=1))
+    restored = BreakoutPool.pools[7]
+    assert restored.owner == (1, 2) and restored.assigned == {1: chan}
+    assert restored.free == pool.free
+    restored.spare = 3
+    await restored.update()
+    assert pool.category.create_voice_channel.await_args.args[0] == "Breakout 4"
+    restored.stop()
+
+
+@pytest.mark.asyncio
+async def test_close_deletes_all_channels(pool, monkeypatch):
+    """A closed pool deletes all its channels, each once it is empty."""
+    monkeypatch.setattr(BreakoutPool, "pools", {7: pool})
+    pool.category.id = 7
+    pool.interval = 0.01
+    await pool.update()
+    chan = pool.acquire(1)
+    chan.members = [MagicMock()]
+    pool.close()
+    assert pool.acquire(2) is None and not pool.available(2)
+    pool.start(asyncio.get_running_loop())
+    await asyncio.sleep(0.05)
+    assert pool.free == [] and pool.released == [chan]
+    chan.delete.assert_not_awaited()
+    assert 7 in BreakoutPool.pools
+
+    chan.members = []
+    await asyncio.sleep(0.05)
+    chan.delete.assert_awaited_once()
+    assert pool.task is None and BreakoutPool.pools == {}
@@ -0,0 +1,93 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from edubot.cogs.queue import Queue, ReviewQueue
+from edubot.dashboard import Dashboard, QueueRow
+
+
+@pytest.mark.asyncio
+async def test_dashboard(monkeypatch):
+    """Queue changes update the totals, and are shown in throttled edits."""
+    monkeypatch.setattr(Dashboard, "interval", 0.05)
+    monkeypatch.setattr(Dashboard, "dashboards", {})
+    monkeypatch.setattr(Queue, "storage", MagicMock(incremental=False))
+    now = time.time()
+    dashboard = Dashboard(1, {(1, 3): QueueRow("questions", "Question", 2, now - 300, 0)})
+    dashboard.message = MagicMock(edit=AsyncMock())
+    Dashboard.dashboards[1] = dashboard
+
+    queue = ReviewQueue((1, 2), "guild", "review")
+    queue.fromfile([10, 11])
+    queue.enqueued = {10: now - 900, 11: now - 60}
+    queue.changed()
+    queue.fromfile([11])
+    queue.enqueued = {11: now - 60}
+    queue.changed()
+    ReviewQueue((2, 4), "other", "review").changed()
+    assert dashboard.waiting == 3 and len(dashboard.rows) == 2
+
+    await asyncio.sleep(0.1)
+    dashboard.message.edit.assert_awaited_once()
+    embed = dashboard.message.edit.await_args.kwargs["embed"]
+    assert "**Waiting:** 3 in 2 queues" in embed.description
+    assert "~5 min" in embed.description
+    assert [field.name for field in embed.fields] == ["#questions", "#review"]
+    dashboard.stop()
+
+
+@pytest.mark.asyncio
+async def test_dashboard_active_tas(monkeypatch):
+    """Queues report again when their TAs stop counting as active."""
+    monkeypatch.setattr(Dashboard, "interval", 0.01)
+    monkeypatch.setattr(Dashboard, "dashboards", {})
+    monkeypatch.setattr(Queue, "storage", MagicMock(incremental=False))
+    monkeypatch.setattr(ReviewQueue, "activewindow", 0.08)
+    queue = ReviewQueue((1, 2), "guild", "review")
+    dashboard = Dashboard(1, {})
+    dashboard.message = MagicMock(edit=AsyncMock())
+    Dashboard.dashboards[1] = dashboard
+
+    queue.startservice(98, (queue.stats,))
+    await asyncio.sleep(0.04)
+    queue.startservice(99, (queue.stats,))
+    queue.changed()
+    assert dashboard.tas == 2
+    await asyncio.sleep(0.06)
+    assert dashboard.tas == 1
+    await asyncio.sleep(0.04)
+    assert dashboard.tas == 0 and queue.expiry is None
+    assert "**Active TAs:** 0" in dashboard.message.edit.await_args.kwargs["embed"].description
+    dashboard.stop()
+
+
+def test_oldest_in_order(monkeypatch):
+    """The oldest entry of a queue is kept first, also after a putback."""
+    monkeypatch.setattr(Queue, "storage", MagicMock(incremental=False))
+    monkeypatch.setattr(Queue, "queues", {})
+    queue = ReviewQueue((1, 2), "guild", "review")
+    queue.fromfile([10, 11, 12])
+    queue.enqueued = {10: 1.0, 11: 2.0, 12: 3.0}
+    queue.requeued(10, 4.0)
+    assert queue.oldest() == 2.0
+    loaded = Queue.fromjson((1, 5), dict(queue.tojson(), enqueued=[[12, 3.0], [11, 2.0]]))
+    assert loaded.oldest() == 2.0
@@ -0,0 +1,285 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import itertools
+import json
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from edubot.cogs.poll import Poll, Quiz, QuizTemplates, ReactionSeeder, VoteBatcher
+from edubot.storage import JSONStorage
+
+
+def test_template_cache(tmp_path):
+    """Quiz files are parsed once, and the index follows changes."""
+    quizfile = tmp_path / "a.json"
+    quizfile.write_text(json.dumps(dict(question="Q?", options=["x", "y"])))
+    templates = QuizTemplates(tmp_path)
+    assert templates.names() == ["a.json"]
+
+    data = templates.get("a.json")
+    assert templates.get("a.json") is data
+    ok, quiz = Quiz(quizfile, 1).load_data(data)
+    assert ok and quiz.options == {1: "x", 2: "y"}
+
+    # A rewritten file is parsed again once the index is updated
+    quizfile.write_text(json.dumps(dict(question="Q?", options=["z"])))
+    os.utime(quizfile, (0, 0))
+    assert templates.get("a.json") is data
+    templates.update("a.json")
+    assert templates.get("a.json")["options"] == ["z"]
+
+    # Files added by other means are found, removed files are dropped
+    (tmp_path / "b.json").write_text("{}")
+    assert templates.get("b.json") == {}
+    assert templates.names() == ["a.json", "b.json"]
+    quizfile.unlink()
+    templates.update("a.json")
+    assert "a.json" not in templates
+    assert templates.get("a.json") is None
+
+
+def make_quiz(poll, msgid):
+    """Adds an active quiz with a few votes to poll."""
+    quiz = Quiz(None, 1)
+    quiz.name, quiz.question = "Quiz", "Q?"
+    quiz.message_id, quiz.channel_id = msgid, 5
+    quiz.options = {1: "a", 2: "b"}
+    quiz.votes = {1: {10, 11}, 2: {12}}
+    poll.quizzes[msgid] = quiz
+    return quiz
+
+
+@pytest.fixture
+def poll(tmp_path) -> Poll:
+    """Returns a Poll cog with a mocked bot, storing in tmp_path."""
+    bot = MagicMock(datadir=tmp_path, storage=JSONStorage(tmp_path), standby=None)
+    return Poll(bot)
+
+
+def test_standby_leaves_storage(tmp_path):
+    """A standby doesn't read the quizzes of the primary until it takes over."""
+    storage = MagicMock()
+    poll = Poll(MagicMock(datadir=tmp_path, storage=storage, standby=MagicMock()))
+    storage.readquizzes.assert_not_called()
+    storage.readquizzes.return_value = None
+    poll.load_quizzes()
+    storage.readquizzes.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_deck(poll, monkeypatch):
+    """Decks reveal pre-posted questions one after the other."""
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.seeder.spacing = 0.0
+    questions = [dict(question=f"Q{i}?", options=["a", "b"]) for i in range(3)]
+    deck = dict(name="Deck", timer=5, questions=questions)
+    (poll.datadir / "deck.json").write_text(json.dumps(deck))
+    poll.templates.refresh()
+
+    ids = itertools.count(100)
+    channel = MagicMock(id=1)
+    channel.send = AsyncMock(
+        side_effect=lambda **kwargs: MagicMock(
+            id=next(ids), edit=AsyncMock(), add_reaction=AsyncMock()
+        )
+    )
+    ctx = MagicMock(channel=channel, author=MagicMock(id=2))
+    revealed = []
+
+    async def countdown(timer, message):
+        assert timer == 5
+        # Let the next question be posted
+        for _ in range(5):
+            await asyncio.sleep(0)
+        revealed.append((message.id, set(poll.placeholders)))
+
+    monkeypatch.setattr(poll, "countdown", countdown)
+    monkeypatch.setattr(poll, "finish_quiz", AsyncMock())
+    monkeypatch.setattr(poll, "store_quiz", MagicMock())
+
+    await poll.start_deck.callback(poll, ctx, "deck")
+    while len(poll.finish_quiz.await_args_list) < 3:
+        await asyncio.sleep(0)
+
+    # Each next question was already posted while the previous one ran
+    assert [msgid for msgid, _ in revealed] == [100, 101, 102]
+    assert revealed[0][1] == {101} and revealed[2][1] == set()
+    assert [q.name for q in poll.quizzes.values()] == [
+        "Deck (1/3)",
+        "Deck (2/3)",
+        "Deck (3/3)",
+    ]
+    assert channel.send.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_deck_error(poll, monkeypatch):
+    """A failing deck reports the error and deletes the unrevealed question."""
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.bot.on_error = AsyncMock()
+    poll.seeder.spacing = 0.0
+    messages = [MagicMock(id=100 + i, edit=AsyncMock(), add_reaction=AsyncMock(), delete=AsyncMock())
+                for i in range(3)]
+    channel = MagicMock(id=1)
+    channel.send = AsyncMock(side_effect=messages)
+    quizzes = [Quiz(None, 2).load_data(dict(question=f"Q{i}?", options=["a", "b"], timer=5))[1]
+               for i in range(3)]
+    monkeypatch.setattr(poll, "countdown", AsyncMock(side_effect=RuntimeError))
+    monkeypatch.setattr(poll, "store_quiz", MagicMock())
+
+    await poll.run_deck(channel, "Deck", quizzes)
+    poll.bot.on_error.assert_awaited_once_with("run_deck", "Deck")
+    assert poll.placeholders == set() and channel.send.await_count == 2
+    messages[1].delete.assert_awaited_once()
+    messages[0].delete.assert_not_awaited()
+    assert 100 in poll.quizzes and 101 not in poll.quizzes
+
+
+@pytest.mark.asyncio
+async def test_reaction_seeding():
+    """Reactions are requested in order, with a bounded pipeline."""
+    started, in_flight = [], []
+
+    async def add_reaction(em):
+        started.append(em)
+        in_flight.append(em)
+        await asyncio.sleep(0.01)
+        assert len(in_flight) <= 3
+        in_flight.remove(em)
+
+    message = MagicMock(add_reaction=add_reaction)
+    seeder = ReactionSeeder(spacing=0.0, concurrency=3)
+    await seeder.seed(message, list(range(10)))
+    assert started == list(range(10))
+
+
+def test_vote_before_seeding():
+    """Votes count for any option emoji, but not for unused emojis."""
+    quiz = Quiz(None, 1)
+    quiz.options = {1: "a", 2: "b"}
+    quiz.votes = {1: set(), 2: set()}
+    assert quiz.vote(5, quiz.emoji_options[1]) == [(2, True)]
+    assert quiz.vote(5, quiz.emoji_options[0]) == [(2, False), (1, True)]
+    assert quiz.vote(5, quiz.emoji_options[2]) == []
+    assert quiz.votes == {1: {5}, 2: set()}
+
+
+@pytest.mark.asyncio
+async def test_finish_uploads_chart_once(poll, monkeypatch):
+    """Results are uploaded once, and the DMs show the uploaded chart."""
+    poll.bot.loop = asyncio.get_event_loop()
+    monkeypatch.setattr(poll.analytics, "record", MagicMock())
+    quiz = make_quiz(poll, 100)
+    quiz.footer = "Time left: 0:01"
+    message = MagicMock(clear_reactions=AsyncMock(), edit=AsyncMock())
+    sent = MagicMock(jump_url="jump", attachments=[MagicMock(url="chart")])
+    channel = MagicMock(send=AsyncMock(return_value=sent))
+    channel.get_partial_message.return_value = message
+    user = MagicMock(send=AsyncMock())
+    poll.bot.get_channel.return_value = channel
+    poll.bot.get_user.return_value = user
+
+    await poll.finish_quiz.callback(poll, quiz.message_id)
+    assert quiz.message_id not in poll.quizzes
+    message.clear_reactions.assert_awaited_once()
+    message.edit.assert_awaited_once()
+    embed = message.edit.await_args.kwargs["embed"]
+    assert embed.colour.value == 0x25a52b and embed.footer.text == "Time left: 0:01"
+    assert "file" in channel.send.await_args.kwargs
+    user.send.assert_awaited_once()
+    assert "file" not in user.send.await_args.kwargs
+    assert user.send.await_args.kwargs["embed"].image.url == "chart"
+
+
+@pytest.mark.asyncio
+async def test_finish_without_channel(poll, monkeypatch):
+    """A quiz whose channel is gone still closes, and its chart is sent directly."""
+    poll.bot.loop = asyncio.get_event_loop()
+    monkeypatch.setattr(poll.analytics, "record", MagicMock())
+    quiz = make_quiz(poll, 100)
+    user = MagicMock(send=AsyncMock())
+    poll.bot.get_channel.return_value = None
+    poll.bot.get_user.return_value = user
+
+    await poll.finish_quiz.callback(poll, quiz.message_id)
+    assert quiz.message_id not in poll.quizzes
+    poll.analytics.record.assert_not_called()
+    user.send.assert_awaited_once()
+    assert "file" in user.send.await_args.kwargs
+
+@pytest.mark.asyncio
+async def test_vote_batching(poll, monkeypatch):
+    """Reaction storms are applied per batch, last vote wins."""
+    quiz = make_quiz(poll, 100)
+    quiz.votes = {1: set(), 2: set()}
+    message = MagicMock(remove_reaction=AsyncMock())
+    poll.bot.get_channel.return_value.get_partial_message.return_value = message
+    poll.bot.user.id = 1
+    monkeypatch.setattr(poll.storage, "run", MagicMock())
+    poll.vote_batcher.window = 0.01
+
+    def event(uid, option, admin=False):
+        member = MagicMock(id=uid)
+        member.guild_permissions.administrator = admin
+        return MagicMock(
+            message_id=100,
+            channel_id=5,
+            user_id=uid,
+            member=member,
+            emoji=quiz.emoji_options[option - 1],
+        )
+
+    # Option 3 isn't part of the quiz: it doesn't replace the earlier vote of 11
+    for uid, option in ((10, 1), (10, 2), (11, 1), (10, 2), (12, 2), (11, 3)):
+        await poll.on_raw_reaction_add(event(uid, option, admin=uid == 12))
+    await asyncio.sleep(0.05)
+
+    assert quiz.votes == {1: {11}, 2: {10, 12}}
+    poll.storage.run.assert_called_once()
+    # Duplicate reactions are removed once, those of admins are kept
+    assert message.remove_reaction.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_vote_batch_error():
+    """A failed batch is reported, and handled once more before newer votes."""
+    calls = []
+
+    async def handler(message_id, events):
+        calls.append(list(events))
+        if len(calls) == 1:
+            # A newer vote arrives while the batch fails
+            batcher.add(MagicMock(message_id=100, n=2))
+        if len(calls) != 2:
+            raise RuntimeError
+
+    onerror = AsyncMock()
+    batcher = VoteBatcher(handler, window=0.01, onerror=onerror)
+    batcher.add(MagicMock(message_id=100, n=1))
+    await asyncio.sleep(0.05)
+    assert [[event.n for event in events] for events in calls] == [[1], [1, 2]]
+    onerror.assert_awaited_once_with("process_votes", 100)
+
+    # A batch that fails again is dropped
+    batcher.add(MagicMock(message_id=100, n=3))
+    await asyncio.sleep(0.05)
+    assert [[event.n for event in events] for events in calls[2:]] == [[3], [3]]
+    assert onerror.await_count == 3 and batcher.pending == {}
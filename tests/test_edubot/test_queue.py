@@ -0,0 +1,368 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from edubot.cogs.queue import MultiReviewQueue, Queue, QuestionQueue, ReviewQueue
+from edubot.dashboard import Dashboard
+from edubot.selection import Selector
+from edubot.storage import JSONStorage
+from tests.helpers import MockContext
+
+
+@pytest.fixture
+def multi() -> MultiReviewQueue:
+    """Returns a MultiReviewQueue with three assignment queues."""
+    queue = MultiReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile(
+        dict(
+            assignments=["1", "2", "3"],
+            queue={"1": [10, 11, 12], "2": [12, 13, 10], "3": [14]},
+        )
+    )
+    queue.updateIndicator = AsyncMock()
+    return queue
+
+
+def test_multi_fromfile(multi):
+    """Students keep track of all queues they are in."""
+    assert multi.size() == 5
+    assert multi.aidsof(multi.studentsQueued[10]) == ["1", "2"]
+    assert multi.aidsof(multi.studentsQueued[14]) == ["3"]
+    assert multi.tofile()["queue"]["2"] == [12, 13, 10]
+
+
+@pytest.mark.asyncio
+async def test_convert_to_review(multi):
+    """Merging keeps assignment order and the first entry of a student."""
+    review = ReviewQueue((1, 2), "guild", "channel")
+    await review.convert(MockContext(), multi, None)
+    assert review.tofile() == [10, 11, 12, 13, 14]
+
+    back = MultiReviewQueue((1, 2), "guild", "channel")
+    review.assignments = []
+    await back.convert(MockContext(), review, "1")
+    assert back.tofile()["queue"] == {"1": [10, 11, 12, 13, 14]}
+    assert back.size() == 5
+
+
+@pytest.mark.asyncio
+async def test_stop_reviewing(multi):
+    """Closing a queue removes its students from the bookkeeping."""
+    await multi.stopReviewing(MockContext(), "3")
+    assert multi.assignments == ["1", "2"]
+    assert 14 not in multi.studentsQueued
+    assert multi.size() == 4
+    assert multi.remove(12) == "<@12> removed from all queues."
+    assert multi.tofile()["queue"] == {"1": [10, 11], "2": [13, 10]}
+
+
+@pytest.mark.parametrize(
+    "strategy, expected", [("first", "1"), ("oldest", "2"), ("longest", "3")]
+)
+def test_selection_strategies(multi, strategy, expected):
+    """The selection strategy decides which queue is served first."""
+    multi.enqueued = {("1", 10): 20.0, ("2", 12): 10.0, ("3", 14): 30.0}
+    multi.queue["3"].extend([15, 16, 17])
+    multi.selector = Selector.make(strategy)
+    multi.selector.rebuild(multi)
+    assert multi.selector.select() == expected
+
+
+def test_selection_updates(multi):
+    """Emptied queues are skipped, and all-empty gives no selection."""
+    multi.selector = Selector.make("first")
+    multi.selector.rebuild(multi)
+    multi.removeone(10, "1")
+    multi.removeone(11, "1")
+    assert multi.selector.select() == "1"
+    multi.removeone(12, "1")
+    assert multi.selector.select() == "2"
+    for uid in (12, 13, 14, 10):
+        multi.remove(uid)
+    assert multi.selector.select() is None
+
+
+@pytest.mark.asyncio
+async def test_batch_takenext():
+    """Group takes claim the first ready students and skip unready ones."""
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile([10, 11, 12, 13, 14])
+    queue.bot = MagicMock(dm=AsyncMock())
+    voice = MagicMock(self_stream=False)
+    members = {
+        uid: MagicMock(id=uid, voice=None if uid == 11 else voice, edit=AsyncMock())
+        for uid in range(10, 15)
+    }
+    ctx = MockContext(author=MagicMock(id=1, voice=voice))
+    ctx.guild.fetch_member = AsyncMock(side_effect=members.get)
+    ctx.send = AsyncMock()
+
+    await queue.takenext(ctx, None, 3)
+    assert [uid for uid, _, _ in queue.assigned[1]] == [10, 12, 13]
+    # The unready student is placed back once; with a short queue left
+    # that is at the end
+    assert queue.tofile() == [14, 11]
+    for uid in (10, 12, 13):
+        members[uid].edit.assert_awaited_once()
+    members[11].edit.assert_not_awaited()
+    assert queue.sessions[1][2] == 3
+
+    # Putting back part of the group keeps the session of the others
+    await queue.putback(ctx, 1, {12})
+    assert queue.tofile() == [14, 12, 11]
+    assert queue.sessions[1][2] == 2
+    await queue.putback(ctx, 1)
+    assert queue.tofile() == [14, 10, 13, 12, 11]
+    assert queue.assigned[1] == []
+    assert 1 not in queue.sessions
+
+
+@pytest.mark.asyncio
+async def test_indicator_reattached_on_load(multi, tmp_path, monkeypatch):
+    """Indicator ids are saved, and reattached and edited after loading."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    monkeypatch.setattr(Queue, "queues", dict())
+    channel = MagicMock()
+    monkeypatch.setattr(Queue, "bot", MagicMock(get_channel=lambda cid: channel))
+    multi.indicator = MagicMock(id=1234)
+    multi.enqueued = {("1", 10): 5.0}
+    await multi.save()
+
+    assert (await Queue.load((1, 2))).startswith("Loaded a MultiReview queue")
+    loaded = Queue.queues[(1, 2)]
+    channel.get_partial_message.assert_called_once_with(1234)
+    assert loaded.indicator is channel.get_partial_message.return_value
+    assert loaded.enqueued == {("1", 10): 5.0}
+
+    loaded.indicator.edit = AsyncMock()
+    await loaded.refreshIndicator()
+    loaded.indicator.edit.assert_awaited_once()
+    channel.send.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_lazy_loading_and_eviction(multi, tmp_path, monkeypatch):
+    """Indexed queues load on first use, and idle queues are unloaded."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    monkeypatch.setattr(Queue, "queues", dict())
+    monkeypatch.setattr(Queue, "index", set())
+    monkeypatch.setattr(Queue, "bot", None)
+    await multi.save()
+    Queue.buildindex()
+    assert Queue.index == {(1, 2)}
+    assert await Queue.get((3, 4)) is None
+
+    queue = await Queue.get((1, 2))
+    assert queue.tofile()["queue"] == multi.tofile()["queue"]
+    assert await Queue.get((1, 2)) is queue
+
+    await Queue.evictidle(now=queue.lastused + Queue.idlettl / 2)
+    assert (1, 2) in Queue.queues
+    # Students taken by a TA that is still reviewing keep the queue loaded
+    later = queue.lastused + 2 * Queue.idlettl
+    queue.aidstat("1").record_service(300)
+    queue.startservice(5, (queue.stats, queue.aidstat("1")), now=later - 60)
+    queue.assigned[5] = [queue.studentsQueued[10]]
+    await Queue.evictidle(now=later)
+    assert (1, 2) in Queue.queues
+    await Queue.evictidle(now=later + Queue.activewindow)
+    assert (1, 2) not in Queue.queues
+    loaded = await Queue.get((1, 2))
+    assert loaded.size() == 5
+    assert loaded.aidstat("1").service == 300
+    assert 5 in loaded.sessions
+
+
+@pytest.mark.asyncio
+async def test_watched_queues_stay_loaded(multi, tmp_path, monkeypatch):
+    """Waiting students with subscriptions or a dashboard keep the queue loaded."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    monkeypatch.setattr(Queue, "queues", {(1, 2): multi})
+    monkeypatch.setattr(Queue, "bot", None)
+    monkeypatch.setattr(Dashboard, "dashboards", {})
+    later = multi.lastused + 2 * Queue.idlettl
+    multi.subscribe(10, (2,))
+    await Queue.evictidle(now=later)
+    assert (1, 2) in Queue.queues
+
+    multi.subscriptions.clear()
+    Dashboard.dashboards[1] = MagicMock()
+    await Queue.evictidle(now=later)
+    assert (1, 2) in Queue.queues
+
+    del Dashboard.dashboards[1]
+    await Queue.evictidle(now=later)
+    assert (1, 2) not in Queue.queues
+    assert (await Queue.get((1, 2))).size() == multi.size()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_question(tmp_path, monkeypatch):
+    """Near-duplicates of open questions are offered to be followed."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([["How do I install numpy?", [10]]])
+    ctx = MockContext(author=MagicMock(id=11))
+    ctx.send = AsyncMock()
+
+    await queue.add(ctx, 11, "How can I install NumPy")
+    assert "!follow 1" in ctx.send.await_args.args[0]
+    assert 1 not in queue.answers and queue.maxidx == 1
+    await queue.add(ctx, 11, "Why does my plot not show?")
+    await queue.add(ctx, 11, "how to install numpy", force=True)
+    assert list(queue.queue) == [1, 2, 3]
+
+    # Answered questions are no longer matched
+    queue.answers[1] = queue.queue.pop(1)
+    queue.textindex.remove(1)
+    assert queue.similar("Install numpy?") == 3
+
+
+@pytest.mark.asyncio
+async def test_answer_archive(tmp_path, monkeypatch):
+    """Answers are archived, and can be amended after leaving memory."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    monkeypatch.setattr(Queue, "queues", dict())
+    monkeypatch.setattr(QuestionQueue, "maxanswers", 1)
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([["How do I install numpy?", [10]], ["Why?", [11]]])
+    ctx = MockContext(author=MagicMock(id=1))
+    ctx.send = AsyncMock()
+    ctx.channel.send = AsyncMock(side_effect=lambda *args, **kwargs: MagicMock(id=100))
+
+    await queue.answer(ctx, 1, "pip install numpy")
+    await queue.answer(ctx, 2, "Because")
+    assert list(queue.answers) == [2]
+    assert not queue.busy()
+
+    answer = ctx.channel.get_partial_message.return_value
+    answer.edit = AsyncMock()
+    await queue.amend(ctx, 1, "or use conda")
+    ctx.channel.get_partial_message.assert_called_with(100)
+    assert "or use conda" in answer.edit.await_args.kwargs["embed"].description
+
+    await queue.search(ctx, "numpy conda")
+    embed = ctx.send.await_args.kwargs["embed"]
+    assert "install numpy" in embed.description and "Why" not in embed.description
+
+    # A reloaded queue doesn't reuse the indices of archived answers
+    await queue.add(ctx, 12, "Where is the exam?")
+    reloaded = Queue.fromjson((1, 3), queue.tojson())
+    assert list(reloaded.queue) == [3]
+    await reloaded.add(ctx, 13, "When is the deadline?")
+    assert list(reloaded.queue) == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_suggest_answers(tmp_path, monkeypatch):
+    """Archived answers are offered for new questions, including amendments."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([["How do I install numpy?", [10]]])
+    ctx = MockContext(author=MagicMock(id=1))
+    ctx.send = AsyncMock()
+    ctx.channel.send = AsyncMock(return_value=MagicMock(id=100))
+    ctx.channel.get_partial_message.return_value.edit = AsyncMock()
+    await queue.answer(ctx, 1, "Run pip install numpy")
+
+    # The index is built from the archive on first use
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    await queue.add(ctx, 11, "numpy install fails")
+    embed = ctx.send.await_args.kwargs["embed"]
+    assert "pip install numpy" in embed.description
+
+    assert queue.answerindex.search("conda environment") == []
+    await queue.amend(ctx, 1, "Or use the conda environment")
+    await queue.add(ctx, 12, "Which conda environment should I use?")
+    assert "Or use the conda environment" in ctx.send.await_args.kwargs["embed"].description
+
+
+@pytest.mark.asyncio
+async def test_answer_in_place(tmp_path, monkeypatch):
+    """Answers and batched amendments edit the question message."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    monkeypatch.setattr(QuestionQueue, "amendwindow", 0.01)
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    ctx = MockContext(author=MagicMock(id=1))
+    ctx.send = AsyncMock(return_value=MagicMock(id=100, edit=AsyncMock()))
+    ctx.channel.send = AsyncMock()
+    await queue.add(ctx, 10, "Why?")
+    qmsg = queue.queue[1].disc_msg
+
+    await queue.answer(ctx, 1, "Because")
+    assert "Because" in qmsg.edit.await_args.kwargs["embed"].description
+    # One reply to ping the followers
+    assert ctx.channel.send.await_args.args[0].startswith("<@10>")
+
+    await queue.amend(ctx, 1, "first")
+    await queue.amend(ctx, 1, "second")
+    assert queue.busy()
+    await asyncio.sleep(0.05)
+    assert qmsg.edit.await_count == 2
+    description = qmsg.edit.await_args.kwargs["embed"].description
+    assert "first" in description and "second" in description
+    assert queue.archive.find(1)["amendments"] == [[1, "first"], [1, "second"]]
+    assert not queue.busy()
+
+
+@pytest.mark.asyncio
+async def test_question_pages(tmp_path, monkeypatch):
+    """The question list is cached, paged and marks followed questions."""
+    monkeypatch.setattr(Queue, "storage", JSONStorage(tmp_path))
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([[f"Question about topic{i}", [10 + i]] for i in range(40)])
+    ctx = MockContext(author=MagicMock(id=11))
+    ctx.send = AsyncMock()
+    ctx.channel.send = AsyncMock()
+
+    await queue.follow(ctx, 20)
+    listing = queue.listing()
+    assert queue.npages() == 3
+    page = queue.page(11, 2)
+    assert page.count("\n") == 14
+    assert "**- 20:** Question about topic19 (already following)" in page
+    assert "following" not in queue.page(12, 2)
+    assert queue.listing() is listing
+    assert "Your own question (2) at position 1" in queue.whereis(11)
+
+    await queue.questions(ctx, 5)
+    embed = ctx.channel.send.await_args.kwargs["embed"]
+    assert embed.footer.text.startswith("Page 3/3")
+    await queue.add(ctx, 12, "Something completely different")
+    assert queue.listing() is not listing and queue.npages() == 3
+    assert queue.following[12] == {3, 41}
+
+
+def test_wait_estimates(multi):
+    """Positions come with wait estimates, which survive a reload."""
+    review = ReviewQueue((1, 2), "guild", "channel")
+    review.fromfile([10, 11, 12])
+    review.stats.record_service(600)
+    review.startservice(99, (review.stats,))
+    assert "Expected wait: ~15 min." in review.whereis(11)
+    assert "**Expected wait:** ~35 min" in review.indicatorembed().description
+
+    multi.aidstat("2").record_service(120)
+    multi.startservice(99, (multi.stats, multi.aidstat("2")))
+    assert "**1st** in Queue 1, **3rd** in Queue 2 (expected wait ~5 min)" in multi.whereis(10)
+    loaded = Queue.fromjson((1, 3), multi.tojson())
+    assert loaded.whereis(10) == multi.whereis(10)
+    assert loaded.sessions[99][1] == (loaded.stats, loaded.aidstats["2"])
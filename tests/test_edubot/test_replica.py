@@ -0,0 +1,126 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import subprocess
+import sys
+import time
+
+from edubot.cogs.queue import Queue, ReviewQueue
+from edubot.replica import Journal, Standby
+
+
+def test_journal_follow(tmp_path):
+    """A standby applies all changes, also across a restart of the journal."""
+    applied = []
+    standby = Standby(tmp_path, lambda *record: applied.append(record))
+    journal = Journal(tmp_path, lambda: [("queue", [1, 2], {"n": 0})])
+    journal.write("queue", [1, 2], {"n": 1})
+    journal.flush()
+    standby.poll()
+    assert applied == [("queue", [1, 2], {"n": 0}), ("queue", [1, 2], {"n": 1})]
+
+    # A partially written line is applied once it is complete
+    journal.fout.write('["unload", [1, 2]')
+    journal.fout.flush()
+    standby.poll()
+    assert len(applied) == 2
+    journal.fout.write(", null]\n")
+    journal.write("queue", [3, 4], {"n": 2})
+    journal.rotate()
+    journal.write("queue", [5, 6], {"n": 3})
+    journal.flush()
+    standby.poll()
+    assert [record[0] for record in applied[2:]] == ["unload", "queue", "queue", "queue"]
+    assert applied[-1] == ("queue", [5, 6], {"n": 3})
+    journal.close()
+    standby.close()
+
+
+def test_journal_rotation(tmp_path, monkeypatch):
+    """A journal that grows too large is replaced by a snapshot."""
+    monkeypatch.setattr(Journal, "maxsize", 100)
+    journal = Journal(tmp_path, lambda: [("queue", [1, 2], {"n": 0})])
+    for n in range(10):
+        journal.write("queue", [1, 2], {"n": n})
+    journal.flush()
+    journal.write("queue", [1, 2], {"n": 10})
+    journal.flush()
+    assert journal.journalfile.read_text() == '["queue", [1, 2], {"n": 0}]\n'
+    journal.close()
+
+
+def test_heartbeat(tmp_path):
+    """The primary counts as dead when its heartbeat is stale or its process
+    is gone, unless it stopped on purpose."""
+    standby = Standby(tmp_path, print)
+    assert standby.primaryalive()
+    journal = Journal(tmp_path, list)
+    journal.heartbeat()
+    assert standby.primaryalive()
+    # A stuck primary is taken over once its heartbeat is stale
+    assert not standby.primaryalive(time.time() + standby.timeout)
+    # A primary whose process is gone is taken over right away
+    beat = json.loads(journal.heartbeatfile.read_text())
+    child = subprocess.Popen([sys.executable, "-c", ""])
+    child.wait()
+    journal.heartbeatfile.write_text(json.dumps(dict(beat, pid=child.pid)))
+    assert not standby.primaryalive()
+    journal.close()
+    assert standby.primaryalive(time.time() + standby.timeout)
+
+
+def test_split_brain(tmp_path):
+    """A primary stops its heartbeat once another process took over."""
+    journal = Journal(tmp_path, list)
+    assert journal.heartbeat()
+    other = Journal(tmp_path, list)
+    assert other.heartbeat()
+    assert not journal.heartbeat()
+    assert json.loads(journal.heartbeatfile.read_text())["owner"] == other.owner
+    assert other.heartbeat()
+    other.close()
+
+
+def test_replay(tmp_path, monkeypatch):
+    """Queues are rebuilt from the journal, and dropped when unloaded."""
+    monkeypatch.setattr(Queue, "queues", dict())
+    monkeypatch.setattr(Queue, "index", set())
+    monkeypatch.setattr(Queue, "detached", dict())
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile([10, 11])
+    monkeypatch.setitem(Queue.queues, (1, 2), queue)
+    journal = Journal(tmp_path, Queue.snapshot)
+    queue.fromfile([11, 12, 13])
+    journal.write("queue", queue.qid, queue.tojson())
+    journal.write("unload", (3, 4))
+    journal.flush()
+
+    Queue.queues.clear()
+    standby = Standby(tmp_path, Queue.replay)
+    standby.poll()
+    replayed = Queue.queues[(1, 2)]
+    assert replayed is not queue
+    assert list(replayed.queue) == [11, 12, 13]
+    assert Queue.index == {(1, 2)}
+    assert Queue.detached == {(1, 2): None}
+    journal.write("unload", (1, 2))
+    journal.flush()
+    standby.poll()
+    assert Queue.queues == {}
+    journal.close()
+    standby.close()
@@ -0,0 +1,51 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from edubot.stats import ServiceStats, fmtduration
+
+
+def test_fmtduration():
+    """Durations are rounded to minutes for display."""
+    assert fmtduration(None) == "unknown"
+    assert fmtduration(20) == "<1 min"
+    assert fmtduration(300) == "~5 min"
+    assert fmtduration(3900) == "~1h05"
+
+
+def test_expected_wait():
+    """Expected waits scale with position and the number of TAs."""
+    stats = ServiceStats(alpha=0.5)
+    assert stats.expected_wait(3) is None
+    stats.record_service(600)
+    stats.record_service(200)
+    assert stats.service == pytest.approx(400)
+    assert stats.expected_wait(1) == pytest.approx(600)
+    assert stats.expected_wait(1, servers=2) == pytest.approx(300)
+
+
+def test_wait_quantiles_and_throughput():
+    """Recent waits give percentiles, served students give throughput."""
+    stats = ServiceStats(period=3600.0)
+    for i in range(100):
+        stats.record_wait(float(i), now=1000.0 + i)
+    assert stats.quantile(0.5) == 50.0
+    assert stats.quantile(0.95) == 95.0
+    assert stats.throughput(now=1100.0) == 100
+    # Served students older than the period no longer count
+    assert stats.throughput(now=1050.0 + 3600.0) == 50
@@ -0,0 +1,221 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import json
+
+import pytest
+
+from edubot.storage import JSONStorage, SQLiteStorage, Storage, migrate
+
+QUEUES = {
+    (1, 2): dict(
+        qtype="Review",
+        guildname="guild",
+        channame="review",
+        qdata=[10, 11, 12],
+        enqueued=[[10, 5.0], [12, 7.5]],
+        indicator=1234,
+        stats=dict(
+            stats={"": dict(service=60.0, wait=30.0, waits=[30.0], served=[9.0], total=1)},
+            sessions=[[99, 9.0, [""], 1]],
+        ),
+        subscriptions=[[11, [3, 0]], [12, []]],
+    ),
+    (1, 3): dict(
+        qtype="MultiReview",
+        guildname="guild",
+        channame="multi",
+        qdata=dict(
+            assignments=["1", "2"],
+            queue={"1": [10, 11], "2": [11]},
+            strategy="longest",
+            weights={"2": 2.0},
+        ),
+        enqueued=[[["1", 10], 1.0], [["2", 11], 2.0]],
+        indicator=None,
+        breakouts=dict(category=7, spare=2, counter=3, closing=False,
+                       free=[101, 102], released=[], assigned=[[5, 103]]),
+    ),
+    (1, 4): dict(
+        qtype="Question",
+        guildname="guild",
+        channame="questions",
+        qdata=[["Why?", [10, 11], 2], ["How?", [12], 4]],
+        enqueued=[],
+        indicator=None,
+        maxidx=5,
+    ),
+}
+
+QUIZZES = {
+    "100": dict(
+        name="Quiz",
+        messageid=100,
+        channelid=5,
+        question="Yes?",
+        correct=1,
+        options={"1": "Yes", "2": "No"},
+        owner=1,
+        votes={"1": [10], "2": [11, 12]},
+        singlevote=True,
+        dynamic=False,
+        timer=None,
+    ),
+    "last_started": "Quiz",
+}
+
+
+def normalised(data):
+    """Return data as it would be after a json round trip."""
+    return json.loads(json.dumps(data))
+
+
+@pytest.mark.parametrize("backend", [JSONStorage, SQLiteStorage])
+def test_roundtrip(backend, tmp_path):
+    """Both backends return the saved queues and quizzes unchanged."""
+    storage = backend(tmp_path)
+    assert storage.readquizzes() is None
+    assert storage.readqueue((1, 2)) is None
+    for qid, qjson in QUEUES.items():
+        storage.writequeue(qid, qjson)
+    storage.writequizzes(QUIZZES)
+
+    assert sorted(storage.queueids()) == sorted(QUEUES)
+    for qid, qjson in QUEUES.items():
+        assert normalised(storage.readqueue(qid)) == normalised(qjson)
+    assert normalised(storage.readquizzes()) == normalised(QUIZZES)
+    storage.close()
+
+
+@pytest.mark.parametrize("backend", [JSONStorage, SQLiteStorage])
+def test_incremental_votes(backend, tmp_path):
+    """Votes and finished quizzes are written one change at a time."""
+    storage = backend(tmp_path)
+    storage.writequizzes(QUIZZES)
+    storage.logvotes(100, [(10, 1, False), (10, 2, True), (13, 1, True)])
+    quizzes = backend(tmp_path).readquizzes()
+    assert quizzes["100"]["votes"] == {"1": [13], "2": [10, 11, 12]}
+    storage.writelast("Other")
+    storage.finishquiz(quizzes["100"])
+    assert backend(tmp_path).readquizzes() == {"last_started": "Other"}
+    storage.close()
+
+
+def test_incomplete_backend(tmp_path, monkeypatch):
+    """A backend that misses storage calls can't be created."""
+    monkeypatch.setattr(Storage, "backends", dict())
+
+    class QueuesOnly(Storage):
+        name = "queuesonly"
+
+        def queueids(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Storage.make("queuesonly", tmp_path)
+
+
+def test_vote_log_compaction(tmp_path, monkeypatch):
+    """Long vote logs are folded into the snapshot of their quiz."""
+    monkeypatch.setattr(JSONStorage, "compactsize", 4)
+    storage = JSONStorage(tmp_path)
+    storage.writequizzes(QUIZZES)
+    for uid in range(20, 25):
+        storage.logvotes(100, [(uid, 1, True)])
+    log = storage.votelog(100).read_text().splitlines()
+    assert log == ["+1 24"]
+    votes = storage.readquizzes()["100"]["votes"]
+    assert votes["1"] == [10, 20, 21, 22, 23, 24]
+
+    # A partially written last line is skipped without changing the log, and
+    # cut off by the next process that writes to it
+    with open(storage.votelog(100), "a") as fout:
+        fout.write("+1 2")
+    storage = JSONStorage(tmp_path)
+    assert storage.readquizzes()["100"]["votes"]["1"] == [10, 20, 21, 22, 23, 24]
+    assert storage.votelog(100).read_text() == "+1 24\n+1 2"
+    storage.logvotes(100, [(25, 1, True)])
+    assert storage.votelog(100).read_text() == "+1 24\n+1 25\n"
+
+
+def test_legacy_quiz_import(tmp_path):
+    """Quizzes saved in the single file of earlier versions are imported."""
+    legacy = tmp_path / "quizzes" / "saved_quizzes.backupjson"
+    legacy.parent.mkdir()
+    legacy.write_text(json.dumps(QUIZZES))
+    for _ in range(2):
+        quizzes = JSONStorage(tmp_path).readquizzes()
+        assert normalised(quizzes) == normalised(QUIZZES)
+        assert not legacy.exists()
+
+
+def test_sqlite_queue_rows(tmp_path):
+    """A changed queue replaces only its own rows."""
+    storage = SQLiteStorage(tmp_path)
+    storage.writequeue((1, 2), QUEUES[(1, 2)])
+    storage.writequeue((1, 3), QUEUES[(1, 3)])
+    storage.writequeue((1, 2), dict(QUEUES[(1, 2)], qdata=[12]))
+    assert storage.readqueue((1, 2))["qdata"] == [12]
+    assert normalised(storage.readqueue((1, 2))["enqueued"]) == [[12, 7.5]]
+    assert storage.readqueue((1, 3))["qdata"]["queue"] == {
+        "1": [10, 11],
+        "2": [11],
+    }
+    storage.close()
+
+
+def test_sqlite_entry_changes(tmp_path):
+    """Only added and removed queue entries are written."""
+    storage = SQLiteStorage(tmp_path)
+    qjson = dict(QUEUES[(1, 2)], qdata=list(range(100)), enqueued=[], stats=None)
+    storage.writequeue((1, 2), qjson)
+
+    def write(qdata):
+        before = storage.db.total_changes
+        storage.writequeue((1, 2), dict(qjson, qdata=qdata))
+        assert SQLiteStorage(tmp_path).readqueue((1, 2))["qdata"] == qdata
+        return storage.db.total_changes - before
+
+    assert write(list(range(1, 100))) == 1
+    assert write(list(range(1, 100)) + [100]) == 1
+    assert write([0] + list(range(1, 101))) == 1
+    # Put back in the middle, by bisecting the position keys
+    qdata = list(range(101))
+    for uid in range(200, 210):
+        qdata.insert(10, uid)
+        assert write(qdata) == 1
+    # Until there is no room left, and the entries are renumbered
+    qdata.insert(10, 300)
+    assert write(qdata) > 100
+    storage.close()
+
+
+def test_migrate(tmp_path):
+    """JSON files can be imported into and exported from SQLite."""
+    source = JSONStorage(tmp_path / "json")
+    for qid, qjson in QUEUES.items():
+        source.writequeue(qid, qjson)
+    source.writequizzes(QUIZZES)
+
+    target = SQLiteStorage(tmp_path)
+    assert migrate(source, target) == (3, 1)
+    back = JSONStorage(tmp_path / "back")
+    assert migrate(target, back) == (3, 1)
+    for qid, qjson in QUEUES.items():
+        assert normalised(back.readqueue(qid)) == normalised(qjson)
+    assert normalised(back.readquizzes()) == normalised(QUIZZES)
+    target.close()
@@ -0,0 +1,43 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+from edubot.textindex import TextIndex, tokenize
+
+
+def test_tokenize():
+    """Texts are split in lowercase words, without stop words."""
+    assert tokenize("How do I plot a NumPy array?") == ["plot", "numpy", "array"]
+
+
+def test_search():
+    """The most similar texts are found, also after removals."""
+    index = TextIndex()
+    index.add(1, "Error when importing matplotlib")
+    index.add(2, "How to plot a numpy array")
+    index.add(3, "Plotting a numpy array with matplotlib")
+    assert [key for key, _ in index.search("plot numpy array")] == [2, 3]
+    assert index.search("plot numpy array", threshold=0.99)[0][0] == 2
+    assert index.search("unrelated words") == []
+
+    for key in range(10, 40):
+        index.add(key, f"question number {key}")
+    for key in range(10, 40):
+        index.remove(key)
+    index.remove(2)
+    # Removed texts are dropped from the arrays once there are many
+    assert len(index) == 2 and len(index.keys) < 10
+    assert [key for key, _ in index.search("plot numpy array")] == [3]
@@ -0,0 +1,196 @@
+# Discord educational bot for the Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from edubot.cogs.queue import Queue, QueueCog, ReviewQueue
+from edubot.throttle import Outbox, Throttle
+from tests.helpers import MockContext
+
+
+def test_token_bucket():
+    """Bursts are allowed up to a limit, after which tokens refill slowly."""
+    throttle = Throttle(rate=0.5, burst=2)
+    assert [throttle.allow(1, now=0.0) for _ in range(3)] == [True, True, False]
+    assert throttle.allow(2, now=0.0)
+    assert not throttle.allow(1, now=1.0)
+    assert throttle.allow(1, now=3.0)
+    assert throttle.counts == {"allowed": 4, "throttled": 2}
+    throttle.prune(10.0)
+    assert throttle.buckets == {}
+
+
+def test_prune_keeps_refilling_buckets():
+    """Only full buckets are pruned, so pruning never grants extra tokens."""
+    throttle = Throttle(rate=1.0, burst=3)
+    assert all(throttle.allow(1, now=0.0) for _ in range(3))
+    throttle.prune(2.5)
+    assert 1 in throttle.buckets
+    assert [throttle.allow(1, now=2.5) for _ in range(3)] == [True, True, False]
+    throttle.prune(4.5)
+    assert 1 in throttle.buckets
+    throttle.prune(5.0)
+    assert throttle.buckets == {}
+
+
+@pytest.mark.asyncio
+async def test_redundant_ready(monkeypatch):
+    """Repeated !ready and !whereami share one reply, without indicator updates."""
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile([10, 11])
+    queue.updateIndicator = AsyncMock()
+    storage = MagicMock(incremental=False)
+    monkeypatch.setattr(Queue, "storage", storage)
+    cog = QueueCog(MagicMock(storage=storage))
+    ctx = MockContext(author=MagicMock(id=11))
+    ctx.guild.id, ctx.channel.id = 1, 2
+    reply = MagicMock(edit=AsyncMock())
+    ctx.send = AsyncMock(return_value=reply)
+    monkeypatch.setitem(Queue.queues, (1, 2), queue)
+
+    await cog.queueme.callback(cog, ctx)
+    await cog.whereami.callback(cog, ctx)
+    queue.fromfile([11])
+    await cog.whereami.callback(cog, ctx)
+
+    ctx.send.assert_awaited_once()
+    assert "**2nd** in line" in ctx.send.await_args.args[0]
+    reply.edit.assert_awaited_once_with(content=queue.whereis(11))
+    queue.updateIndicator.assert_not_awaited()
+    assert queue.throttle.counts == {"redundant": 1, "coalesced": 2}
+
+
+@pytest.mark.asyncio
+async def test_position_notifications(monkeypatch):
+    """Students are notified once when they move to one of their thresholds."""
+    outbox = MagicMock()
+    monkeypatch.setattr(Queue, "outbox", outbox)
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile(list(range(10, 20)))
+    queue.subscribe(15, [3])
+
+    def notified():
+        calls = [(key[1], text) for (key, text), _ in outbox.put.call_args_list]
+        outbox.put.reset_mock()
+        return calls
+
+    queue.remove(10)
+    await asyncio.sleep(0)
+    assert [uid for uid, _ in notified()] == [11, 12]
+    queue.remove(11)
+    queue.remove(19)
+    await asyncio.sleep(0)
+    sent = dict(notified())
+    assert sorted(sent) == [12, 13, 15, 16]
+    assert sent[12].startswith("Get ready!")
+    assert "4th in line" in sent[15]
+    # Subscriptions are saved with the queue
+    monkeypatch.setattr(Queue, "queues", {})
+    loaded = Queue.fromjson((1, 3), queue.tojson())
+    assert loaded.subscriptions == {15: (3,)} and loaded.thresholds == {4, 3, 1, 0}
+
+    # Users that skip thresholds are notified once, for the lowest
+    del queue.queue[0:2]
+    queue.shifted(None, 0, [12, 13])
+    await asyncio.sleep(0)
+    sent = dict(notified())
+    assert sorted(sent) == [14, 17, 18]
+    assert sent[14].startswith("Get ready!")
+    assert "4th in line" in sent[17]
+
+    # Users behind a student that is put back reach their thresholds again
+    queue.queue.insert(0, 12)
+    queue.inserted(None, 0)
+    await asyncio.sleep(0)
+    assert notified() == []
+    queue.remove(12)
+    await asyncio.sleep(0)
+    assert [uid for uid, _ in notified()] == [14, 18]
+
+
+@pytest.mark.asyncio
+async def test_notifications_after_takenext(monkeypatch):
+    """Skipped unready students and failed moves keep the positions right."""
+    outbox = MagicMock()
+    monkeypatch.setattr(Queue, "outbox", outbox)
+    monkeypatch.setattr(Queue, "storage", MagicMock(incremental=False))
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile(list(range(10, 18)))
+    queue.bot = MagicMock(dm=AsyncMock())
+    voice = MagicMock(self_stream=False)
+    members = {
+        uid: MagicMock(id=uid, mention=f"<@{uid}>", voice=None if uid == 11 else voice,
+                       edit=AsyncMock())
+        for uid in range(10, 18)
+    }
+    members[12].edit.side_effect = RuntimeError("can't move")
+    ctx = MockContext(author=MagicMock(id=1, voice=voice))
+    ctx.guild.fetch_member = AsyncMock(side_effect=members.get)
+    ctx.send = AsyncMock()
+
+    await queue.takenext(ctx, None, 3)
+    await asyncio.sleep(0)
+    assert queue.tofile() == [14, 15, 11, 16, 17, 12]
+    # The last notification of each student that is still waiting. The
+    # students that were placed back didn't move past a threshold
+    sent = {key[1]: text for (key, text), _ in outbox.put.call_args_list}
+    waiting = {uid: sent[uid] for uid in queue.tofile() if uid in sent}
+    assert sorted(waiting) == [14, 15, 16, 17]
+    assert waiting[14].startswith("Get ready!")
+    assert "2nd in line" in waiting[15] and "5th in line" in waiting[17]
+    assert queue.reached == {(None, 14): 0, (None, 15): 1, (None, 16): 4, (None, 17): 4}
+
+
+@pytest.mark.asyncio
+async def test_outbox():
+    """Queued messages are sent in order, and only the latest per key."""
+    sent = []
+
+    async def send(key, text):
+        sent.append((key, text))
+
+    outbox = Outbox(send, rate=1000.0)
+    outbox.put(1, "a")
+    outbox.put(2, "b")
+    outbox.put(1, "c")
+    await outbox.task
+    assert sent == [(1, "c"), (2, "b")]
+    assert outbox.counts == {"sent": 2, "replaced": 1}
+
+
+@pytest.mark.asyncio
+async def test_outbox_failure():
+    """Failed sends are reported to the error handler, and don't stop the outbox."""
+    errors = []
+
+    async def send(key, text):
+        if key == 1:
+            raise RuntimeError("blocked")
+
+    async def onerror(event, *args):
+        errors.append((event, args, sys.exc_info()[0]))
+
+    outbox = Outbox(send, rate=1000.0, onerror=onerror)
+    outbox.put(1, "a")
+    outbox.put(2, "b")
+    await outbox.task
+    assert errors == [("send", (1, "a"), RuntimeError)]
+    assert outbox.counts == {"sent": 1, "failed": 1}